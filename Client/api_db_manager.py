@@ -13,14 +13,22 @@ Usage (automatic — controlled by api_config.API_MODE):
     result, err = db.execute_query_with_exception("INSERT ...", params)
 """
 
+import collections
 import logging
 import requests
 import time
+
+import tracing
+from db_transaction import ScriptTransaction, TransactionError
+from row_formats import check_format, from_dicts
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
 log = logging.getLogger("APIDbManager")
 
+_BULK_BODY_BYTES = 512 * 1024   # JSON per /api/bulk request (server cap is 1 MB)
+_BULK_MAX_ROWS = 10000          # server's BulkRequest.rows limit
+
 
 class APIDbManager:
 
@@ -97,6 +105,15 @@ class APIDbManager:
         except Exception:
             return False
 
+    def set_client_identity(self, user: str = None, branch: str = None) -> None:
+        """Tag every request with the logged-in user/branch for the server's
+        per-client cost accounting (X-ORS-User / X-ORS-Branch)."""
+        for header, value in (("X-ORS-User", user), ("X-ORS-Branch", branch)):
+            if value:
+                self._session.headers[header] = str(value)
+            else:
+                self._session.headers.pop(header, None)
+
     def reset_connection(self) -> None:
         """Reset the API connection to ensure fresh DB connection on next query.
 
@@ -118,43 +135,75 @@ class APIDbManager:
             return []
         return list(params)
 
-    def _post_exec(self, endpoint: str, sql: str, params) -> dict:
+    def _post_exec(self, endpoint: str, sql: str, params, page_token: str = None, max_rows: int = None) -> dict:
         """POST to /api/exec or /api/exec_safe and handle token refresh."""
         payload = {"sql": sql, "params": self._normalise_params(params)}
+        if page_token:
+            payload["page_token"] = page_token
+        if max_rows:
+            payload["max_rows"] = max_rows
         resp = None
-        for attempt in range(3):
-            try:
+        with tracing.client_call(endpoint) as headers:
+            for attempt in range(3):
+                try:
+                    resp = self._session.post(
+                        f"{self.base_url}{endpoint}", json=payload, headers=headers,
+                        timeout=(5, self.timeout),
+                    )
+                    break
+                except (requests.Timeout, requests.ConnectionError) as exc:
+                    if attempt >= 2:
+                        raise
+                    wait_s = 0.8 * (attempt + 1)
+                    self.logger.warning("Transient network error, retrying in %.1fs (rid=%s): %s",
+                                        wait_s, headers["X-Request-ID"], exc)
+                    time.sleep(wait_s)
+            if resp is not None and resp.status_code == 401:
+                # Token expired — refresh once and retry
+                self.logger.warning("Token expired, refreshing...")
+                if not self.connect():
+                    raise RuntimeError("API authentication failed during token refresh")
                 resp = self._session.post(
-                    f"{self.base_url}{endpoint}", json=payload, timeout=(5, self.timeout)
+                    f"{self.base_url}{endpoint}", json=payload, headers=headers,
+                    timeout=(5, self.timeout),
                 )
-                break
-            except (requests.Timeout, requests.ConnectionError) as exc:
-                if attempt >= 2:
-                    raise
-                wait_s = 0.8 * (attempt + 1)
-                self.logger.warning("Transient network error, retrying in %.1fs: %s", wait_s, exc)
-                time.sleep(wait_s)
-        if resp is not None and resp.status_code == 401:
-            # Token expired — refresh once and retry
-            self.logger.warning("Token expired, refreshing...")
-            if not self.connect():
-                raise RuntimeError("API authentication failed during token refresh")
-            resp = self._session.post(
-                f"{self.base_url}{endpoint}", json=payload, timeout=(5, self.timeout)
-            )
         if resp is None:
             raise RuntimeError("No response from API server")
         return resp
 
+    def _rest_of_result(self, endpoint: str, sql: str, params, data: dict) -> list:
+        """Rows of a SELECT plus every page behind its ``next_token``.
+
+        The server caps each response (ORS_MAX_ROWS / ORS_MAX_RESULT_BYTES),
+        so a large result arrives as several pages.  Raises RuntimeError if
+        a later page fails, including any non-200 reply (a 429 or 400 has
+        no rows, and must not pass for the last page).
+        """
+        rows = data.get("result")
+        token = data.get("next_token")
+        while token:
+            resp = self._post_exec(endpoint, sql, params, page_token=token)
+            if resp.status_code != 200:
+                raise RuntimeError(f"API server error ({resp.status_code}): {resp.text[:200]}")
+            page = resp.json()
+            error = page.get("error") or page.get("exec_error")
+            if error:
+                raise RuntimeError(error)
+            rows.extend(page.get("result") or [])
+            token = page.get("next_token")
+        return rows
+
     # ── Public interface (mirrors DatabaseManagerPooled) ──────────────────────
 
-    def execute_query(self, sql: str, params=None):
+    def execute_query(self, sql: str, params=None, row_format: str = "dict"):
         """Execute SQL via the API.
 
-        Returns rows (list[dict]) for SELECT statements,
+        Returns rows (list[dict], or the shape named by ``row_format`` —
+        see row_formats.py) for SELECT statements,
         or affected-row count (int) for INSERT/UPDATE/DELETE.
         Raises RuntimeError on server-side SQL errors (same as direct DB manager).
         """
+        check_format(row_format)
         self._ensure_token()
         try:
             resp = self._post_exec("/api/exec", sql, params)
@@ -163,14 +212,14 @@ class APIDbManager:
             data = resp.json()
             if data.get("error"):
                 raise RuntimeError(data["error"])
-            return data.get("result")
+            return from_dicts(self._rest_of_result("/api/exec", sql, params, data), row_format)
         except ValueError:
             raise RuntimeError(f"Unexpected API response (HTTP {resp.status_code})")
         except requests.RequestException as exc:
             self.logger.error("execute_query network error: %s", exc)
             raise
 
-    def execute_query_with_exception(self, sql: str, params=None):
+    def execute_query_with_exception(self, sql: str, params=None, row_format: str = "dict"):
         """Execute SQL via the API.
 
         Returns (result, None) on success or (None, exception) on error.
@@ -179,6 +228,7 @@ class APIDbManager:
         deadlock (1213) and duplicate-key (1062) retry logic in client_dashboard
         continues to work correctly.
         """
+        check_format(row_format)
         self._ensure_token()
         try:
             resp = self._post_exec("/api/exec_safe", sql, params)
@@ -193,7 +243,9 @@ class APIDbManager:
                     # Preserve the MySQL error code as args[0]
                     err.args = (error_code, exec_error)
                 return None, err
-            return data.get("result"), None
+            return from_dicts(self._rest_of_result("/api/exec_safe", sql, params, data), row_format), None
+        except RuntimeError as exc:
+            return None, exc
         except ValueError:
             return None, RuntimeError(f"Unexpected API response (HTTP {resp.status_code})")
         except requests.RequestException as exc:
@@ -202,6 +254,144 @@ class APIDbManager:
             )
             return None, exc
 
+    def iter_query(self, sql: str, params=None, batch_size: int = 1000):
+        """Stream a SELECT page by page (``max_rows=batch_size`` per request).
+
+        Yields namedtuple rows, one page in memory at a time.  Raises
+        RuntimeError on SQL errors and on any non-200 response.
+        """
+        self._ensure_token()
+        row_type, token = None, None
+        while True:
+            resp = self._post_exec("/api/exec_safe", sql, params, page_token=token, max_rows=batch_size)
+            if resp.status_code != 200:
+                # A 4xx (expired page token, quota, blocked SQL) is an error, not the end of the stream
+                raise RuntimeError(f"API server error ({resp.status_code}): {resp.text[:200]}")
+            page = resp.json()
+            if page.get("exec_error"):
+                raise RuntimeError(page["exec_error"])
+            rows = page.get("result") or []
+            if rows and row_type is None:
+                row_type = collections.namedtuple("Row", list(rows[0]), rename=True)
+            for row in rows:
+                yield row_type._make(row.values())
+            token = page.get("next_token")
+            if not token:
+                return
+
+    def post_events(self, heartbeats: list = None, activity: list = None) -> bool:
+        """Hand heartbeat / activity events to the server's group commit
+        (/api/events).  Returns False instead of raising."""
+        self._ensure_token()
+        payload = {"heartbeats": heartbeats or [], "activity": activity or []}
+        try:
+            with tracing.client_call("/api/events") as headers:
+                resp = self._session.post(
+                    f"{self.base_url}/api/events", json=payload, headers=headers,
+                    timeout=(5, self.timeout),
+                )
+                if resp.status_code == 401:
+                    if not self.connect():
+                        return False
+                    resp = self._session.post(
+                        f"{self.base_url}/api/events", json=payload, headers=headers,
+                        timeout=(5, self.timeout),
+                    )
+            return resp.status_code == 200
+        except requests.RequestException as exc:
+            self.logger.warning("post_events network error: %s", exc)
+            return False
+
+    def _post_json(self, endpoint: str, payload: dict):
+        """POST a prepared body, refreshing the token once on 401."""
+        with tracing.client_call(endpoint) as headers:
+            resp = self._session.post(
+                f"{self.base_url}{endpoint}", json=payload, headers=headers,
+                timeout=(5, max(self.timeout, 60)),
+            )
+            if resp.status_code == 401:
+                if not self.connect():
+                    raise RuntimeError("API authentication failed during token refresh")
+                resp = self._session.post(
+                    f"{self.base_url}{endpoint}", json=payload, headers=headers,
+                    timeout=(5, max(self.timeout, 60)),
+                )
+        return resp
+
+    @staticmethod
+    def _body_chunks(params_list, max_bytes: int = _BULK_BODY_BYTES, max_rows: int = _BULK_MAX_ROWS):
+        """Yield (start index, rows) runs of roughly ``max_bytes`` of JSON each."""
+        start, size = 0, 0
+        for i, params in enumerate(params_list):
+            row_size = 4 + sum(len(str(v)) + 4 for v in params)
+            if i > start and (size + row_size > max_bytes or i - start >= max_rows):
+                yield start, params_list[start:i]
+                start, size = i, 0
+            size += row_size
+        if start < len(params_list):
+            yield start, params_list[start:]
+
+    def execute_many(self, sql: str, params_list) -> "int | None":
+        """Run one write for many rows through /api/bulk.
+
+        Rows are sent in requests of about 512 KB of JSON, so a 600-row save
+        is one or two round trips.  Falls back to /api/batch (100 statements
+        per request) on servers without /api/bulk.  Returns the total
+        affected rows, or None if any chunk failed (logged); chunks that
+        succeeded stay committed.
+        """
+        self._ensure_token()
+        total, errors = 0, []
+        bulk = True
+        for start, rows in self._body_chunks(params_list):
+            label = f"rows {start}-{start + len(rows) - 1}"
+            try:
+                if bulk:
+                    resp = self._post_json("/api/bulk", {"sql": sql, "rows": [list(p) for p in rows]})
+                    if resp.status_code == 200:
+                        data = resp.json()
+                        total += data.get("result") or 0
+                        errors.extend(f"{label}: {e['error']}" for e in data.get("errors", []))
+                        continue
+                    if resp.status_code != 404:
+                        errors.append(f"{label}: HTTP {resp.status_code} {resp.text[:200]}")
+                        continue
+                    bulk = False   # older server without /api/bulk
+                for i in range(0, len(rows), 100):
+                    queries = [{"sql": sql, "params": list(p)} for p in rows[i:i + 100]]
+                    resp = self._post_json("/api/batch", {"queries": queries})
+                    if resp.status_code != 200:
+                        errors.append(f"{label}: HTTP {resp.status_code} {resp.text[:200]}")
+                        continue
+                    for entry in resp.json().get("results", []):
+                        if entry.get("error"):
+                            errors.append(f"{label}: {entry['error']}")
+                        elif isinstance(entry.get("result"), int):
+                            total += entry["result"]
+            except (RuntimeError, ValueError, requests.RequestException) as exc:
+                errors.append(f"{label}: {exc}")
+        for e in errors:
+            self.logger.error("execute_many error: %s", e)
+        return None if errors else total
+
+    def transaction(self) -> ScriptTransaction:
+        """Queue writes and commit them together through /api/transaction.
+
+        SELECTs inside the block run immediately; see db_transaction.py.
+        """
+        def send(statements):
+            self._ensure_token()
+            try:
+                resp = self._post_json("/api/transaction", {"statements": statements})
+            except requests.RequestException as exc:
+                raise TransactionError(str(exc))
+            if resp.status_code == 404:
+                return None
+            if resp.status_code != 200:
+                raise TransactionError(f"HTTP {resp.status_code}: {resp.text[:200]}")
+            return resp.json()
+        return ScriptTransaction(self.execute_query_with_exception, send, self.execute_query_with_exception)
+
     def execute_batch(self, queries: list) -> list:
         """Execute multiple SQL statements in a single HTTP round-trip.
 
@@ -223,21 +413,33 @@ class APIDbManager:
             for q in queries
         ]
         try:
-            resp = self._session.post(
-                f"{self.base_url}/api/batch",
-                json={"queries": payload_queries},
-                timeout=(5, self.timeout),
-            )
-            if resp.status_code == 401:
-                self.logger.warning("Token expired, refreshing...")
-                if not self.connect():
-                    return [{"result": None, "error": "API authentication failed", "cached": False} for _ in queries]
+            with tracing.client_call("/api/batch") as headers:
                 resp = self._session.post(
                     f"{self.base_url}/api/batch",
                     json={"queries": payload_queries},
+                    headers=headers,
                     timeout=(5, self.timeout),
                 )
-            return resp.json().get("results", [])
+                if resp.status_code == 401:
+                    self.logger.warning("Token expired, refreshing...")
+                    if not self.connect():
+                        return [{"result": None, "error": "API authentication failed", "cached": False} for _ in queries]
+                    resp = self._session.post(
+                        f"{self.base_url}/api/batch",
+                        json={"queries": payload_queries},
+                        headers=headers,
+                        timeout=(5, self.timeout),
+                    )
+            results = resp.json().get("results", [])
         except requests.RequestException as exc:
             self.logger.error("execute_batch network error: %s", exc)
             return [{"result": None, "error": str(exc), "cached": False} for _ in queries]
+        # Large SELECTs come back capped with a next_token; fetch the rest
+        for q, entry in zip(queries, results):
+            if entry.get("next_token"):
+                try:
+                    entry["result"] = self._rest_of_result("/api/exec_safe", q["sql"], q.get("params"), entry)
+                except (RuntimeError, ValueError, requests.RequestException) as exc:
+                    entry["result"], entry["error"] = None, str(exc)
+                entry.pop("next_token", None)
+        return results
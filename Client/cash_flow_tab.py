@@ -12,6 +12,7 @@ from PyQt5.QtCore import Qt
 from PyQt5.QtWidgets import QApplication      # remove if unused
 from PyQt5.QtWidgets import QAbstractItemView
 from Client.ui_scaling import _sz
+from cache_invalidation import register_invalidation, cache_ttl
 
 
 class PopupCombo(QComboBox):
@@ -65,7 +66,7 @@ def _load_field_config(db_manager=None) -> dict:
     
 
     current_time = time.time()
-    if _field_config_cache and (current_time - _field_config_cache_time) < _CACHE_TTL:
+    if _field_config_cache and (current_time - _field_config_cache_time) < cache_ttl(_CACHE_TTL):
         return _field_config_cache
     
 
@@ -99,6 +100,9 @@ def refresh_field_config_cache():
     _field_config_cache_time = 0
 
 
+register_invalidation(lambda _event: refresh_field_config_cache(), tables=("field_config",))
+
+
 def _sanitize_column(name: str) -> str:
     col = re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_")
     return col
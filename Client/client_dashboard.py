@@ -141,6 +141,9 @@ def _micro_label(text, color=_TEXT_MUTED):
 
 
 from connection_watcher import ConnectionBanner
+from cache_invalidation import start_invalidation_listener
+from schema_catalog import schema_catalog
+import tracing
 import math
 
 
@@ -830,6 +833,10 @@ class ClientDashboard(QWidget):
         self.db_manager  = db_manager
         self.offline_mode = offline_mode
         self._update_checker_threads = []
+
+        # Server pushes table/schema invalidations so lookup caches can live longer
+        if not offline_mode:
+            start_invalidation_listener()
         
         # Zoom functionality
         self.zoom_level = 100
@@ -2281,40 +2288,8 @@ class ClientDashboard(QWidget):
             return None, None
 
 
-    _table_columns_cache = {}  
-    _table_columns_cache_time = 0
-
     def _get_table_columns(self, table_name):
-  
-        import time as _time
-        now = _time.time()
-        if (table_name in self._table_columns_cache
-                and (now - self._table_columns_cache_time) < 300):
-            return self._table_columns_cache[table_name]
-        try:
-            result = self.db_manager.execute_query(
-                "SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS "
-                "WHERE TABLE_NAME = %s AND TABLE_SCHEMA = DATABASE()",
-                (table_name,)
-            )
-            if result:
-                cols = set()
-                for row in result:
-                    if isinstance(row, dict):
-                        c = row.get('COLUMN_NAME') or row.get('column_name') or ''
-                    elif isinstance(row, (list, tuple)) and row:
-                        c = row[0]
-                    else:
-                        c = ''
-                    if c:
-                        cols.add(c)
-                if cols:
-                    self._table_columns_cache[table_name] = cols
-                    self._table_columns_cache_time = now
-                    return cols
-        except Exception as e:
-            logger.error("_get_table_columns(%s): %s", table_name, e)
-        return self._table_columns_cache.get(table_name, set())
+        return schema_catalog.columns(table_name, db=self.db_manager)
 
     def _filter_vals_for_table(self, all_vals, table_name):
         """Remove keys from all_vals that are not columns in the table."""
@@ -3440,55 +3415,71 @@ class ClientDashboard(QWidget):
             return
 
         next_date = current + datetime.timedelta(days=1)
-        while True:
-            next_date_str = next_date.strftime("%Y-%m-%d")
-            query = (
-                f"SELECT beginning_balance, debit_total, credit_total, cash_count, ending_balance, is_locked "
-                f"FROM {table_name} WHERE date = %s AND branch = %s AND corporation = %s LIMIT 1"
-            )
-            result = self.db_manager.execute_query(query, (next_date_str, self.branch, self.corporation))
-            if not result:
-                break
+        # One transaction for the whole chain: the following days are
+        # updated together or not at all
+        try:
+            with self.db_manager.transaction() as tx:
+                while True:
+                    next_date_str = next_date.strftime("%Y-%m-%d")
+                    query = (
+                        f"SELECT beginning_balance, debit_total, credit_total, cash_count, ending_balance, is_locked "
+                        f"FROM {table_name} WHERE date = %s AND branch = %s AND corporation = %s LIMIT 1"
+                    )
+                    result = self.db_manager.execute_query(query, (next_date_str, self.branch, self.corporation))
+                    if not result:
+                        break
 
-            row = result[0]
-            if row.get("is_locked", 1):
-                break
+                    row = result[0]
+                    if row.get("is_locked", 1):
+                        break
 
-            old_begin = float(row.get("beginning_balance", 0) or 0)
-            if abs(old_begin - ending_balance) < 0.01:
-                ending_balance = float(row.get("ending_balance", 0) or 0)
-                next_date += datetime.timedelta(days=1)
-                continue
+                    old_begin = float(row.get("beginning_balance", 0) or 0)
+                    if abs(old_begin - ending_balance) < 0.01:
+                        ending_balance = float(row.get("ending_balance", 0) or 0)
+                        next_date += datetime.timedelta(days=1)
+                        continue
 
-            debit_total = float(row.get("debit_total", 0) or 0)
-            credit_total = float(row.get("credit_total", 0) or 0)
-            cash_count = float(row.get("cash_count", 0) or 0)
-
-            debit_amount = debit_total - old_begin
-            new_debit_total = ending_balance + debit_amount
-            new_ending = ending_balance + debit_amount - credit_total
-            new_cash_result = cash_count - new_ending
-            variance_status = (
-                "balanced" if abs(new_cash_result) < 0.01
-                else "over" if new_cash_result > 0
-                else "short"
-            )
+                    debit_total = float(row.get("debit_total", 0) or 0)
+                    credit_total = float(row.get("credit_total", 0) or 0)
+                    cash_count = float(row.get("cash_count", 0) or 0)
+
+                    debit_amount = debit_total - old_begin
+                    new_debit_total = ending_balance + debit_amount
+                    new_ending = ending_balance + debit_amount - credit_total
+                    new_cash_result = cash_count - new_ending
+                    variance_status = (
+                        "balanced" if abs(new_cash_result) < 0.01
+                        else "over" if new_cash_result > 0
+                        else "short"
+                    )
 
-            update_query = (
-                f"UPDATE {table_name} SET beginning_balance = %s, debit_total = %s, "
-                f"ending_balance = %s, cash_result = %s, variance_status = %s "
-                f"WHERE date = %s AND branch = %s AND corporation = %s"
-            )
-            self.db_manager.execute_query(
-                update_query,
-                (ending_balance, new_debit_total, new_ending, new_cash_result,
-                 variance_status, next_date_str, self.branch, self.corporation)
-            )
+                    update_query = (
+                        f"UPDATE {table_name} SET beginning_balance = %s, debit_total = %s, "
+                        f"ending_balance = %s, cash_result = %s, variance_status = %s "
+                        f"WHERE date = %s AND branch = %s AND corporation = %s"
+                    )
+                    tx.execute(
+                        update_query,
+                        (ending_balance, new_debit_total, new_ending, new_cash_result,
+                         variance_status, next_date_str, self.branch, self.corporation)
+                    )
 
-            ending_balance = new_ending
-            next_date += datetime.timedelta(days=1)
+                    ending_balance = new_ending
+                    next_date += datetime.timedelta(days=1)
+        except Exception as e:
+            logger.error("Opening balance propagation rolled back: %s", e)
 
     def handle_post(self):
+        # Every API call and SQL statement made while posting carries this
+        # trace's request ID, so a slow Post can be followed into the server
+        # access log, the trace export and the MySQL slow log.
+        with tracing.trace("client.post_report", branch=self.branch, corporation=self.corporation) as t:
+            logger.info("Posting report (rid=%s)", t.request_id)
+            self._handle_post()
+        if t.root.duration_ms >= tracing.CLIENT_SLOW_MS:
+            logger.warning("Slow post: %.0f ms (rid=%s) %s", t.root.duration_ms, t.request_id, t.breakdown())
+
+    def _handle_post(self):
         if not self._is_connected:
             return  # Post button is already disabled offline — safety guard
         try:
@@ -6378,4 +6369,4 @@ class ClientDashboard(QWidget):
         return self.check_existing_entry(selected_date, "Brand A")
 
     def _sync_palawan_mc_to_other_brand(self, date, palawan_data, mc_data):
-        pass 
\ No newline at end of file
+        pass 
@@ -36,6 +36,8 @@ from ft_ho_page import FTHOPage
 from depo_br_page import DepoBRPage
 from review_summary_page import ReviewSummaryPage
 from connection_watcher import ConnectionWatcher, ConnectionBanner
+from cache_invalidation import start_invalidation_listener
+from schema_catalog import schema_catalog
 
 
 try:
@@ -78,6 +80,9 @@ class AdminDashboard(QWidget):
         self._conn_watcher.connection_restored.connect(self._on_connection_restored)
         self._conn_watcher.start()
 
+        # Server pushes table/schema invalidations so lookup caches can live longer
+        start_invalidation_listener()
+
         self.debit_inputs = {}
         self.credit_inputs = {}
         self.debit_lotes_inputs = {}
@@ -312,19 +317,19 @@ class AdminDashboard(QWidget):
             ("payable_tbl_brand_a",   "payout_lotes",                  "INT DEFAULT 0"),
             ("payable_tbl_brand_a",   "international_lotes",           "INT DEFAULT 0"),
         ]
+        altered = False
         for table, col, typedef in _migrations:
             try:
-                exists = self.db.execute_query(
-                    "SELECT COUNT(*) as cnt FROM information_schema.COLUMNS "
-                    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s",
-                    (table, col)
-                )
-                if not exists or exists[0].get('cnt', 0) == 0:
+                cols = schema_catalog.columns(table, db=self.db)
+                if cols and col not in cols:   # empty: table unknown or catalog unavailable
                     self.db.execute_query(
                         f"ALTER TABLE {table} ADD COLUMN {col} {typedef}"
                     )
+                    altered = True
             except Exception:
                 pass  # Safe to ignore
+        if altered:
+            schema_catalog.invalidate()
 
     def _load_field_config(self):
 
@@ -2790,16 +2795,13 @@ class AdminDashboard(QWidget):
 
             for table in main_tables:
                 try:
-                    col_check = self.db.execute_query(
-                        "SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS "
-                        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = 'is_locked'",
-                        [table]
-                    )
-                    if not col_check:
+                    cols = schema_catalog.columns(table, db=self.db)
+                    if cols and 'is_locked' not in cols:
                         self.db.execute_query(
                             f"ALTER TABLE {table} ADD COLUMN is_locked TINYINT(1) NOT NULL DEFAULT 1",
                             []
                         )
+                        schema_catalog.invalidate()
                 except Exception:
                     pass
 
@@ -3302,20 +3304,8 @@ class AdminDashboard(QWidget):
                     ws.cell(row=r, column=1).fill = INFO_FILL
                     ws.cell(row=r, column=2).fill = INFO_FILL
 
-            _table_cols_cache = {}
-
             def _get_table_cols(tbl):
-                if tbl not in _table_cols_cache:
-                    try:
-                        rows = db_manager.execute_query(
-                            "SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS "
-                            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
-                            (tbl,)
-                        )
-                        _table_cols_cache[tbl] = {r['COLUMN_NAME'] for r in rows} if rows else set()
-                    except Exception:
-                        _table_cols_cache[tbl] = set()
-                return _table_cols_cache[tbl]
+                return schema_catalog.columns(tbl, db=db_manager)
 
             def _write_grouped_sheet(ws, col_groups, table, use_branch_join=False, category_filter=None, show_lotes_total=False, show_amt_total=True):
                 _write_info(ws)
@@ -3605,6 +3595,8 @@ class AdminDashboard(QWidget):
                     logger.debug(f"  Reg Filter: {reg_filter} | Category: {category_filter} | Use Branch Join: {use_branch_join}")
                     logger.debug(f"Query: {sql[:400]}...")
                     logger.debug(f"Params: {sql_params}")
+                    # Read whole rather than through iter_query: GROUP BY branch gives
+                    # one row per branch, and the sheet needs the row count up front
                     results = db_manager.execute_query(sql, sql_params) or []
                     logger.debug(f"Results: {len(results)} rows returned for {ws.title}")
 
@@ -3794,17 +3786,6 @@ class AdminDashboard(QWidget):
                     ws.column_dimensions[get_column_letter(total_col)].width = 14
                 ws.freeze_panes = f'B{HDR_ROW + 1}'
 
-            # ── Check existing columns in daily_table ────────────────────────
-            try:
-                col_rows = db_manager.execute_query(
-                    "SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS "
-                    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
-                    (self.daily_table,)
-                )
-                existing_cols = {r['COLUMN_NAME'] for r in col_rows} if col_rows else set()
-            except Exception:
-                existing_cols = set()
-
             # ── Workbook ─────────────────────────────────────────────────────
             wb = Workbook()
 
@@ -2,9 +2,14 @@
 import os
 import json
 import time
+import zlib
+import asyncio
 import uuid
 import queue
+import decimal
+import struct
 import hashlib
+import functools
 import datetime
 import collections
 import threading
@@ -19,18 +24,32 @@ except ImportError:
     pass  # python-dotenv not installed — env vars must be set manually
 
 # Setup centralized logging FIRST
-from logging_config import setup_logging, get_logger
-setup_logging("api_server", os.environ.get("ORS_LOG_LEVEL", "INFO"))
+from logging_config import setup_logging, get_logger, get_sampled_logger, get_logging_stats, LOG_DIR
+setup_logging(
+    "api_server",
+    os.environ.get("ORS_LOG_LEVEL", "INFO"),
+    # Writer thread does console/file I/O so request threads never block on it
+    queued=os.environ.get("ORS_LOG_QUEUE", "true").lower() == "true",
+)
 
 from fastapi import FastAPI, Depends, HTTPException, Request
 from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import RequestValidationError
 from pydantic import BaseModel
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.concurrency import run_in_threadpool
 import jwt as pyjwt
 
-from db_connect_pooled import DatabaseManagerPooled
+from db_connect_pooled import DatabaseManagerPooled, mysql_error_code
+from db_transaction import TransactionError
 from error_tracker import error_tracker, audit_logger, log_exception, log_audit
+from sql_classifier import classify, SCHEMA_STATEMENTS, cache_stats as sql_classifier_stats
+from client_accounting import client_accounting, client_key, ClientKey
+from result_pages import ResultPager, PageTokenError, ResultTooLarge
+from cache_policy import cache_policy
+from event_coalescer import EventCoalescer
+import tracing
+from tracing import traced
 
 
 API_KEY    = os.environ.get("ORS_API_KEY",    "")
@@ -41,14 +60,25 @@ JWT_HOURS  = int(os.environ.get("ORS_JWT_HOURS", 12))
 CACHE_TTL   = int(os.environ.get("ORS_CACHE_TTL",  30))    # seconds; 0 = disabled
 CACHE_MAX   = int(os.environ.get("ORS_CACHE_MAX",  2000))   # in-memory fallback max entries
 REDIS_URL   = os.environ.get("ORS_REDIS_URL",  "redis://127.0.0.1:6379/0")
+CACHE_COMPRESS_MIN = int(os.environ.get("ORS_CACHE_COMPRESS_MIN", "8192"))      # bytes; smaller stays plain JSON
+CACHE_MAX_ENTRY    = int(os.environ.get("ORS_CACHE_MAX_ENTRY", str(4 * 1024 * 1024)))  # larger results aren't cached
 
 # ── Logging ───────────────────────────────────────────────────────────────────
 log = get_logger("api_server")
+access_log = get_sampled_logger("api_server.access")   # per-request lines, sampled at high QPS
+# OTLP/JSON traces: a sample of requests plus every slow or failed one
+tracing.configure_export(
+    os.environ.get("ORS_TRACE_FILE", str(LOG_DIR / "api_traces.otlp.jsonl")), service_name="ors-api"
+)
 
 # ── Shared DB pool ────────────────────────────────────────────────────────────
-# One shared pool per Gunicorn worker — idle monitor disabled on the server.
+# One shared pool per worker process (see run_api_server.py) — idle monitor
+# disabled on the server.
 _db = DatabaseManagerPooled(idle_timeout=0)
 _db.connect()   # connect immediately on worker startup
+# SELECTs are capped per request (ORS_MAX_ROWS / ORS_MAX_RESULT_BYTES) and
+# continued with signed page tokens
+_pager = ResultPager(_db, SECRET_KEY)
 
 
 _redis = None
@@ -64,40 +94,50 @@ if CACHE_TTL > 0:
     except Exception as _re:
         log.warning(f"Redis unavailable ({_re}) — using in-memory fallback cache")
 
+try:
+    import zstandard as _zstd
+except ImportError:
+    _zstd = None   # zlib only
+
 # In-memory fallback
 _cache_lock   = threading.Lock()
-_cache: dict  = {}          # key -> (expires_at, result)
+_cache: dict  = {}          # key -> (expires_at, encoded value)
 _cache_hits   = 0
 _cache_misses = 0
+# Bytes written to the cache, before and after compression (under _cache_lock)
+_cache_bytes  = {"entries": 0, "raw": 0, "stored": 0, "compressed": 0, "too_large": 0}
+
+# Stored values are plain JSON, or a marker byte and the compressed JSON.
+# JSON never starts with these bytes, so plain entries written before
+# compression existed still decode.
+_MARK_ZLIB = b"\x01"
+_MARK_ZSTD = b"\x02"
+# Stale-while-revalidate entries wrap the value: marker, fresh-until (unix
+# time, 8-byte double), then the value.  They live ttl + swr seconds; a hit
+# after fresh-until is served and refreshed in the background.
+_MARK_SWR  = b"\x03"
+
+# TTL / SWR / size / do-not-cache per table or fingerprint (cache_policy.json)
+cache_policy.load()
+_swr_lock       = threading.Lock()
+_swr_refreshing: set = set()
+_swr_stats      = {"stale_hits": 0, "refreshes": 0, "refresh_errors": 0}
+_swr_executor   = ThreadPoolExecutor(max_workers=2, thread_name_prefix="ors-swr")
 
 
 def _is_select(sql: str) -> bool:
-    return sql.strip().upper().startswith("SELECT")
+    return classify(sql).is_select
 
 
-def _extract_table_name(sql: str) -> Optional[str]:
-    """Extract table name from SQL query (basic extraction)."""
-    sql_upper = sql.strip().upper()
+def _fetch_select(sql: str, params, page_token: Optional[str] = None,
+                  max_rows: Optional[int] = None) -> Tuple[Any, Optional[str], Optional[Exception]]:
+    """One capped page of a SELECT as ``(rows, next_token, error)``."""
     try:
-        if "INSERT INTO" in sql_upper:
-            start = sql_upper.find("INSERT INTO") + len("INSERT INTO")
-            table = sql[start:].strip().split()[0].split("(")[0].strip("`\"")
-            return table
-        elif "UPDATE" in sql_upper:
-            start = sql_upper.find("UPDATE") + len("UPDATE")
-            table = sql[start:].strip().split()[0].strip("`\"")
-            return table
-        elif "DELETE FROM" in sql_upper:
-            start = sql_upper.find("DELETE FROM") + len("DELETE FROM")
-            table = sql[start:].strip().split()[0].strip("`\"")
-            return table
-        elif "SELECT" in sql_upper:
-            start = sql_upper.find("FROM") + len("FROM")
-            table = sql[start:].strip().split()[0].strip("`\"")
-            return table
-    except Exception:
-        pass
-    return "unknown"
+        rows, next_token = _pager.fetch(sql, params, page_token, max_rows)
+        return rows, next_token, None
+    except Exception as e:
+        log.error(f"Query failed: {e} | SQL: {sql[:120]}")
+        return None, None, e
 
 
 def _make_cache_key(sql: str, params) -> str:
@@ -105,15 +145,116 @@ def _make_cache_key(sql: str, params) -> str:
     return "ors:" + hashlib.sha256(raw.encode()).hexdigest()
 
 
-def _cache_get(key: str) -> Tuple[bool, Any]:
+def _cache_settings(sql: str, client_ttl: Optional[int]) -> Optional[Tuple[Optional[int], int, Optional[int]]]:
+    """``(ttl, swr, max_bytes)`` for caching a SELECT, or None if the policy says not to.
+
+    A TTL sent by the client wins over the policy's TTL and SWR.
+    """
+    rule = cache_policy.resolve(sql)
+    if rule.no_cache:
+        return None
+    if client_ttl is not None:
+        return client_ttl, 0, rule.max_bytes
+    return rule.ttl, rule.swr, rule.max_bytes
+
+
+def _swr_refresher(key: str, sql: str, params, settings) -> Optional[functools.partial]:
+    """Background refresh for a stale-while-revalidate entry, if it has an SWR window."""
+    if not settings or not settings[1]:
+        return None
+    return functools.partial(_refresh_cached, key, sql, params, settings)
+
+
+def _refresh_cached(key: str, sql: str, params, settings) -> None:
+    rows, next_token, err = _fetch_select(sql, params)
+    if err is not None:
+        raise err
+    if next_token is None:
+        ttl, swr, max_bytes = settings
+        _cache_set(key, rows, ttl=ttl, swr=swr, max_bytes=max_bytes)
+
+
+def _schedule_swr_refresh(key: str, refresh) -> None:
+    """Run ``refresh`` on the SWR pool unless one is already running for ``key``."""
+    with _swr_lock:
+        _swr_stats["stale_hits"] += 1
+        if key in _swr_refreshing:
+            return
+        _swr_refreshing.add(key)
+        _swr_stats["refreshes"] += 1
+
+    def run():
+        try:
+            refresh()
+        except Exception as e:
+            with _swr_lock:
+                _swr_stats["refresh_errors"] += 1
+            log.warning(f"Stale cache refresh failed: {e}")
+        finally:
+            with _swr_lock:
+                _swr_refreshing.discard(key)
+
+    _swr_executor.submit(run)
+
+
+def _cache_value(key: str, data: bytes, refresh=None) -> Any:
+    """Decode a stored value; a stale SWR entry also triggers ``refresh``."""
+    if data[:1] == _MARK_SWR:
+        fresh_until, = struct.unpack(">d", data[1:9])
+        data = data[9:]
+        if refresh is not None and time.time() > fresh_until:
+            _schedule_swr_refresh(key, refresh)
+    return _decode_cached(data)
+
+
+def _encode_cached(result: Any, max_bytes: Optional[int] = None) -> Optional[bytes]:
+    """Cache value for ``result``: JSON, compressed from CACHE_COMPRESS_MIN
+    bytes up; None when it is over CACHE_MAX_ENTRY (or ``max_bytes``) and
+    shouldn't be cached."""
+    raw = json.dumps(result, default=str).encode()
+    if len(raw) > (CACHE_MAX_ENTRY if max_bytes is None else min(max_bytes, CACHE_MAX_ENTRY)):
+        with _cache_lock:
+            _cache_bytes["too_large"] += 1
+        return None
+    data = raw
+    if len(raw) >= CACHE_COMPRESS_MIN:
+        if _zstd is not None:
+            packed = _MARK_ZSTD + _zstd.ZstdCompressor(level=3).compress(raw)
+        else:
+            packed = _MARK_ZLIB + zlib.compress(raw, 3)
+        if len(packed) < len(raw):
+            data = packed
+    with _cache_lock:
+        _cache_bytes["entries"] += 1
+        _cache_bytes["raw"] += len(raw)
+        _cache_bytes["stored"] += len(data)
+        _cache_bytes["compressed"] += data is not raw
+    return data
+
+
+def _decode_cached(data: bytes) -> Any:
+    marker = data[:1]
+    if marker == _MARK_ZLIB:
+        data = zlib.decompress(data[1:])
+    elif marker == _MARK_ZSTD:
+        if _zstd is None:
+            raise ValueError("zstd-compressed cache entry but zstandard is not installed")
+        data = _zstd.ZstdDecompressor().decompress(data[1:])
+    return json.loads(data)
+
+
+@traced("cache.get")
+def _cache_get(key: str, refresh=None) -> Tuple[bool, Any]:
+    """Look up ``key``; ``refresh`` re-caches it if the hit is SWR-stale."""
     global _cache_hits, _cache_misses
     # ── Redis path ────────────────────────────────────────────────────────────
     if _redis_ok and _redis is not None:
         try:
             raw = _redis.get(key)
             if raw is not None:
+                value = _cache_value(key, raw, refresh)
                 _cache_hits += 1
-                return True, json.loads(raw)
+                return True, value
             _cache_misses += 1
             return False, None
         except Exception:
@@ -123,32 +264,114 @@ def _cache_get(key: str) -> Tuple[bool, Any]:
         entry = _cache.get(key)
         if entry and entry[0] > time.monotonic():
             _cache_hits += 1
-            return True, entry[1]
-        if entry:
-            del _cache[key]
-        _cache_misses += 1
-        return False, None
+            data = entry[1]
+        else:
+            if entry:
+                del _cache[key]
+            _cache_misses += 1
+            return False, None
+    return True, _cache_value(key, data, refresh)
 
 
-def _cache_set(key: str, result: Any, ttl: int = None) -> None:
+def _cache_set(key: str, result: Any, ttl: int = None, swr: int = 0, max_bytes: Optional[int] = None) -> None:
     effective_ttl = ttl if ttl is not None else CACHE_TTL
     if effective_ttl <= 0:
         return
+    data = _encode_cached(result, max_bytes)
+    if data is None:
+        return
+    if swr > 0:
+        data = _MARK_SWR + struct.pack(">d", time.time() + effective_ttl) + data
+        effective_ttl += swr
     # ── Redis path ────────────────────────────────────────────────────────────
     if _redis_ok and _redis is not None:
         try:
-            _redis.setex(key, effective_ttl, json.dumps(result, default=str))
+            _redis.setex(key, effective_ttl, data)
             return
         except Exception:
             pass  # Redis error — fall through to in-memory
     # ── In-memory fallback ───────────────────────────────────────────────────
     with _cache_lock:
-        if len(_cache) >= CACHE_MAX:
-            now = time.monotonic()
-            expired = [k for k, (exp, _) in _cache.items() if exp <= now]
-            for k in expired:
-                del _cache[k]
-        _cache[key] = (time.monotonic() + effective_ttl, result)
+        _memory_store(key, data, effective_ttl)
+
+
+def _memory_store(key: str, data: bytes, ttl: int) -> None:
+    """Caller holds _cache_lock."""
+    now = time.monotonic()
+    if len(_cache) >= CACHE_MAX:
+        expired = [k for k, (exp, _) in _cache.items() if exp <= now]
+        for k in expired:
+            del _cache[k]
+    _cache[key] = (now + ttl, data)
+
+
+@traced("cache.mget")
+def _cache_get_many(keys: List[str], refreshes: Optional[list] = None) -> List[Tuple[bool, Any]]:
+    """``_cache_get`` for several keys in one Redis MGET round trip."""
+    global _cache_hits, _cache_misses
+    if not keys:
+        return []
+    refreshes = refreshes or [None] * len(keys)
+    # ── Redis path ────────────────────────────────────────────────────────────
+    if _redis_ok and _redis is not None:
+        try:
+            raws = _redis.mget(keys)
+            found = [(True, _cache_value(key, raw, refresh)) if raw is not None else (False, None)
+                     for key, raw, refresh in zip(keys, raws, refreshes)]
+            hits = sum(1 for hit, _ in found if hit)
+            _cache_hits += hits
+            _cache_misses += len(found) - hits
+            return found
+        except Exception:
+            pass  # Redis error — fall through to in-memory
+    # ── In-memory fallback ───────────────────────────────────────────────────
+    stored = []
+    now = time.monotonic()
+    with _cache_lock:
+        for key in keys:
+            entry = _cache.get(key)
+            if entry and entry[0] > now:
+                _cache_hits += 1
+                stored.append(entry[1])
+                continue
+            if entry:
+                del _cache[key]
+            _cache_misses += 1
+            stored.append(None)
+    return [(True, _cache_value(key, data, refresh)) if data is not None else (False, None)
+            for key, data, refresh in zip(keys, stored, refreshes)]
+
+
+@traced("cache.mset")
+def _cache_set_many(entries: List[tuple]) -> None:
+    """``_cache_set`` for several ``(key, result, ttl, swr, max_bytes)``
+    entries in one pipelined round of SETEX."""
+    encoded = []
+    for key, result, ttl, swr, max_bytes in entries:
+        ttl = CACHE_TTL if ttl is None else ttl
+        if ttl > 0:
+            data = _encode_cached(result, max_bytes)
+            if data is not None:
+                if swr > 0:
+                    data = _MARK_SWR + struct.pack(">d", time.time() + ttl) + data
+                    ttl += swr
+                encoded.append((key, data, ttl))
+    if not encoded:
+        return
+    # ── Redis path ────────────────────────────────────────────────────────────
+    if _redis_ok and _redis is not None:
+        try:
+            pipe = _redis.pipeline(transaction=False)
+            for key, data, ttl in encoded:
+                pipe.setex(key, ttl, data)
+            pipe.execute()
+            return
+        except Exception:
+            pass  # Redis error — fall through to in-memory
+    # ── In-memory fallback ───────────────────────────────────────────────────
+    with _cache_lock:
+        for key, data, ttl in encoded:
+            _memory_store(key, data, ttl)
 
 
 def _cache_clear_all() -> None:
@@ -161,7 +384,123 @@ def _cache_clear_all() -> None:
             pass
     with _cache_lock:
         _cache.clear()
+    if _WARMUP_REFILL_SECS > 0 and _claim_write_refill():
+        _schedule_warmup_refill("write", _WARMUP_REFILL_SECS)
+
+
+# ── Invalidation events ───────────────────────────────────────────────────────
+# Every successful write publishes {"ns": "table"|"schema"|"all", "tables": [...]}
+# so desktop clients can hold lookups for hours and drop them the moment the
+# underlying table (or its columns) change.  With Redis the sequence number
+# and fan-out are shared by all workers; otherwise each worker has its own
+# sequence, and the epoch tells clients when they have switched streams.
+_INVAL_CHANNEL   = "ors:invalidate"
+_INVAL_SEQ_KEY   = "ors-inval:seq"     # outside "ors:*", which cache clears delete
+_INVAL_EPOCH_KEY = "ors-inval:epoch"
+_INVAL_KEEP      = int(os.environ.get("ORS_INVAL_KEEP", "2000"))     # events retained for catch-up
+_INVAL_MAX_WAIT  = int(os.environ.get("ORS_INVAL_MAX_WAIT", "25"))   # long-poll cap (s)
+
+_inval_lock   = threading.Lock()
+_inval_events = collections.deque(maxlen=_INVAL_KEEP)
+_inval_seq    = 0
+_inval_floor  = 0       # events at or below this seq are unknown to this worker
+_inval_epoch  = uuid.uuid4().hex[:12]
+_inval_shared = False   # True once the Redis subscriber is running
+_inval_loop:   Optional[asyncio.AbstractEventLoop] = None   # set by the first long-poll
+_inval_wakeup: Optional[asyncio.Event] = None
+
+
+def _inval_notify() -> None:
+    """Wake every waiting long-poll (runs on the event loop)."""
+    global _inval_wakeup
+    if _inval_wakeup is not None:
+        _inval_wakeup.set()
+        _inval_wakeup = asyncio.Event()
+
+
+def _inval_append_locked(event: dict) -> None:
+    global _inval_seq, _inval_floor
+    if len(_inval_events) == _inval_events.maxlen:
+        _inval_floor = max(_inval_floor, _inval_events[0]["seq"])
+    _inval_events.append(event)
+    _inval_seq = max(_inval_seq, event["seq"])
+    if _inval_loop is not None:
+        try:
+            _inval_loop.call_soon_threadsafe(_inval_notify)
+        except RuntimeError:
+            pass   # loop closed during shutdown
+
 
+def _inval_append(event: dict) -> None:
+    with _inval_lock:
+        _inval_append_locked(event)
+
+
+def _publish_invalidation(ns: str, tables: List[str]) -> None:
+    event = {"ns": ns, "tables": tables, "ts": time.time(), "pid": os.getpid()}
+    if _inval_shared:
+        try:
+            event["seq"] = _redis.incr(_INVAL_SEQ_KEY)
+            _redis.publish(_INVAL_CHANNEL, json.dumps(event))
+            return   # our own subscriber appends it
+        except Exception as e:
+            log.warning(f"Invalidation publish failed, delivering locally: {e}")
+    with _inval_lock:
+        event["seq"] = _inval_seq + 1
+        _inval_append_locked(event)
+
+
+def _publish_write(sql: str) -> None:
+    """Publish the invalidation event for a successful write statement."""
+    info = classify(sql)
+    ns = "schema" if info.statement in SCHEMA_STATEMENTS else "table"
+    if ns == "schema":
+        _pager.forget_unique_keys()
+    _publish_invalidation(ns, [info.target or "unknown"])
+
+
+# Heartbeat / activity events from the desktop apps, written once a second
+_events = EventCoalescer(
+    _db,
+    on_write=lambda tables: _publish_invalidation("table", tables),
+    redis=_redis if _redis_ok else None,
+)
+
+
+def _inval_subscriber() -> None:
+    """Relay events published by any worker into this worker's buffer."""
+    while True:
+        try:
+            pubsub = _redis.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(_INVAL_CHANNEL)
+            for msg in pubsub.listen():
+                if msg and msg.get("type") == "message":
+                    _inval_append(json.loads(msg["data"]))
+        except Exception as e:
+            log.warning(f"Invalidation subscriber error, reconnecting: {e}")
+            time.sleep(2)
+
+
+def _invalidations_since(since: int, epoch: Optional[str]) -> Tuple[List[dict], bool]:
+    """Return (events after ``since``, reset) — reset means the client missed
+    events (different epoch or fell out of the buffer) and must drop everything."""
+    with _inval_lock:
+        if epoch != _inval_epoch:
+            return [], True
+        if since < _inval_floor:
+            return [], True   # older than anything this worker has seen (or kept)
+        return [e for e in _inval_events if e["seq"] > since], False
+
+
+if _redis_ok and _redis is not None:
+    try:
+        _redis.set(_INVAL_EPOCH_KEY, _inval_epoch, nx=True)
+        _inval_epoch = (_redis.get(_INVAL_EPOCH_KEY) or b"").decode() or _inval_epoch
+        _inval_seq = _inval_floor = int(_redis.get(_INVAL_SEQ_KEY) or 0)
+        threading.Thread(target=_inval_subscriber, daemon=True, name="ors-inval").start()
+        _inval_shared = True
+    except Exception as _ie:
+        log.warning(f"Shared invalidation stream unavailable ({_ie}) — per-worker events only")
 
 
 _task_queue:   queue.Queue = queue.Queue(maxsize=500)
@@ -184,6 +523,8 @@ def _run_background_task(task: BackgroundTask) -> None:
         # Clear cache after writes to ensure fresh reads
         if not _is_select(task.sql):
             _cache_clear_all()
+            if result is not None:
+                _publish_write(task.sql)
         with _task_lock:
             _task_results[task.task_id] = {
                 "status":      "done",
@@ -217,17 +558,55 @@ _queue_thread.start()
 
 
 
-_stats_lock   = threading.Lock()
-_counters     = collections.defaultdict(int)   # endpoint -> hit count
-_errors       = collections.defaultdict(int)   # endpoint -> error count
+class _ThreadCounters:
+    """Per-endpoint hit/error counters kept per thread and merged on read.
+
+    Recording touches only the calling thread's dicts, so the request path
+    takes no lock; ``snapshot`` sums every thread's dicts.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards: list = []          # (hits, errors) per thread
+        self._shards_lock = threading.Lock()
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = (collections.defaultdict(int), collections.defaultdict(int))
+            with self._shards_lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+            return shard
+
+    def record(self, endpoint: str, is_error: bool) -> None:
+        hits, errors = self._shard()
+        hits[endpoint] += 1
+        if is_error:
+            errors[endpoint] += 1
+
+    def snapshot(self) -> Tuple[dict, dict]:
+        hits, errors = collections.Counter(), collections.Counter()
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard_hits, shard_errors in shards:
+            hits.update(dict(shard_hits))
+            errors.update(dict(shard_errors))
+        return dict(hits), dict(errors)
+
+
+_request_counters = _ThreadCounters()
 _recent       = collections.deque(maxlen=200)  # last 200 requests
 _server_start = datetime.datetime.utcnow()
 
 # ── Known valid API paths (bots probing anything else get strike-counted) ─────
 _KNOWN_PATHS = frozenset({
     "/api/token", "/api/exec", "/api/exec_safe", "/api/batch",
-    "/api/health", "/api/stats", "/api/config", "/api/cache/clear",
-    "/api/enqueue",
+    "/api/health", "/api/ready", "/api/stats", "/api/config", "/api/cache/clear",
+    "/api/enqueue", "/api/audit", "/api/audit/rollups", "/api/invalidations",
+    "/api/clients/top", "/api/cache/policy/reload", "/api/events", "/api/bulk",
+    "/api/transaction",
     "/docs", "/openapi.json", "/redoc",
 })
 
@@ -337,6 +716,7 @@ _exec_hits: dict = {}   # ip -> deque of hit timestamps
 _exec_banned_until: dict = {}  # ip -> ban_expires_at (monotonic)
 
 
+@traced("rate_limit")
 def _exec_rate_check(ip: str) -> None:
     """Raise HTTP 429 if ip exceeds the exec endpoint rate limit."""
     if _bot_is_whitelisted(ip):
@@ -375,6 +755,34 @@ def _exec_rate_check(ip: str) -> None:
             )
 
 
+# ── Per-client cost accounting / quotas ──────────────────────────────────────
+# Totals live in client_accounting; the middleware records requests and
+# response bytes, the exec endpoints record DB time, rows and cache hits.
+
+def _client_of(request: Request) -> ClientKey:
+    key = getattr(request.state, "client_key", None)
+    return key or client_key(request.client.host if request.client else "unknown")
+
+
+@traced("quota")
+def _cost_quota_check(client: ClientKey) -> None:
+    """Raise HTTP 429 if the client has used up its cost quota this window."""
+    exceeded = client_accounting.check_quota(client)
+    if exceeded:
+        metric, retry_in = exceeded
+        log.warning(f"[quota] {client} exceeded {metric} quota, retry in {retry_in}s")
+        raise HTTPException(
+            status_code=429,
+            detail=f"Cost quota exceeded ({metric}). Try again in {retry_in}s.",
+            headers={"Retry-After": str(retry_in)},
+        )
+
+
+def _account_query(client: ClientKey, result: Any = None, db_ms: float = 0.0, cached: bool = False) -> None:
+    rows = 0 if cached or not isinstance(result, list) else len(result)
+    client_accounting.record(client, db_ms=db_ms, rows=rows, cache_hits=int(cached))
+
+
 # ── Bot-blocker state ─────────────────────────────────────────────────────────
 # IPs in this set are whitelisted and never blocked (loopback + internal nets).
 _BOT_WHITELIST_PREFIXES = ("127.", "::1", "10.", "172.16.", "172.17.",
@@ -440,73 +848,148 @@ def _bot_is_banned(ip: str) -> bool:
         return True
 
 
-class _TrackingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        ip = request.client.host if request.client else "unknown"
+_MAX_BODY_BYTES = int(os.environ.get("ORS_MAX_BODY_BYTES", str(1 * 1024 * 1024)))
+
+
+class _TrackingMiddleware:
+    """Blocklists, body-size cap, request ID and stats as a raw ASGI middleware.
+
+    Unlike BaseHTTPMiddleware this adds no extra task or memory stream per
+    request; the response passes straight through a ``send`` wrapper that
+    records the status and appends the X-Request-ID header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        client = scope.get("client")
+        ip     = client[0] if client else "unknown"
+        path   = scope["path"]
 
         # ── Permanent IP blocklist ────────────────────────────────────────
         if _is_ip_blocked(ip):
-            log.warning(f"[ip-block] Rejected blocked IP {ip} -> {request.url.path}")
-            return JSONResponse(status_code=403, content={"detail": "Forbidden"})
+            log.warning(f"[ip-block] Rejected blocked IP {ip} -> {path}")
+            await JSONResponse(status_code=403, content={"detail": "Forbidden"})(scope, receive, send)
+            return
 
         # ── Bot-blocker: reject banned IPs immediately ────────────────────
         if _bot_is_banned(ip):
-            return JSONResponse(
+            await JSONResponse(
                 status_code=429,
                 content={"detail": "Too many requests"},
                 headers={"Retry-After": str(_BOT_BAN_SECS)},
-            )
+            )(scope, receive, send)
+            return
+
+        req_id = None
+        traceparent = None
+        content_length = None
+        user = branch = None
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                content_length = value
+            elif name == b"x-request-id":
+                req_id = value.decode("latin-1")
+            elif name == b"traceparent":
+                traceparent = value.decode("latin-1")
+            elif name == b"x-ors-user":
+                user = value.decode("utf-8", "replace")
+            elif name == b"x-ors-branch":
+                branch = value.decode("utf-8", "replace")
 
         # ── Request body size cap (1 MB) ─────────────────────────────────
-        MAX_BODY = int(os.environ.get("ORS_MAX_BODY_BYTES", str(1 * 1024 * 1024)))
-        content_length = request.headers.get("content-length")
-        if content_length and int(content_length) > MAX_BODY:
-            log.warning(f"[size-cap] Rejected oversized request ({content_length}B) from {ip}")
-            return JSONResponse(
+        if content_length and (not content_length.isdigit() or int(content_length) > _MAX_BODY_BYTES):
+            log.warning(f"[size-cap] Rejected oversized request ({content_length.decode('latin-1')}B) from {ip}")
+            await JSONResponse(
                 status_code=413,
                 content={"detail": "Request body too large (max 1 MB)"},
-            )
+            )(scope, receive, send)
+            return
 
         # ── Request ID — use Nginx-generated ID or create one as fallback ──
-        req_id = request.headers.get("X-Request-ID") or str(uuid.uuid4())
-        request.state.request_id = req_id
-
-        start    = datetime.datetime.utcnow()
-        response = await call_next(request)
-        ms       = int((datetime.datetime.utcnow() - start).total_seconds() * 1000)
-
-        # Echo the request ID back to the client so they can report it
-        response.headers["X-Request-ID"] = req_id
-
-        endpoint = request.url.path
-        is_error = response.status_code >= 400
-
-        # ── Bot-blocker: count probes on unknown paths ────────────────────
-        if response.status_code == 404 and endpoint not in _KNOWN_PATHS:
-            _bot_record_probe(ip)
-
-        # Structured log line — grep by request_id to trace any request
-        log.info(
-            f"rid={req_id} method={request.method} path={endpoint} "
-            f"status={response.status_code} ms={ms} ip={ip}"
+        # The trace joins the caller's (desktop) trace when it sent traceparent.
+        trace = tracing.start_trace(
+            f"{scope['method']} {path}", request_id=req_id or str(uuid.uuid4()),
+            traceparent=traceparent, **{"client.address": ip, "ors.user": user or "", "ors.branch": branch or ""},
         )
-        if is_error:
-            log.warning(f"rid={req_id} error response {response.status_code} from {ip} on {endpoint}")
-
-        with _stats_lock:
-            _counters[endpoint] += 1
-            if is_error:
-                _errors[endpoint] += 1
-            _recent.append({
-                "request_id": req_id,
-                "time":       start.strftime("%Y-%m-%d %H:%M:%S"),
-                "method":     request.method,
-                "path":       endpoint,
-                "status":     response.status_code,
-                "ms":         ms,
-                "ip":         ip,
-            })
-        return response
+        req_id = trace.request_id
+        state = scope.setdefault("state", {})
+        state["request_id"] = req_id
+        state["client_key"] = client = client_key(ip, user, branch)
+        rid_header = (b"x-request-id", req_id.encode("latin-1"))
+        status = 500
+        bytes_out = 0
+        response_start_ns = None
+
+        async def send_with_request_id(message):
+            nonlocal status, bytes_out, response_start_ns
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                response_start_ns = time.time_ns()
+                handler = _last_span(trace, "handler")
+                if handler is not None:
+                    # Encoding the handler's return value into the response body
+                    tracing.record_span("serialize", handler.end_ns, response_start_ns)
+                # Echo the request ID back to the client so they can report it
+                message["headers"] = [
+                    h for h in message.get("headers", ()) if h[0] != b"x-request-id"
+                ] + [rid_header]
+            elif message["type"] == "http.response.body":
+                bytes_out += len(message.get("body", b""))
+            await send(message)
+
+        wall  = time.time()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            if response_start_ns is not None:
+                tracing.record_span("response.write", response_start_ns, bytes=bytes_out)
+            tracing.finish_trace(trace, status)
+            ms = int((time.perf_counter() - start) * 1000)
+            _record_request(req_id, wall, scope["method"], path, status, ms, ip, trace.breakdown())
+            client_accounting.record(client, requests=1, bytes_out=bytes_out, errors=int(status >= 400))
+
+
+def _last_span(trace, name: str):
+    for span in reversed(trace.spans):
+        if span.name == name and span.end_ns is not None:
+            return span
+    return None
+
+
+def _record_request(req_id: str, wall: float, method: str, endpoint: str,
+                    status: int, ms: int, ip: str, stages: dict = None) -> None:
+    is_error = status >= 400
+
+    # ── Bot-blocker: count probes on unknown paths ────────────────────────
+    if status == 404 and endpoint not in _KNOWN_PATHS:
+        _bot_record_probe(ip)
+
+    # Structured log line — grep by request_id to trace any request
+    access_log.info(
+        f"rid={req_id} method={method} path={endpoint} "
+        f"status={status} ms={ms} ip={ip}"
+    )
+    if is_error:
+        log.warning(f"rid={req_id} error response {status} from {ip} on {endpoint}")
+
+    _request_counters.record(endpoint, is_error)
+    _recent.append({
+        "request_id": req_id,
+        "time":       time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(wall)),
+        "method":     method,
+        "path":       endpoint,
+        "status":     status,
+        "ms":         ms,
+        "ip":         ip,
+        "stages":     stages or {},
+    })
 
 
 # ── FastAPI app ───────────────────────────────────────────────────────────────
@@ -554,6 +1037,228 @@ async def _raise_thread_limiter():
         log.warning(f"Could not raise thread limiter: {exc}")
 
 
+@app.on_event("startup")
+async def _start_error_compactor():
+    """Periodically fold duplicate errors and expire old error groups."""
+    error_tracker.start_compactor()
+    audit_logger.start_maintenance()
+
+
+@app.on_event("startup")
+async def _start_event_coalescer():
+    """Group-commit heartbeat/activity events and run the purge job."""
+    _events.start()
+
+
+@app.on_event("shutdown")
+def _flush_events():
+    _events.flush()
+
+
+@app.on_event("startup")
+async def _start_cache_policy_watcher():
+    """Reload cache_policy.json whenever it changes on disk."""
+    cache_policy.start_watcher()
+
+
+# ── Worker warm-up / readiness ────────────────────────────────────────────────
+# Each worker fills its pool, preloads the lookups listed in
+# warmup_manifest.json into the cache and exercises its request/response
+# serializers before taking traffic, so a restart during business hours
+# doesn't hand the first wave of clients cold connections and cache misses.
+_WARMUP_BLOCKING = os.environ.get("ORS_WARMUP_BLOCKING", "true").lower() == "true"
+_WARMUP_LOOKUP_TTL = int(os.environ.get("ORS_WARMUP_TTL", "300"))   # manifest default_ttl fallback
+_WARMUP_MANIFEST = os.environ.get(
+    "ORS_WARMUP_MANIFEST",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "warmup_manifest.json"),
+)
+# After a write clears the shared (Redis) cache, one worker — whichever wins
+# a SET NX lock — re-runs the manifest, at most this often (0 = only at
+# startup and on /api/cache/clear).  Per-worker memory caches are refilled
+# only by /api/cache/clear; refilling every worker on every write would
+# multiply the write load by the worker count.
+_WARMUP_REFILL_SECS = float(os.environ.get("ORS_WARMUP_REFILL_SECS", "10"))
+_WARMUP_REFILL_LOCK = "ors-lock:warmup-refill"   # outside "ors:*", which cache clears delete
+
+_ready = threading.Event()
+_warmup_state = {"stage": "pending", "duration_ms": None, "connections": 0, "lookups": 0, "errors": [],
+                 "manifest": {"runs": 0}}
+_refill_lock    = threading.Lock()
+_refill_pending = False
+
+
+def _warm_pool() -> int:
+    """Open pool_size connections concurrently, then return them to the pool."""
+    if _db.engine is None:
+        return 0
+    size = _db.engine.pool.size()
+    conns = []
+    try:
+        with ThreadPoolExecutor(max_workers=min(size, 16), thread_name_prefix="ors-warm") as ex:
+            for fut in [ex.submit(_db.engine.connect) for _ in range(size)]:
+                try:
+                    conns.append(fut.result())
+                except Exception as e:
+                    _warmup_state["errors"].append(f"pool: {e}")
+        return len(conns)
+    finally:
+        for conn in conns:
+            conn.close()
+
+
+def _load_warmup_manifest() -> list:
+    try:
+        with open(_WARMUP_MANIFEST, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return []
+    default_ttl = manifest.get("default_ttl", _WARMUP_LOOKUP_TTL)
+    entries = []
+    for entry in manifest.get("queries", []):
+        entries.append(dict(entry, sql=entry["sql"].strip(), ttl=entry.get("ttl", default_ttl)))
+    return entries
+
+
+def _preload_lookups(trigger: str = "startup") -> int:
+    """Run the warm-up manifest, caching each result under its TTL.
+
+    Returns the number of cache entries written.  SQL runs exactly as listed
+    (after the same strip the request model applies) so keys match clients'.
+    """
+    start = time.monotonic()
+    loaded = 0
+    errors = []
+    try:
+        entries = _load_warmup_manifest()
+    except (OSError, ValueError, KeyError) as e:
+        entries = []
+        errors.append(f"manifest: {e}")
+    per_query = {}
+    for entry in entries:
+        sql = entry["sql"]
+        if not _is_select(sql):
+            errors.append(f"{entry.get('name', sql[:40])}: not a SELECT, skipped")
+            continue
+        if "params_query" in entry:
+            rows, err = _db.execute_query_with_exception(entry["params_query"])
+            if err:
+                errors.append(f"{entry.get('name', sql[:40])}: {err}")
+                continue
+            param_sets = [tuple(r.values()) if isinstance(r, dict) else tuple(r) for r in rows or []]
+        else:
+            param_sets = [tuple(p) for p in entry.get("params_each", [()])]
+        count = 0
+        for params in param_sets:
+            params = params or None   # clients send [] for no params
+            result, err = _db.execute_query_with_exception(sql, params)
+            if err:
+                errors.append(f"{entry.get('name', sql[:40])}: {err}")
+                continue
+            _cache_set(_make_cache_key(sql, params), result, ttl=entry["ttl"])
+            count += 1
+        per_query[entry.get("name", sql[:40])] = count
+        loaded += count
+
+    _warmup_state["manifest"] = {
+        "runs":        _warmup_state["manifest"].get("runs", 0) + 1,
+        "trigger":     trigger,
+        "finished_at": datetime.datetime.utcnow().isoformat(),
+        "duration_ms": round((time.monotonic() - start) * 1000, 1),
+        "entries":     loaded,
+        "by_query":    per_query,
+        "errors":      errors[:20],
+    }
+    if errors:
+        log.warning(f"Warm-up manifest ({trigger}): {len(errors)} error(s), first: {errors[0]}")
+    return loaded
+
+
+def _claim_write_refill() -> bool:
+    """True if this worker should refill the shared cache after a write."""
+    if not (_redis_ok and _redis is not None):
+        return False
+    try:
+        return bool(_redis.set(_WARMUP_REFILL_LOCK, os.getpid(), nx=True,
+                               ex=max(1, int(_WARMUP_REFILL_SECS))))
+    except Exception:
+        return False
+
+
+def _schedule_warmup_refill(trigger: str, delay: float) -> None:
+    """Re-run the manifest in the background once ``delay`` seconds pass.
+
+    Calls while a refill is pending are coalesced into it.
+    """
+    global _refill_pending
+    if not _ready.is_set():
+        return   # startup warm-up still running
+    with _refill_lock:
+        if _refill_pending:
+            return
+        _refill_pending = True
+
+    def refill():
+        global _refill_pending
+        time.sleep(delay)
+        with _refill_lock:
+            _refill_pending = False
+        try:
+            _preload_lookups(trigger)
+        except Exception as e:
+            log.error(f"Warm-up refill failed: {e}")
+
+    threading.Thread(target=refill, daemon=True, name="ors-warmup-refill").start()
+
+
+def _warm_serializers() -> None:
+    """Run request validation and response encoding once on representative data."""
+    ExecRequest(sql="SELECT 1", params=[1, "a", 1.5, True, None], ttl=30)
+    BatchRequest(queries=[{"sql": "SELECT 1", "params": [1]}])
+    TokenRequest(api_key="warmup")
+    sample = [{
+        "id":     1,
+        "amount": decimal.Decimal("1.50"),
+        "date":   datetime.date.today(),
+        "ts":     datetime.datetime.utcnow(),
+        "name":   "warmup",
+        "blank":  None,
+    }]
+    JSONResponse(content=jsonable_encoder({"result": sample, "error": None, "cached": False}))
+    json.loads(json.dumps(sample, default=str))
+
+
+def _warm_up() -> None:
+    start = time.monotonic()
+    try:
+        _warmup_state["stage"] = "pool"
+        _warmup_state["connections"] = _warm_pool()
+        _warmup_state["stage"] = "lookups"
+        _warmup_state["lookups"] = _preload_lookups("startup")
+        _warmup_state["stage"] = "serializers"
+        _warm_serializers()
+    except Exception as e:
+        _warmup_state["errors"].append(str(e))
+        log.error(f"Warm-up failed at stage {_warmup_state['stage']}: {e}")
+    finally:
+        _warmup_state["stage"] = "done"
+        _warmup_state["duration_ms"] = round((time.monotonic() - start) * 1000, 1)
+        _ready.set()
+        log.info(
+            f"Worker {os.getpid()} warm: {_warmup_state['connections']} connections, "
+            f"{_warmup_state['lookups']} lookups in {_warmup_state['duration_ms']}ms"
+        )
+
+
+@app.on_event("startup")
+async def _warm_up_worker():
+    """Warm this worker before it accepts connections (ORS_WARMUP_BLOCKING),
+    or in the background while /api/ready reports not-ready."""
+    if _WARMUP_BLOCKING:
+        await run_in_threadpool(_warm_up)
+    else:
+        threading.Thread(target=_warm_up, daemon=True, name="ors-warmup").start()
+
+
 # ── Auth helpers ──────────────────────────────────────────────────────────────
 
 def _make_token() -> str:
@@ -564,6 +1269,7 @@ def _make_token() -> str:
     return pyjwt.encode(payload, SECRET_KEY, algorithm="HS256")
 
 
+@traced("auth")
 def _require_token(request: Request) -> None:
     """FastAPI dependency: validate JWT in Authorization header."""
     auth  = request.headers.get("Authorization", "")
@@ -579,24 +1285,17 @@ def _require_token(request: Request) -> None:
 
 
 # ── Blocked DDL ───────────────────────────────────────────────────────────────
-_BLOCKED_DDL = (
-    "DROP TABLE", "DROP DATABASE", "TRUNCATE",
-    "ALTER TABLE DROP", "ALTER TABLE RENAME",
-    "CREATE USER", "GRANT ", "REVOKE ", "FLUSH ",
-    "DROP USER", "DROP INDEX",
-)
-
+# The blocklist itself is sql_classifier.BLOCKED_STATEMENTS.
 
 def _check_blocked(sql: str, remote: str = "") -> None:
-    sql_upper = sql.strip().upper()
-    for keyword in _BLOCKED_DDL:
-        if sql_upper.startswith(keyword) or f" {keyword}" in sql_upper:
-            if remote:
-                log.warning(f"Blocked DDL from {remote}: {sql[:80]}")
-            raise HTTPException(
-                status_code=403,
-                detail=f"Statement type not allowed: {keyword.strip()}"
-            )
+    blocked = classify(sql).blocked
+    if blocked:
+        if remote:
+            log.warning(f"Blocked DDL from {remote}: {sql[:80]}")
+        raise HTTPException(
+            status_code=403,
+            detail=f"Statement type not allowed: {blocked}"
+        )
 
 
 # ── Request/Response models ───────────────────────────────────────────────────
@@ -616,6 +1315,8 @@ class ExecRequest(BaseModel):
     sql: str = Field(..., min_length=1, max_length=100000, description="SQL query to execute")
     params: Optional[List[Any]] = Field(None, max_items=1000, description="Query parameters")
     ttl: Optional[int] = Field(None, ge=0, le=86400, description="Cache TTL in seconds (0-86400)")
+    page_token: Optional[str] = Field(None, max_length=4096, description="next_token from the previous page")
+    max_rows: Optional[int] = Field(None, ge=1, description="Page size below the server's row cap")
 
     @validator('sql')
     def sql_not_empty(cls, v):
@@ -655,6 +1356,64 @@ class BatchRequest(BaseModel):
         return v
 
 
+class TransactionStatement(BaseModel):
+    sql: str = Field(..., min_length=1, max_length=100000, description="SQL statement")
+    params: Optional[List[Any]] = Field(None, max_items=1000, description="Statement parameters")
+
+    @validator('sql')
+    def sql_not_empty(cls, v):
+        if not v or not v.strip():
+            raise ValueError("SQL query cannot be empty")
+        return v.strip()
+
+
+class TransactionRequest(BaseModel):
+    statements: List[TransactionStatement] = Field(..., min_items=1, max_items=500,
+                                                   description="Statements run in one transaction, in order")
+
+
+class BulkRequest(BaseModel):
+    sql: str = Field(..., min_length=1, max_length=100000, description="Write statement with %s placeholders")
+    rows: List[List[Any]] = Field(..., min_items=1, max_items=10000, description="One parameter list per row")
+
+    @validator('sql')
+    def sql_not_empty(cls, v):
+        if not v or not v.strip():
+            raise ValueError("SQL query cannot be empty")
+        return v.strip()
+
+    @validator('rows')
+    def rows_valid(cls, v):
+        width = len(v[0]) if v else 0
+        for i, row in enumerate(v):
+            if len(row) != width:
+                raise ValueError(f"Row {i} has {len(row)} values, expected {width}")
+            for param in row:
+                if not isinstance(param, (str, int, float, bool, type(None))):
+                    raise ValueError(f"Row {i} has unsupported type: {type(param).__name__}")
+        return v
+
+
+class HeartbeatEvent(BaseModel):
+    session_id: int = Field(..., ge=1, description="user_ping_logs.id of the session")
+    last_seen: str = Field(..., min_length=1, max_length=32, description="Client time, YYYY-MM-DD HH:MM:SS")
+    ping_ms: int = Field(-1, ge=-1, le=600000, description="Measured DB round trip, -1 if it failed")
+
+
+class ActivityEvent(BaseModel):
+    event_time: str = Field(..., min_length=1, max_length=32)
+    event_type: str = Field(..., min_length=1, max_length=50)
+    username: str = Field(..., min_length=1, max_length=255)
+    ip_address: Optional[str] = Field(None, max_length=45)
+    hostname: Optional[str] = Field(None, max_length=255)
+    details: Optional[str] = Field(None, max_length=10000)
+
+
+class EventsRequest(BaseModel):
+    heartbeats: List[HeartbeatEvent] = Field(default_factory=list, max_items=1000)
+    activity: List[ActivityEvent] = Field(default_factory=list, max_items=1000)
+
+
 # ── Endpoints ─────────────────────────────────────────────────────────────────
 
 @app.get("/api/stats")
@@ -685,6 +1444,7 @@ def stats(_: None = Depends(_require_token)):
             }
     except Exception:
         pass
+    pool_stats.update(_db.pool_report())
 
     # ── Bot-blocker snapshot ──────────────────────────────────────────────
     now = time.monotonic()
@@ -708,11 +1468,12 @@ def stats(_: None = Depends(_require_token)):
             if ts
         ]
 
-    with _stats_lock, _cache_lock:
+    total_hits, total_errors = _request_counters.snapshot()
+    with _cache_lock:
         return {
             "uptime":       f"{h}h {m}m {s}s",
-            "total_hits":   dict(_counters),
-            "total_errors": dict(_errors),
+            "total_hits":   total_hits,
+            "total_errors": total_errors,
             "recent":       list(reversed(_recent)),  # newest first
             "cache": {
                 "backend":      "redis" if _redis_ok else "memory",
@@ -722,8 +1483,26 @@ def stats(_: None = Depends(_require_token)):
                 "hits":         _cache_hits,
                 "misses":       _cache_misses,
                 "hit_rate_pct": hit_rate,
+                "codec":        "zstd" if _zstd is not None else "zlib",
+                "compress_min_bytes": CACHE_COMPRESS_MIN,
+                "max_entry_bytes":    CACHE_MAX_ENTRY,
+                # Totals over every write since startup
+                "written": dict(
+                    _cache_bytes,
+                    ratio=round(_cache_bytes["stored"] / _cache_bytes["raw"], 3) if _cache_bytes["raw"] else None,
+                ),
+                "memory_bytes": sum(len(data) for _, data in _cache.values()),
+                "stale_while_revalidate": dict(_swr_stats, refreshing=len(_swr_refreshing)),
             },
+            "cache_policy": cache_policy.summary(),
             "db_pool":      pool_stats,
+            "logging":      get_logging_stats(),
+            "sql_classifier": sql_classifier_stats(),
+            "result_pages": _pager.stats(),
+            "clients":      client_accounting.summary(),
+            "tracing":      tracing.export_stats(),
+            "events":       _events.stats(),
+            "warmup":       dict(_warmup_state, ready=_ready.is_set(), pid=os.getpid()),
             "bot_blocker": {
                 "window_secs":   _BOT_WINDOW_SECS,
                 "probe_limit":   _BOT_PROBE_LIMIT,
@@ -783,9 +1562,53 @@ def cache_clear(_: None = Depends(_require_token)):
         _cache_hits   = 0
         _cache_misses = 0
     log.info(f"Cache cleared: {count} entries removed")
+    _publish_invalidation("all", [])
+    _schedule_warmup_refill("cache_clear", 0)
     return {"cleared": count, "backend": "redis" if _redis_ok else "memory"}
 
 
+@app.post("/api/cache/policy/reload")
+def cache_policy_reload(_: None = Depends(_require_token)):
+    """Re-read cache_policy.json now (it is also picked up on change) — JWT required."""
+    ok = cache_policy.load()
+    summary = cache_policy.summary()
+    log.info(f"Cache policy reload requested: {'ok' if ok else summary['last_error']}")
+    return {"reloaded": ok, "policy": summary}
+
+
+@app.get("/api/invalidations")
+async def invalidations(
+    since: int = 0,
+    epoch: Optional[str] = None,
+    wait: int = 0,
+    _: None = Depends(_require_token),
+):
+    """Long-poll for cache invalidation events — JWT required.
+
+    Returns as soon as there are events after ``since`` (or after ``wait``
+    seconds, capped at ORS_INVAL_MAX_WAIT).  Clients pass back the returned
+    ``seq`` and ``epoch``; ``reset: true`` means drop every cached entry.
+    ``shared: false`` means this worker only sees its own writes (no Redis),
+    so clients must not rely on the stream to stretch their cache TTLs.
+    Waiting holds no worker thread.
+    """
+    global _inval_loop, _inval_wakeup
+    if _inval_loop is None:
+        _inval_loop, _inval_wakeup = asyncio.get_running_loop(), asyncio.Event()
+    deadline = time.monotonic() + max(0, min(wait, _INVAL_MAX_WAIT))
+    while True:
+        wakeup = _inval_wakeup   # grab before checking so no append is missed
+        events, reset = _invalidations_since(since, epoch)
+        remaining = deadline - time.monotonic()
+        if events or reset or remaining <= 0:
+            return {"epoch": _inval_epoch, "seq": _inval_seq, "events": events, "reset": reset,
+                    "shared": _inval_shared}
+        try:
+            await asyncio.wait_for(wakeup.wait(), timeout=remaining)
+        except asyncio.TimeoutError:
+            pass
+
+
 @app.get("/api/health")
 def health():
     """Health check — no auth required."""
@@ -796,6 +1619,15 @@ def health():
     )
 
 
+@app.get("/api/ready")
+def ready():
+    """Readiness check — 503 until this worker has finished warming up."""
+    return JSONResponse(
+        content={"ready": _ready.is_set(), "pid": os.getpid(), "warmup": _warmup_state},
+        status_code=200 if _ready.is_set() else 503,
+    )
+
+
 @app.post("/api/token")
 def get_token(body: TokenRequest, request: Request):
     """Exchange API key for a JWT.  Called once per client session."""
@@ -816,27 +1648,50 @@ def get_token(body: TokenRequest, request: Request):
 
 
 @app.post("/api/exec")
+@traced("handler")
 def exec_query(body: ExecRequest, request: Request, _: None = Depends(_require_token)):
 
     remote = request.client.host if request.client else "unknown"
+    client = _client_of(request)
     _exec_rate_check(remote)
     _check_blocked(body.sql, remote)
 
     params = tuple(body.params) if body.params else None
-    is_write = not _is_select(body.sql)
-    operation = "INSERT" if "INSERT" in body.sql.upper() else "UPDATE" if "UPDATE" in body.sql.upper() else "DELETE" if "DELETE" in body.sql.upper() else "SELECT"
-    table_name = _extract_table_name(body.sql)
-
-    if CACHE_TTL > 0 and not is_write:
+    info = classify(body.sql)
+    is_write = not info.is_select
+    operation = info.operation
+    table_name = info.table
+
+    # Only whole results are cached; later pages always go to the DB
+    settings = None
+    if CACHE_TTL > 0 and not is_write and not body.page_token:
+        settings = _cache_settings(body.sql, body.ttl)
+    use_cache = settings is not None
+    if use_cache:
         key = _make_cache_key(body.sql, params)
-        hit, cached = _cache_get(key)
+        hit, cached = _cache_get(key, _swr_refresher(key, body.sql, params, settings))
         if hit:
+            _account_query(client, cached=True)
             return {"result": cached, "error": None, "cached": True}
 
+    # Cache hits cost nothing, so the cost quota only gates DB work
+    _cost_quota_check(client)
     start_time = time.time()
     try:
-        result = _db.execute_query(body.sql, params)
+        next_token = None
+        if is_write:
+            result = _db.execute_query(body.sql, params)
+        else:
+            result, next_token, err = _fetch_select(body.sql, params, body.page_token, body.max_rows)
+            if isinstance(err, (PageTokenError, ResultTooLarge)):
+                _account_query(client, db_ms=(time.time() - start_time) * 1000)
+                return JSONResponse(
+                    content={"result": None, "error": str(err)},
+                    status_code=400 if isinstance(err, PageTokenError) else 413,
+                )
+            # Other read errors give None, as DatabaseManagerPooled.execute_query does
         duration_ms = (time.time() - start_time) * 1000
+        _account_query(client, result, duration_ms)
 
         # Log audit trail for writes
         if is_write:
@@ -845,15 +1700,22 @@ def exec_query(body: ExecRequest, request: Request, _: None = Depends(_require_t
 
         if CACHE_TTL > 0:
             if not is_write:
-                _cache_set(key, result, ttl=body.ttl)
+                if use_cache and next_token is None and result is not None:
+                    ttl, swr, max_bytes = settings
+                    _cache_set(key, result, ttl=ttl, swr=swr, max_bytes=max_bytes)
             else:
                 # Clear cache after writes so fresh reads don't get stale data
                 _cache_clear_all()
+        if is_write:
+            _publish_write(body.sql)
 
         log.debug(f"{operation} on {table_name}: {duration_ms:.1f}ms from {remote}")
+        if next_token:
+            return {"result": result, "error": None, "cached": False, "next_token": next_token}
         return {"result": result, "error": None, "cached": False}
     except Exception as e:
         duration_ms = (time.time() - start_time) * 1000
+        _account_query(client, db_ms=duration_ms)
         error_id = log_exception(e, source="api_exec", remote_ip=remote)
         log.error(f"Query error (ID:{error_id}): {e} | SQL: {body.sql[:120]}")
 
@@ -865,28 +1727,47 @@ def exec_query(body: ExecRequest, request: Request, _: None = Depends(_require_t
 
 
 @app.post("/api/exec_safe")
+@traced("handler")
 def exec_query_safe(body: ExecRequest, request: Request, _: None = Depends(_require_token)):
 
     remote = request.client.host if request.client else "unknown"
+    client = _client_of(request)
     _exec_rate_check(remote)
     _check_blocked(body.sql)
 
     params = tuple(body.params) if body.params else None
+    is_select = _is_select(body.sql)
 
-    if CACHE_TTL > 0 and _is_select(body.sql):
+    settings = None
+    if CACHE_TTL > 0 and is_select and not body.page_token:
+        settings = _cache_settings(body.sql, body.ttl)
+    use_cache = settings is not None
+    if use_cache:
         key = _make_cache_key(body.sql, params)
-        hit, cached = _cache_get(key)
+        hit, cached = _cache_get(key, _swr_refresher(key, body.sql, params, settings))
         if hit:
+            _account_query(client, cached=True)
             return {"result": cached, "exec_error": None, "error_type": None, "error_code": None, "cached": True}
 
-    result, err = _db.execute_query_with_exception(body.sql, params)
+    _cost_quota_check(client)
+    start_time = time.time()
+    next_token = None
+    if is_select:
+        result, next_token, err = _fetch_select(body.sql, params, body.page_token, body.max_rows)
+    else:
+        result, err = _db.execute_query_with_exception(body.sql, params)
+    _account_query(client, result, (time.time() - start_time) * 1000)
     if CACHE_TTL > 0:
-        if _is_select(body.sql) and not err:
-            _cache_set(key, result, ttl=body.ttl)
-        elif not _is_select(body.sql) and not err:
+        if is_select and not err:
+            if use_cache and next_token is None:
+                ttl, swr, max_bytes = settings
+                _cache_set(key, result, ttl=ttl, swr=swr, max_bytes=max_bytes)
+        elif not is_select and not err:
             # Clear cache after successful writes so fresh reads don't get stale data
             _cache_clear_all()
-    return {
+    if not err and not is_select:
+        _publish_write(body.sql)
+    response = {
         "result":     result,
         "exec_error": str(err) if err else None,
         "error_type": type(err).__name__ if err else None,
@@ -894,12 +1775,16 @@ def exec_query_safe(body: ExecRequest, request: Request, _: None = Depends(_requ
         "error_code": err.args[0] if err and hasattr(err, "args") and err.args else None,
         "cached":     False,
     }
+    if next_token:
+        response["next_token"] = next_token
+    return response
 
 
 
 # ── Entry point ───────────────────────────────────────────────────────────────
 
 @app.post("/api/batch")
+@traced("handler")
 def exec_batch(body: BatchRequest, request: Request, _: None = Depends(_require_token)):
     """Execute multiple SQL statements in one HTTP round-trip.
 
@@ -908,36 +1793,285 @@ def exec_batch(body: BatchRequest, request: Request, _: None = Depends(_require_
     the same order as the input queries.
     """
     remote = request.client.host if request.client else "unknown"
+    client = _client_of(request)
     _exec_rate_check(remote)
-    results = []
-    has_writes = False
     for item in body.queries:
         _check_blocked(item.sql, remote)
+
+    # Every cache key up front, looked up in one round trip
+    plan = []    # (item, params, is_select, cache key or None, cache settings)
+    for item in body.queries:
         params = tuple(item.params) if item.params else None
-        # Try cache for SELECT statements
-        if CACHE_TTL > 0 and _is_select(item.sql):
-            key = _make_cache_key(item.sql, params)
-            hit, cached = _cache_get(key)
+        is_select = _is_select(item.sql)
+        settings = _cache_settings(item.sql, item.ttl) if CACHE_TTL > 0 and is_select else None
+        key = _make_cache_key(item.sql, params) if settings else None
+        plan.append((item, params, is_select, key, settings))
+    lookups = [(key, _swr_refresher(key, item.sql, params, settings))
+               for item, params, _, key, settings in plan if key]
+    cache_keys = [key for key, _ in lookups]
+    found = dict(zip(cache_keys, _cache_get_many(cache_keys, [refresh for _, refresh in lookups])))
+
+    results = []
+    to_cache = []
+    has_writes = False
+    written = []
+    for item, params, is_select, key, settings in plan:
+        if key:
+            hit, cached = found[key]
             if hit:
+                _account_query(client, cached=True)
                 results.append({"result": cached, "error": None, "cached": True})
                 continue
-        result, err = _db.execute_query_with_exception(item.sql, params)
+        _cost_quota_check(client)
+        start_time = time.time()
+        next_token = None
+        if is_select:
+            # Later pages are fetched through /api/exec_safe with next_token
+            result, next_token, err = _fetch_select(item.sql, params)
+        else:
+            result, err = _db.execute_query_with_exception(item.sql, params)
+        _account_query(client, result, (time.time() - start_time) * 1000)
         if CACHE_TTL > 0:
-            if _is_select(item.sql) and not err:
-                _cache_set(key, result, ttl=item.ttl)
-            elif not _is_select(item.sql) and not err:
+            if is_select and not err:
+                if key and next_token is None:
+                    to_cache.append((key, result) + settings)
+            elif not is_select and not err:
                 has_writes = True
-        results.append({
+        if not err and not is_select:
+            written.append(item.sql)
+        entry = {
             "result": result,
             "error":  str(err) if err else None,
             "cached": False,
-        })
-    # Clear cache after batch if any writes occurred
+        }
+        if next_token:
+            entry["next_token"] = next_token
+        results.append(entry)
+    # Clear cache after batch if any writes occurred; otherwise store the
+    # misses in one pipelined round
     if has_writes and CACHE_TTL > 0:
         _cache_clear_all()
+    elif to_cache:
+        _cache_set_many(to_cache)
+    for sql in written:
+        _publish_write(sql)
     return {"results": results}
 
 
+_AUDIT_MAX_RANGE_DAYS = int(os.environ.get("ORS_AUDIT_MAX_RANGE_DAYS", "93"))
+
+
+def _naive_utc(value: str) -> datetime.datetime:
+    """ISO date/datetime as naive UTC; an offset, if given, is converted."""
+    dt = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def _parse_audit_range(start: Optional[str], end: Optional[str]) -> Tuple[datetime.datetime, datetime.datetime]:
+    """Parse ISO start/end query params (UTC); defaults to the last 24 hours."""
+    try:
+        end_dt   = _naive_utc(end) if end else datetime.datetime.utcnow()
+        start_dt = _naive_utc(start) if start else end_dt - datetime.timedelta(hours=24)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start/end must be ISO dates or datetimes")
+    if start_dt >= end_dt:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if (end_dt - start_dt).days > _AUDIT_MAX_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range too large (max {_AUDIT_MAX_RANGE_DAYS} days)")
+    return start_dt, end_dt
+
+
+@app.get("/api/audit")
+def audit_query(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    table: Optional[str] = None,
+    operation: Optional[str] = None,
+    user: Optional[str] = None,
+    remote_ip: Optional[str] = None,
+    status: Optional[str] = None,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    _: None = Depends(_require_token),
+):
+    """Page through audited writes, newest first — JWT required.
+
+    Pass the returned ``next_cursor`` as ``cursor`` to fetch the next page.
+    """
+    start_dt, end_dt = _parse_audit_range(start, end)
+    try:
+        rows, next_cursor = audit_logger.query(
+            start_dt, end_dt,
+            table_name=table,
+            operation=operation.upper() if operation else None,
+            user=user,
+            remote_ip=remote_ip,
+            status=status,
+            limit=max(1, min(limit, 1000)),
+            cursor=cursor,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"items": rows, "next_cursor": next_cursor}
+
+
+@app.get("/api/audit/rollups")
+def audit_rollups(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    table: Optional[str] = None,
+    operation: Optional[str] = None,
+    _: None = Depends(_require_token),
+):
+    """Hourly write counts and total duration per table/operation — JWT required."""
+    start_dt, end_dt = _parse_audit_range(start, end)
+    return {
+        "rollups": audit_logger.get_rollups(
+            start_dt, end_dt,
+            table_name=table,
+            operation=operation.upper() if operation else None,
+        )
+    }
+
+
+@app.get("/api/clients/top")
+def clients_top(
+    by: str = "db_ms",
+    limit: int = 20,
+    group_by: str = "client",
+    _: None = Depends(_require_token),
+):
+    """Heaviest API consumers in this worker — JWT required.
+
+    ``by``: requests, db_ms, rows, bytes_out, cache_hits or errors.
+    ``group_by``: client (ip+user+branch), ip, user or branch.
+    """
+    if group_by not in ("client", "ip", "user", "branch"):
+        raise HTTPException(status_code=400, detail="group_by must be client, ip, user or branch")
+    try:
+        rows = client_accounting.top(by=by, limit=max(1, min(limit, 500)), group_by=group_by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"by": by, "group_by": group_by, "pid": os.getpid(), "items": rows,
+            **client_accounting.summary()}
+
+
+@app.post("/api/bulk")
+@traced("handler")
+def exec_bulk(body: BulkRequest, request: Request, _: None = Depends(_require_token)):
+    """Run one write statement for many parameter rows — JWT required.
+
+    Goes through DatabaseManagerPooled.execute_bulk (multi-row VALUES where
+    the statement allows), and costs one rate-limit hit, one audit entry
+    and one cache flush per request instead of per row.  Failed chunks are
+    listed in ``errors``; the others stay committed.
+    """
+    remote = request.client.host if request.client else "unknown"
+    client = _client_of(request)
+    _exec_rate_check(remote)
+    _check_blocked(body.sql, remote)
+    info = classify(body.sql)
+    if info.is_select:
+        raise HTTPException(status_code=400, detail="/api/bulk runs writes; use /api/exec for SELECT")
+
+    _cost_quota_check(client)
+    start_time = time.time()
+    result = _db.execute_bulk(body.sql, [tuple(row) for row in body.rows])
+    duration_ms = (time.time() - start_time) * 1000
+    _account_query(client, db_ms=duration_ms)
+    errors = [{"first_row": first, "rows": count, "error": msg} for first, count, msg in result.errors]
+
+    log_audit(
+        info.operation, info.table, body.sql, remote_ip=remote, affected_rows=result.rows,
+        duration_ms=duration_ms, status="error" if errors else "success",
+        error_msg=errors[0]["error"] if errors else None,
+    )
+    if len(errors) < result.chunks:
+        # At least one chunk committed
+        if CACHE_TTL > 0:
+            _cache_clear_all()
+        _publish_write(body.sql)
+    log.debug(f"BULK {info.operation} on {info.table}: {len(body.rows)} rows, "
+              f"{result.chunks} chunk(s), {duration_ms:.1f}ms from {remote}")
+    return {"result": result.rows, "chunks": result.chunks, "errors": errors}
+
+
+@app.post("/api/transaction")
+@traced("handler")
+def exec_transaction(body: TransactionRequest, request: Request, _: None = Depends(_require_token)):
+    """Run statements in order inside one database transaction — JWT required.
+
+    All of them commit or none do.  On failure the response carries
+    ``exec_error``, ``error_code`` and ``failed_index`` like /api/exec_safe;
+    otherwise ``results`` holds each statement's affected row count.
+    SELECTs are rejected (400): their results would be neither capped nor
+    paged, and ScriptTransaction never sends them.
+    """
+    remote = request.client.host if request.client else "unknown"
+    client = _client_of(request)
+    _exec_rate_check(remote)
+    infos = []
+    for index, stmt in enumerate(body.statements):
+        _check_blocked(stmt.sql, remote)
+        info = classify(stmt.sql)
+        if info.is_select:
+            raise HTTPException(status_code=400,
+                                detail=f"Statement {index} is a SELECT; use /api/exec for reads")
+        infos.append(info)
+
+    _cost_quota_check(client)
+    start_time = time.time()
+    results, index = [], 0
+    try:
+        with _db.transaction() as tx:
+            for index, stmt in enumerate(body.statements):
+                results.append(tx.execute(stmt.sql, tuple(stmt.params) if stmt.params else None))
+    except Exception as e:
+        duration_ms = (time.time() - start_time) * 1000
+        _account_query(client, db_ms=duration_ms)
+        failed = infos[index]
+        log_audit(failed.operation, failed.table, body.statements[index].sql, remote_ip=remote,
+                  status="error", error_msg=str(e), duration_ms=duration_ms)
+        code = getattr(e, "code", None) if isinstance(e, TransactionError) else mysql_error_code(e)
+        return {"results": None, "exec_error": str(e), "error_type": type(e).__name__,
+                "error_code": code, "failed_index": index}
+
+    duration_ms = (time.time() - start_time) * 1000
+    _account_query(client, db_ms=duration_ms)
+    writes = [(stmt, info, result) for stmt, info, result in zip(body.statements, infos, results)
+              if not info.is_select]
+    for stmt, info, result in writes:
+        log_audit(info.operation, info.table, stmt.sql, remote_ip=remote,
+                  affected_rows=result if isinstance(result, int) else None,
+                  duration_ms=duration_ms / len(body.statements))
+    if writes:
+        if CACHE_TTL > 0:
+            _cache_clear_all()
+        for sql in dict.fromkeys(stmt.sql for stmt, _, _ in writes):
+            _publish_write(sql)
+    log.debug(f"TRANSACTION {len(body.statements)} statement(s), {len(writes)} write(s), "
+              f"{duration_ms:.1f}ms from {remote}")
+    return {"results": results, "exec_error": None, "error_type": None, "error_code": None}
+
+
+@app.post("/api/events")
+def post_events(body: EventsRequest, request: Request, _: None = Depends(_require_token)):
+    """Queue heartbeat and activity events for the next group commit — JWT required.
+
+    Returns as soon as they are buffered; they reach MySQL within
+    ORS_EVENT_FLUSH_SECS.
+    """
+    remote = request.client.host if request.client else "unknown"
+    _exec_rate_check(remote)
+    accepted = _events.add(
+        [hb.dict() for hb in body.heartbeats],
+        [ev.dict() for ev in body.activity],
+    )
+    return {"accepted": accepted}
+
+
 @app.post("/api/enqueue")
 def enqueue(body: ExecRequest, _: None = Depends(_require_token)):
 
@@ -967,30 +2101,8 @@ def task_status(task_id: str, _: None = Depends(_require_token)):
 
 
 if __name__ == "__main__":
-    import uvicorn
-    import os as _os
-    log.info(f"Starting ORS API Server on {API_HOST}:{API_PORT}")
-    log.info(f"API Key: {API_KEY[:8]}... (set ORS_API_KEY env var to change)")
-
-    # Check for SSL certificate files
-    cert_file = _os.path.join(_os.path.dirname(__file__), "cert.pem")
-    key_file = _os.path.join(_os.path.dirname(__file__), "key.pem")
-    use_ssl = _os.path.exists(cert_file) and _os.path.exists(key_file)
-
-    if use_ssl:
-        log.info(f"Using HTTPS with self-signed certificate")
-        log.info(f"⚠️  Certificate: {cert_file}")
-    else:
-        log.warning(f"No SSL certificate found. Using HTTP (not secure)")
-        log.warning(f"To enable HTTPS, run: openssl req -x509 -newkey rsa:4096 -nodes -out cert.pem -keyout key.pem -days 365")
-
-    uvicorn.run(
-        app,
-        host=API_HOST,
-        port=API_PORT,
-        # Allow enough threads to serve 400+ concurrent sync handlers
-        # without queuing behind the default anyio limit of 40.
-        limit_concurrency=500,
-        ssl_keyfile=key_file if use_ssl else None,
-        ssl_certfile=cert_file if use_ssl else None,
-    )
+    # Workers import api_server themselves and build their own pools, so
+    # release the one this supervisor process opened at import time.
+    _db.shutdown()
+    import run_api_server
+    run_api_server.main()
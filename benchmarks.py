@@ -0,0 +1,344 @@
+"""
+benchmarks.py — In-process micro-benchmarks for API server hot paths.
+
+Usage:
+    python benchmarks.py middleware                 # BaseHTTPMiddleware vs raw ASGI
+    python benchmarks.py middleware --requests 20000 --concurrency 64
+    python benchmarks.py batch-cache                # per-item GET/SETEX vs MGET + pipeline
+    python benchmarks.py batch-cache --sizes 5 20 100 --rounds 500
+    python benchmarks.py execute-many --rows 600     # per-row loop vs multi-row VALUES (needs MySQL)
+    python benchmarks.py row-formats --month 2025-01 # dict vs tuple/row/columnar results (needs MySQL)
+
+Requests are driven straight through the ASGI app (no sockets), so the
+numbers isolate framework and middleware overhead from the network.
+Importing api_server needs the same environment as running it (.env, DB
+credentials); cache hits never touch MySQL.
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import threading
+import time
+
+
+def _report(name: str, latencies: list, elapsed: float) -> None:
+    latencies = sorted(latencies)
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(
+        f"  {name:<22} {len(latencies) / elapsed:>9.0f} req/s   "
+        f"mean {statistics.mean(latencies) * 1000:6.3f} ms   "
+        f"p50 {p50 * 1000:6.3f} ms   p99 {p99 * 1000:6.3f} ms"
+    )
+
+
+# ── middleware ────────────────────────────────────────────────────────────────
+
+def _legacy_app(api_server):
+    """The current routes behind the pre-ASGI BaseHTTPMiddleware tracker."""
+    import uuid
+    import datetime
+    import collections
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse
+    from starlette.middleware.base import BaseHTTPMiddleware
+
+    stats_lock = threading.Lock()
+    counters = collections.defaultdict(int)
+    errors = collections.defaultdict(int)
+
+    class LegacyTrackingMiddleware(BaseHTTPMiddleware):
+        async def dispatch(self, request: Request, call_next):
+            ip = request.client.host if request.client else "unknown"
+            if api_server._is_ip_blocked(ip):
+                return JSONResponse(status_code=403, content={"detail": "Forbidden"})
+            if api_server._bot_is_banned(ip):
+                return JSONResponse(status_code=429, content={"detail": "Too many requests"})
+            content_length = request.headers.get("content-length")
+            if content_length and int(content_length) > api_server._MAX_BODY_BYTES:
+                return JSONResponse(status_code=413, content={"detail": "Request body too large (max 1 MB)"})
+
+            req_id = request.headers.get("X-Request-ID") or str(uuid.uuid4())
+            request.state.request_id = req_id
+            start = datetime.datetime.utcnow()
+            response = await call_next(request)
+            ms = int((datetime.datetime.utcnow() - start).total_seconds() * 1000)
+            response.headers["X-Request-ID"] = req_id
+
+            endpoint = request.url.path
+            is_error = response.status_code >= 400
+            api_server.access_log.info(
+                f"rid={req_id} method={request.method} path={endpoint} "
+                f"status={response.status_code} ms={ms} ip={ip}"
+            )
+            with stats_lock:
+                counters[endpoint] += 1
+                if is_error:
+                    errors[endpoint] += 1
+                api_server._recent.append({
+                    "request_id": req_id,
+                    "time":       start.strftime("%Y-%m-%d %H:%M:%S"),
+                    "method":     request.method,
+                    "path":       endpoint,
+                    "status":     response.status_code,
+                    "ms":         ms,
+                    "ip":         ip,
+                })
+            return response
+
+    legacy = FastAPI()
+    legacy.router.routes.extend(api_server.app.router.routes)
+    legacy.exception_handlers.update(api_server.app.exception_handlers)
+    legacy.add_middleware(LegacyTrackingMiddleware)
+    return legacy
+
+
+async def _drive(app, body: bytes, headers: list, requests: int, concurrency: int):
+    """POST ``body`` to /api/exec ``requests`` times; returns (latencies, elapsed)."""
+    latencies = []
+    remaining = [requests]
+
+    async def one():
+        sent = False
+
+        async def receive():
+            nonlocal sent
+            if sent:
+                return {"type": "http.disconnect"}
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        status = []
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                status.append(message["status"])
+
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": "POST", "scheme": "http", "path": "/api/exec", "raw_path": b"/api/exec",
+            "root_path": "", "query_string": b"", "headers": headers,
+            "client": ("127.0.0.1", 50000), "server": ("127.0.0.1", 5000),
+        }
+        start = time.perf_counter()
+        await app(scope, receive, send)
+        latencies.append(time.perf_counter() - start)
+        if status[0] != 200:
+            raise RuntimeError(f"/api/exec returned {status[0]}")
+
+    async def worker():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            await one()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - start
+
+
+def bench_middleware(args) -> None:
+    import logging
+    import api_server
+
+    logging.getLogger("api_server").setLevel(logging.WARNING)
+
+    sql = "SELECT id, name FROM corporations ORDER BY name"
+    api_server._cache_set(
+        api_server._make_cache_key(sql, None),
+        [{"id": i, "name": f"Corporation {i}"} for i in range(20)],
+        ttl=3600,
+    )
+    body = json.dumps({"sql": sql}).encode()
+    headers = [
+        (b"host", b"localhost"),
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+        (b"authorization", f"Bearer {api_server._make_token()}".encode()),
+    ]
+
+    apps = (
+        ("BaseHTTPMiddleware", _legacy_app(api_server)),
+        ("raw ASGI", api_server.app),
+    )
+    print(f"/api/exec cache hit — {args.requests} requests, concurrency {args.concurrency}")
+    for name, app in apps:
+        # Warm routing, dependency and serializer caches before timing
+        asyncio.run(_drive(app, body, headers, min(500, args.requests), args.concurrency))
+        latencies, elapsed = asyncio.run(
+            _drive(app, body, headers, args.requests, args.concurrency)
+        )
+        _report(name, latencies, elapsed)
+
+
+# ── batch-cache ───────────────────────────────────────────────────────────────
+
+def bench_batch_cache(args) -> None:
+    """Cache round trips of one /api/batch: a lookup for every item and a
+    write-back of every miss, item by item vs batched."""
+    import logging
+    import api_server
+
+    logging.getLogger("api_server").setLevel(logging.WARNING)
+    backend = "redis" if api_server._redis_ok else "memory (Redis unavailable)"
+    row = [{"id": i, "name": f"Branch {i}", "corporation_id": i % 7} for i in range(25)]
+
+    print(f"batch cache lookups + write-back — backend {backend}, {args.rounds} rounds")
+    for size in args.sizes:
+        for name in ("per-item", "mget + pipeline"):
+            latencies = []
+            for r in range(args.rounds):
+                # Half the keys are warm, half miss and are written back
+                keys = [api_server._make_cache_key(f"SELECT {name} {size} {r} {i}", None)
+                        for i in range(size)]
+                for key in keys[::2]:
+                    api_server._cache_set(key, row, ttl=60)
+                t0 = time.perf_counter()
+                if name == "per-item":
+                    for key in keys:
+                        hit, _ = api_server._cache_get(key)
+                        if not hit:
+                            api_server._cache_set(key, row, ttl=60)
+                else:
+                    found = api_server._cache_get_many(keys)
+                    api_server._cache_set_many(
+                        [(key, row, 60, 0, None) for key, (hit, _) in zip(keys, found) if not hit]
+                    )
+                latencies.append(time.perf_counter() - t0)
+            _report(f"{size:>3} items {name}", latencies, sum(latencies))
+
+
+# ── execute-many ──────────────────────────────────────────────────────────────
+
+_BULK_TABLE = "ors_bench_bulk"
+_BULK_UPSERT = (
+    f"INSERT INTO {_BULK_TABLE} (id, branch, amount, note) VALUES (%s, %s, %s, %s) "
+    "ON DUPLICATE KEY UPDATE amount = VALUES(amount), note = VALUES(note)"
+)
+
+
+def _legacy_execute_many(db, query: str, params_list: list, chunk_size: int = 100) -> int:
+    """The pre-bulk execute_many: one execute per row, commit per chunk."""
+    from sqlalchemy import text
+
+    modified_query, _ = db._prepare_params(query, tuple(range(query.count("%s"))))
+    total = 0
+    with db.engine.connect() as conn:
+        for i in range(0, len(params_list), chunk_size):
+            for params in params_list[i:i + chunk_size]:
+                result = conn.execute(text(modified_query), {f"param{j}": v for j, v in enumerate(params)})
+                total += result.rowcount
+            conn.commit()
+    return total
+
+
+def bench_execute_many(args) -> None:
+    from db_connect_pooled import DatabaseManagerPooled
+
+    db = DatabaseManagerPooled(idle_timeout=0)
+    if not db.connect():
+        print("MySQL connection failed (see config.py / .env)")
+        return
+    db.execute_query(
+        f"CREATE TABLE IF NOT EXISTS {_BULK_TABLE} ("
+        "id INT PRIMARY KEY, branch VARCHAR(100), amount DECIMAL(14,2), note VARCHAR(255))"
+    )
+    try:
+        print(f"{args.rows}-row upsert into {_BULK_TABLE}, {args.rounds} rounds")
+        for name, run in (
+            ("per-row loop", lambda rows: _legacy_execute_many(db, _BULK_UPSERT, rows)),
+            ("multi-row VALUES", lambda rows: db.execute_many(_BULK_UPSERT, rows)),
+        ):
+            latencies = []
+            for r in range(args.rounds):
+                db.execute_query(f"DELETE FROM {_BULK_TABLE}")
+                rows = [(i, f"Branch {i % 97}", round(i * 1.25 + r, 2), f"round {r}") for i in range(args.rows)]
+                t0 = time.perf_counter()
+                run(rows)   # inserts
+                run(rows)   # and the same rows again as updates
+                latencies.append(time.perf_counter() - t0)
+            _report(name, latencies, sum(latencies))
+    finally:
+        db.execute_query(f"DROP TABLE IF EXISTS {_BULK_TABLE}")
+        db.shutdown()
+
+
+# ── row-formats ───────────────────────────────────────────────────────────────
+
+def bench_row_formats(args) -> None:
+    import datetime
+    import gc
+    import tracemalloc
+    from db_connect_pooled import DatabaseManagerPooled
+    from row_formats import ROW_FORMATS
+
+    db = DatabaseManagerPooled(idle_timeout=0)
+    if not db.connect():
+        print("MySQL connection failed (see config.py / .env)")
+        return
+    first = datetime.date.fromisoformat(f"{args.month}-01")
+    last = (first.replace(day=28) + datetime.timedelta(days=4)).replace(day=1) - datetime.timedelta(days=1)
+    query = f"SELECT * FROM {args.table} WHERE date BETWEEN %s AND %s"
+    params = (first.isoformat(), last.isoformat())
+    try:
+        probe = db.execute_query(query, params, row_format="tuple")
+        if not probe:
+            print(f"No {args.table} rows for {args.month}")
+            return
+        print(f"{args.table} {args.month}: {len(probe)} rows x {len(probe.columns)} columns, {args.rounds} rounds")
+        del probe
+        for row_format in ROW_FORMATS:
+            latencies = []
+            for _ in range(args.rounds):
+                t0 = time.perf_counter()
+                db.execute_query(query, params, row_format=row_format)
+                latencies.append(time.perf_counter() - t0)
+            # Memory the result keeps alive once built
+            gc.collect()
+            tracemalloc.start()
+            base = tracemalloc.get_traced_memory()[0]
+            result = db.execute_query(query, params, row_format=row_format)
+            held = tracemalloc.get_traced_memory()[0] - base
+            tracemalloc.stop()
+            del result
+            print(f"  {row_format:<9} mean {statistics.mean(latencies) * 1000:8.1f} ms   "
+                  f"min {min(latencies) * 1000:8.1f} ms   held {held / (1024 * 1024):7.2f} MB")
+    finally:
+        db.shutdown()
+
+
+# ── CLI ───────────────────────────────────────────────────────────────────────
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="ORS API micro-benchmarks")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("middleware", help="tracking middleware overhead on /api/exec cache hits")
+    p.add_argument("--requests", type=int, default=10000)
+    p.add_argument("--concurrency", type=int, default=32)
+    p.set_defaults(func=bench_middleware)
+
+    p = sub.add_parser("batch-cache", help="per-item cache calls vs MGET + pipelined SETEX")
+    p.add_argument("--sizes", type=int, nargs="+", default=[5, 20, 50])
+    p.add_argument("--rounds", type=int, default=200)
+    p.set_defaults(func=bench_batch_cache)
+
+    p = sub.add_parser("execute-many", help="DatabaseManagerPooled.execute_many: per-row loop vs bulk")
+    p.add_argument("--rows", type=int, default=600)
+    p.add_argument("--rounds", type=int, default=5)
+    p.set_defaults(func=bench_execute_many)
+
+    p = sub.add_parser("row-formats", help="execute_query row_format: time and memory per result shape")
+    p.add_argument("--table", default="daily_reports_brand_a")
+    p.add_argument("--month", default=time.strftime("%Y-%m"), help="YYYY-MM")
+    p.add_argument("--rounds", type=int, default=5)
+    p.set_defaults(func=bench_row_formats)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
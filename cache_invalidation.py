@@ -0,0 +1,218 @@
+"""
+Client-side listener for the API server's cache invalidation stream.
+
+Desktop caches register the tables (or schema changes) they depend on; a
+background thread long-polls /api/invalidations and calls each cache's
+clear function the moment a matching write lands on the server.  While the
+listener is live, caches may hold entries for hours (see ``cache_ttl``);
+when it is not (direct-DB mode, server unreachable, or a server whose
+workers don't share one stream through Redis and so each see only their
+own writes) they fall back to their normal short TTLs.
+
+Usage:
+    from cache_invalidation import register_invalidation, cache_ttl
+
+    register_invalidation(refresh_field_config_cache, tables=("field_config",))
+    register_invalidation(refresh_schema_cache, namespaces=("schema",))
+
+    if now - cached_at < cache_ttl(300): ...
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Callable, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# TTL used by registered caches while the stream is live
+LIVE_CACHE_TTL = int(os.environ.get("ORS_INVALIDATED_CACHE_TTL", str(4 * 3600)))
+_POLL_WAIT     = 20    # seconds the server may hold each poll
+_RETRY_DELAY   = 15    # seconds between reconnect attempts
+
+
+class InvalidationSubscriber:
+    """Long-polls /api/invalidations and dispatches events to registered caches."""
+
+    def __init__(self, base_url: str, api_key: str):
+        import requests as _requests
+        self.base_url = base_url.rstrip("/")
+        self.api_key  = api_key
+        self._session = _requests.Session()
+        self._session.verify = False   # self-signed server certificate (see Client/api_db_manager.py)
+        self._token   = None
+        self._since   = 0
+        self._epoch   = None
+        self._live    = False
+        self._shared  = None    # server reports one stream across all its workers
+        self._started = False
+        self._lock    = threading.Lock()
+        self._listeners = []   # (callback, tables frozenset|None, namespaces frozenset)
+
+    # ── Registration ──────────────────────────────────────────────────────
+
+    def register(
+        self,
+        callback: Callable[[dict], None],
+        tables: Optional[Iterable[str]] = None,
+        namespaces: Iterable[str] = ("table", "schema"),
+    ) -> None:
+        """Call ``callback(event)`` for events on ``tables`` (any table if None).
+
+        Full resets ("all" events, missed events) always reach every listener.
+        """
+        entry = (
+            callback,
+            frozenset(t.lower() for t in tables) if tables else None,
+            frozenset(namespaces),
+        )
+        with self._lock:
+            self._listeners.append(entry)
+
+    @property
+    def is_live(self) -> bool:
+        """Connected to a stream that carries every worker's writes."""
+        return self._live and self._shared
+
+    # ── Polling ───────────────────────────────────────────────────────────
+
+    def start(self) -> None:
+        if self._started:
+            return
+        self._started = True
+        threading.Thread(target=self._run, daemon=True, name="CacheInvalidation").start()
+
+    def _refresh_token(self) -> bool:
+        try:
+            resp = self._session.post(
+                f"{self.base_url}/api/token", json={"api_key": self.api_key}, timeout=(5, 15)
+            )
+            if resp.status_code == 200:
+                self._token = resp.json()["token"]
+                self._session.headers["Authorization"] = f"Bearer {self._token}"
+                return True
+            logger.warning("Invalidation token request failed: %s", resp.status_code)
+        except Exception as exc:
+            logger.debug("Invalidation token error: %s", exc)
+        return False
+
+    def _poll_once(self) -> bool:
+        if not self._token and not self._refresh_token():
+            return False
+        params = {"since": self._since, "wait": _POLL_WAIT}
+        if self._epoch:
+            params["epoch"] = self._epoch
+        resp = self._session.get(
+            f"{self.base_url}/api/invalidations", params=params, timeout=(5, _POLL_WAIT + 15)
+        )
+        if resp.status_code == 401:
+            self._token = None
+            return self._refresh_token()
+        if resp.status_code != 200:
+            logger.debug("Invalidation poll returned %s", resp.status_code)
+            return False
+
+        data = resp.json()
+        if data.get("reset"):
+            self._dispatch({"ns": "all", "tables": []})
+        for event in data.get("events", []):
+            self._dispatch(event)
+        self._epoch = data.get("epoch")
+        self._since = data.get("seq", self._since)
+        shared = bool(data.get("shared"))   # absent on older servers: assume per-worker
+        if shared != self._shared:
+            self._shared = shared
+            if not shared:
+                logger.info("Cache invalidation stream is per-worker on the server — keeping short cache TTLs")
+        return True
+
+    def _run(self) -> None:
+        while True:
+            try:
+                ok = self._poll_once()
+            except Exception as exc:
+                logger.debug("Invalidation poll error: %s", exc)
+                ok = False
+            if not ok:
+                if self._live:
+                    logger.warning("Cache invalidation stream lost — using short cache TTLs")
+                    # We may have missed events while disconnected
+                    self._dispatch({"ns": "all", "tables": []})
+                self._live = False
+                time.sleep(_RETRY_DELAY)
+            elif not self._live:
+                self._live = True
+                logger.info("Cache invalidation stream connected (%s)", self.base_url)
+
+    def _dispatch(self, event: dict) -> None:
+        ns = event.get("ns")
+        tables = {t.lower() for t in event.get("tables") or []}
+        with self._lock:
+            listeners = list(self._listeners)
+        for callback, wanted_tables, namespaces in listeners:
+            if ns != "all":
+                if ns not in namespaces:
+                    continue
+                if wanted_tables is not None and not (tables & wanted_tables):
+                    continue
+            try:
+                callback(event)
+            except Exception as exc:
+                logger.error("Invalidation callback %r failed: %s", callback, exc)
+
+
+# ── Shared singleton ──────────────────────────────────────────────────────────
+
+_subscriber: Optional[InvalidationSubscriber] = None
+_pending = []   # registrations made before the subscriber exists
+_singleton_lock = threading.Lock()
+
+
+def _create_subscriber() -> Optional[InvalidationSubscriber]:
+    try:
+        from api_config import API_MODE, API_URL, API_KEY
+    except ImportError:
+        return None
+    if not API_MODE:
+        return None
+    return InvalidationSubscriber(API_URL, API_KEY)
+
+
+def register_invalidation(
+    callback: Callable[[dict], None],
+    tables: Optional[Iterable[str]] = None,
+    namespaces: Iterable[str] = ("table", "schema"),
+) -> None:
+    """Register a cache-clear callback with the shared subscriber.
+
+    Safe to call at import time; the network thread only starts once
+    ``start_invalidation_listener`` is called.
+    """
+    with _singleton_lock:
+        if _subscriber is None:
+            _pending.append((callback, tables, namespaces))
+            return
+    _subscriber.register(callback, tables=tables, namespaces=namespaces)
+
+
+def start_invalidation_listener() -> bool:
+    """Start the shared subscriber (API mode only).  Returns True if running."""
+    global _subscriber
+    with _singleton_lock:
+        if _subscriber is None:
+            _subscriber = _create_subscriber()
+            if _subscriber is None:
+                return False
+            for callback, tables, namespaces in _pending:
+                _subscriber.register(callback, tables=tables, namespaces=namespaces)
+            _pending.clear()
+    _subscriber.start()
+    return True
+
+
+def cache_ttl(default: float) -> float:
+    """TTL for a registered cache: long while the stream is live, else ``default``."""
+    if _subscriber is not None and _subscriber.is_live:
+        return max(default, LIVE_CACHE_TTL)
+    return default
@@ -0,0 +1,246 @@
+"""
+Server-side cache policy for the API server's query cache.
+
+``cache_policy.json`` maps tables and query fingerprints to how their
+SELECT results are cached:
+
+    {
+      "default":      {"max_bytes": 1048576},
+      "tables":       {"corporations": {"ttl": 600, "swr": 300},
+                       "audit_log":    {"no_cache": true}},
+      "fingerprints": {"3f9c0e6a1b2d4c57": {"ttl": 5, "max_bytes": 262144}}
+    }
+
+Rule fields, all optional:
+  * ``ttl``       — seconds a result stays fresh
+  * ``swr``       — stale-while-revalidate: seconds past ``ttl`` a stale
+                    result is still served while it is refreshed behind
+  * ``max_bytes`` — results larger than this (JSON) are not cached
+  * ``no_cache``  — never cache
+
+A fingerprint rule wins over table rules.  A query reading several tables
+with rules gets the most conservative combination: the shortest TTL and SWR,
+the smallest size cap, and no caching if any table says so.  TTL and SWR
+apply only when the client sends no ``ttl`` of its own; ``no_cache`` and
+``max_bytes`` always apply.  Without a ``ttl`` from any rule the server's
+``ORS_CACHE_TTL`` is used.
+
+The fingerprint of a statement is its SQL with comments dropped, literals
+replaced by ``?`` and whitespace collapsed, hashed; print one with
+``python cache_policy.py "SELECT ..."``.
+
+The file is re-read when its modification time changes (checked every
+``ORS_CACHE_POLICY_POLL`` seconds) or on ``POST /api/cache/policy/reload``;
+a file that fails to parse leaves the previous policy in force.
+"""
+
+import functools
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional
+
+from sql_classifier import classify
+
+POLICY_FILE = os.environ.get(
+    "ORS_CACHE_POLICY",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache_policy.json"),
+)
+POLL_SECS = float(os.environ.get("ORS_CACHE_POLICY_POLL", "5"))   # 0 = no file watching
+
+logger = logging.getLogger(__name__)
+
+_RULE_FIELDS = ("ttl", "swr", "max_bytes", "no_cache")
+_RESOLVED_MAX = 4096   # statements whose rule is memoized
+
+
+class CacheRule(NamedTuple):
+    ttl: Optional[int]          # None = the client's TTL or the server default
+    swr: int
+    max_bytes: Optional[int]
+    no_cache: bool
+    source: str                 # "fingerprint:…", "table:…", or "default"
+
+
+# ── Fingerprints ──────────────────────────────────────────────────────────────
+
+_NORMALIZE_RE = re.compile(r"""
+    (?P<comment> --[^\n]* | \#[^\n]* | /\*(?!!).*?\*/ )
+  | (?P<literal> '(?:[^'\\]|\\.|'')*' | "(?:[^"\\]|\\.|"")*" | \b\d[\w.]* )
+  | (?P<space> \s+ )
+""", re.X | re.S)
+
+
+def _normalize_match(m) -> str:
+    if m.lastgroup == "literal":
+        return "?"
+    return " "
+
+
+@functools.lru_cache(maxsize=4096)
+def fingerprint(sql: str) -> str:
+    """Stable 16-hex-digit ID of a statement's shape (literals and layout ignored)."""
+    shape = _NORMALIZE_RE.sub(_normalize_match, sql).strip().lower().replace("%s", "?")
+    return hashlib.blake2b(shape.encode(), digest_size=8).hexdigest()
+
+
+# ── Policy ────────────────────────────────────────────────────────────────────
+
+def _rule(raw: dict, where: str) -> dict:
+    unknown = set(raw) - set(_RULE_FIELDS)
+    if unknown:
+        raise ValueError(f"{where}: unknown field(s) {', '.join(sorted(unknown))}")
+    rule = {}
+    for field in ("ttl", "swr", "max_bytes"):
+        if field in raw:
+            value = raw[field]
+            if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+                raise ValueError(f"{where}: {field} must be a non-negative integer")
+            rule[field] = value
+    if "no_cache" in raw:
+        rule["no_cache"] = bool(raw["no_cache"])
+    return rule
+
+
+class CachePolicy:
+    """The loaded policy file, resolved per statement and reloadable."""
+
+    def __init__(self, path: str = POLICY_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._default: dict = {}
+        self._tables: Dict[str, dict] = {}
+        self._fingerprints: Dict[str, dict] = {}
+        self._generation = 0
+        self._mtime: Optional[float] = None
+        self._loaded_at: Optional[float] = None
+        self._last_error: Optional[str] = None
+        self._applied: Dict[str, int] = {}
+        self._resolved: "OrderedDict[str, CacheRule]" = OrderedDict()   # sql -> rule, LRU
+        self._watcher_started = False
+
+    def load(self) -> bool:
+        """(Re)read the policy file; returns False and keeps the old policy on error."""
+        try:
+            mtime = os.path.getmtime(self.path)
+            with open(self.path, encoding="utf-8") as f:
+                raw = json.load(f)
+            default = _rule(raw.get("default", {}), "default")
+            tables = {name.lower(): _rule(r, f"tables.{name}") for name, r in raw.get("tables", {}).items()}
+            fingerprints = {fp.lower(): _rule(r, f"fingerprints.{fp}")
+                            for fp, r in raw.get("fingerprints", {}).items()}
+        except FileNotFoundError:
+            mtime, default, tables, fingerprints = None, {}, {}, {}
+        except (OSError, ValueError, AttributeError) as e:
+            with self._lock:
+                self._last_error = str(e)
+            logger.error(f"Cache policy {self.path} not loaded: {e}")
+            return False
+        with self._lock:
+            self._default, self._tables, self._fingerprints = default, tables, fingerprints
+            self._mtime = mtime
+            self._loaded_at = time.time()
+            self._last_error = None
+            self._generation += 1
+            self._applied = {}
+            self._resolved.clear()
+        logger.info(f"Cache policy loaded: {len(tables)} table rule(s), {len(fingerprints)} fingerprint rule(s)")
+        return True
+
+    def start_watcher(self, interval: float = POLL_SECS) -> None:
+        """Reload whenever the file's modification time changes."""
+        if interval <= 0 or self._watcher_started:
+            return
+        self._watcher_started = True
+
+        def watch():
+            while True:
+                time.sleep(interval)
+                try:
+                    mtime = os.path.getmtime(self.path)
+                except OSError:
+                    mtime = None
+                if mtime != self._mtime:
+                    self.load()
+
+        threading.Thread(target=watch, daemon=True, name="ors-cache-policy").start()
+
+    def resolve(self, sql: str) -> CacheRule:
+        """The rule for a SELECT (memoized until the next reload)."""
+        with self._lock:
+            rule = self._resolved.get(sql)
+            if rule is not None:
+                self._resolved.move_to_end(sql)
+            generation = self._generation
+            default, tables, fingerprints = self._default, self._tables, self._fingerprints
+        if rule is None:
+            rule = self._resolve(sql, default, tables, fingerprints)
+        with self._lock:
+            if generation == self._generation:   # not superseded by a reload meanwhile
+                self._resolved[sql] = rule
+                if len(self._resolved) > _RESOLVED_MAX:
+                    self._resolved.popitem(last=False)
+            self._applied[rule.source] = self._applied.get(rule.source, 0) + 1
+        return rule
+
+    @staticmethod
+    def _resolve(sql: str, default: dict, tables: Dict[str, dict], fingerprints: Dict[str, dict]) -> CacheRule:
+        fp = fingerprint(sql)
+        if fp in fingerprints:
+            r = dict(default, **fingerprints[fp])
+            return CacheRule(r.get("ttl"), r.get("swr", 0), r.get("max_bytes"), r.get("no_cache", False),
+                             f"fingerprint:{fp}")
+
+        matched = []
+        for name in classify(sql).tables:
+            key = name.lower()
+            rule = tables.get(key) or tables.get(key.rsplit(".", 1)[-1])
+            if rule is not None:
+                matched.append((name, rule))
+        if not matched:
+            return CacheRule(default.get("ttl"), default.get("swr", 0), default.get("max_bytes"),
+                             default.get("no_cache", False), "default")
+
+        def smallest(field):
+            # A table rule without the field falls back to the default's value
+            fallback = default.get(field, 0 if field == "swr" else None)
+            values = [r.get(field, fallback) for _, r in matched]
+            values = [v for v in values if v is not None]
+            return min(values) if values else None
+
+        return CacheRule(
+            smallest("ttl"),
+            smallest("swr") or 0,
+            smallest("max_bytes"),
+            any(r.get("no_cache", False) for _, r in matched) or default.get("no_cache", False),
+            "table:" + ",".join(name for name, _ in matched),
+        )
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "path":         self.path,
+                "generation":   self._generation,
+                "loaded_at":    time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(self._loaded_at))
+                                if self._loaded_at else None,
+                "last_error":   self._last_error,
+                "default":      self._default,
+                "tables":       self._tables,
+                "fingerprints": self._fingerprints,
+                "applied":      dict(sorted(self._applied.items(), key=lambda kv: -kv[1])[:50]),
+            }
+
+
+# Global instance
+cache_policy = CachePolicy()
+
+
+if __name__ == "__main__":
+    for statement in sys.argv[1:]:
+        print(fingerprint(statement.strip()), statement.strip()[:80])
@@ -0,0 +1,223 @@
+"""
+Per-client cost accounting and quotas for the API server.
+
+A client is the remote IP plus the optional ``X-ORS-User`` and
+``X-ORS-Branch`` headers the desktop apps send (see
+``set_client_identity`` on the DB managers).  For each client we keep
+running totals of requests, DB milliseconds, rows read, response bytes and
+cache hits, plus the same figures for the current quota window.
+
+Quotas are optional and cost-based: when ``ORS_QUOTA_DB_MS``,
+``ORS_QUOTA_ROWS`` or ``ORS_QUOTA_BYTES`` is set, a remote IP that has
+spent that much within ``ORS_QUOTA_WINDOW_SECS`` is refused until the
+window rolls over.  Quotas are enforced per IP, never per header: the
+user and branch headers are set by the client, so they are only used to
+break the figures down in reports.  They complement the per-IP request
+rate limit: that one stops floods of cheap requests, this one stops a few
+very expensive ones.
+
+Figures are per worker process and reset on restart.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+QUOTA_WINDOW_SECS = int(os.environ.get("ORS_QUOTA_WINDOW_SECS", "60"))
+QUOTA_DB_MS       = float(os.environ.get("ORS_QUOTA_DB_MS", "0"))   # 0 = no quota
+QUOTA_ROWS        = int(os.environ.get("ORS_QUOTA_ROWS", "0"))
+QUOTA_BYTES       = int(os.environ.get("ORS_QUOTA_BYTES", "0"))
+MAX_CLIENTS       = int(os.environ.get("ORS_ACCOUNTING_MAX_CLIENTS", "5000"))
+
+_IDENTITY_MAX_LEN = 64
+_METRICS = ("requests", "db_ms", "rows", "bytes_out", "cache_hits", "errors")
+
+ClientKey = Tuple[str, str, str]   # (ip, user, branch)
+
+
+def client_key(ip: str, user: Optional[str] = None, branch: Optional[str] = None) -> ClientKey:
+    """Normalise an identity into the accounting key."""
+    return (
+        ip or "unknown",
+        (user or "").strip()[:_IDENTITY_MAX_LEN],
+        (branch or "").strip()[:_IDENTITY_MAX_LEN],
+    )
+
+
+class _Usage:
+    __slots__ = _METRICS + ("first_seen", "last_seen", "throttled")
+
+    def __init__(self, now: float):
+        for name in _METRICS:
+            setattr(self, name, 0)
+        self.first_seen = self.last_seen = now
+        self.throttled = 0
+
+
+class _Window:
+    """Spend of one remote IP in the current quota window."""
+    __slots__ = ("window_start", "window_db_ms", "window_rows", "window_bytes")
+
+    def __init__(self, now: float):
+        self.window_start = now
+        self.window_db_ms = 0.0
+        self.window_rows = 0
+        self.window_bytes = 0
+
+    def roll(self, now: float) -> None:
+        if now - self.window_start >= QUOTA_WINDOW_SECS:
+            self.window_start = now
+            self.window_db_ms = 0.0
+            self.window_rows = 0
+            self.window_bytes = 0
+
+
+class ClientAccounting:
+    """Thread-safe usage totals and quota windows per client."""
+
+    def __init__(self, max_clients: int = MAX_CLIENTS):
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        # Both kept in least-recently-seen order, so eviction pops the front
+        self._clients: "OrderedDict[ClientKey, _Usage]" = OrderedDict()
+        self._windows: "OrderedDict[str, _Window]" = OrderedDict()
+
+    def _touch(self, table: OrderedDict, key, factory, now: float):
+        """Caller holds self._lock."""
+        entry = table.get(key)
+        if entry is None:
+            while len(table) >= self.max_clients:
+                table.popitem(last=False)
+            entry = table[key] = factory(now)
+        else:
+            table.move_to_end(key)
+        return entry
+
+    def _usage(self, key: ClientKey, now: float) -> _Usage:
+        """Caller holds self._lock."""
+        usage = self._touch(self._clients, key, _Usage, now)
+        usage.last_seen = now
+        return usage
+
+    def _window(self, ip: str, now: float) -> _Window:
+        """Caller holds self._lock."""
+        window = self._touch(self._windows, ip, _Window, now)
+        window.roll(now)
+        return window
+
+    def record(
+        self,
+        key: ClientKey,
+        requests: int = 0,
+        db_ms: float = 0.0,
+        rows: int = 0,
+        bytes_out: int = 0,
+        cache_hits: int = 0,
+        errors: int = 0,
+    ) -> None:
+        now = time.time()
+        with self._lock:
+            usage = self._usage(key, now)
+            usage.requests += requests
+            usage.db_ms += db_ms
+            usage.rows += rows
+            usage.bytes_out += bytes_out
+            usage.cache_hits += cache_hits
+            usage.errors += errors
+            window = self._window(key[0], now)
+            window.window_db_ms += db_ms
+            window.window_rows += rows
+            window.window_bytes += bytes_out
+
+    def check_quota(self, key: ClientKey) -> Optional[Tuple[str, int]]:
+        """Return ``(exceeded metric, seconds until reset)`` or None if within quota.
+
+        The quota is that of ``key``'s remote IP, whatever headers it sent.
+        """
+        if not (QUOTA_DB_MS or QUOTA_ROWS or QUOTA_BYTES):
+            return None
+        now = time.time()
+        with self._lock:
+            window = self._windows.get(key[0])
+            if window is None:
+                return None
+            window.roll(now)
+            exceeded = None
+            if QUOTA_DB_MS and window.window_db_ms >= QUOTA_DB_MS:
+                exceeded = "db_ms"
+            elif QUOTA_ROWS and window.window_rows >= QUOTA_ROWS:
+                exceeded = "rows"
+            elif QUOTA_BYTES and window.window_bytes >= QUOTA_BYTES:
+                exceeded = "bytes"
+            if exceeded is None:
+                return None
+            usage = self._clients.get(key)
+            if usage is not None:
+                usage.throttled += 1
+            return exceeded, max(1, int(window.window_start + QUOTA_WINDOW_SECS - now))
+
+    def top(self, by: str = "db_ms", limit: int = 20, group_by: str = "client") -> List[dict]:
+        """Heaviest consumers by ``by``, optionally rolled up by ip, user or branch."""
+        if by not in _METRICS:
+            raise ValueError(f"unknown metric {by!r}")
+        with self._lock:
+            snapshot = [(key, usage) for key, usage in self._clients.items()]
+            groups: Dict[tuple, dict] = {}
+            for (ip, user, branch), usage in snapshot:
+                group = {
+                    "client": (ip, user, branch),
+                    "ip":     (ip,),
+                    "user":   (user,),
+                    "branch": (branch,),
+                }[group_by]
+                row = groups.get(group)
+                if row is None:
+                    row = groups[group] = dict(zip(("ip", "user", "branch"), (ip, user, branch)),
+                                               **{m: 0 for m in _METRICS},
+                                               first_seen=usage.first_seen, last_seen=usage.last_seen,
+                                               throttled=0, clients=0)
+                for m in _METRICS:
+                    row[m] += getattr(usage, m)
+                row["throttled"] += usage.throttled
+                row["clients"] += 1
+                row["first_seen"] = min(row["first_seen"], usage.first_seen)
+                row["last_seen"] = max(row["last_seen"], usage.last_seen)
+
+        rows = sorted(groups.values(), key=lambda r: r[by], reverse=True)[:limit]
+        for row in rows:
+            row["db_ms"] = round(row["db_ms"], 1)
+            if group_by != "client":
+                # Identity columns other than the grouping one are mixed
+                for col in ("ip", "user", "branch"):
+                    if col != group_by:
+                        row.pop(col)
+            hours = max((row["last_seen"] - row["first_seen"]) / 3600, 1 / 60)
+            row["db_ms_per_hour"] = round(row["db_ms"] / hours, 1)
+            row["first_seen"] = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(row["first_seen"]))
+            row["last_seen"] = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(row["last_seen"]))
+        return rows
+
+    def summary(self) -> dict:
+        with self._lock:
+            totals = {m: 0 for m in _METRICS}
+            for usage in self._clients.values():
+                for m in _METRICS:
+                    totals[m] += getattr(usage, m)
+            tracked = len(self._clients)
+        totals["db_ms"] = round(totals["db_ms"], 1)
+        return {
+            "tracked_clients": tracked,
+            "totals":          totals,
+            "quota": {
+                "window_secs": QUOTA_WINDOW_SECS,
+                "db_ms":       QUOTA_DB_MS or None,
+                "rows":        QUOTA_ROWS or None,
+                "bytes":       QUOTA_BYTES or None,
+            },
+        }
+
+
+# Global instance
+client_accounting = ClientAccounting()
@@ -12,58 +12,14 @@ import logging
 
 logger = logging.getLogger(__name__)
 from date_range_widget import DateRangeWidget
+from schema_catalog import schema_catalog
 import datetime
 import json
 import os
 
 
-_db_columns_cache = {}  
-_db_cache_time = 0
-_DB_CACHE_TTL = 300  
-
-
 def _get_table_columns(table_name: str) -> set:
-
-    global _db_columns_cache, _db_cache_time
-    import time
-    
-    current_time = time.time()
-    
-
-    if table_name in _db_columns_cache and (current_time - _db_cache_time) < _DB_CACHE_TTL:
-        return _db_columns_cache[table_name]
-    
-    try:
-
-        result = db_manager.execute_query(
-            f"SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = %s AND TABLE_SCHEMA = DATABASE()",
-            (table_name,)
-        )
-        if result and isinstance(result, (list, tuple)):
-            columns = set()
-            for row in result:
-        
-                if isinstance(row, dict):
-                    col_name = row.get('COLUMN_NAME') or row.get('column_name') or ''
-                elif isinstance(row, (list, tuple)) and len(row) > 0:
-                    col_name = row[0]
-                else:
-                    col_name = ''
-                if col_name:
-                    columns.add(col_name)
-            if columns:
-                _db_columns_cache[table_name] = columns
-                _db_cache_time = current_time
-                logger.debug("Loaded %d columns from %s", len(columns), table_name)
-                return columns
-    except Exception as e:
-        logger.error("Error getting columns for %s: %s", table_name, e)
-    
-
-    if table_name in _db_columns_cache:
-        return _db_columns_cache[table_name]
-    
-    return set()
+    return schema_catalog.columns(table_name, db=db_manager)
 
 
 def _filter_column_groups(groups: list, table_name: str = "daily_reports_brand_a") -> list:
@@ -91,13 +47,6 @@ def _filter_column_groups(groups: list, table_name: str = "daily_reports_brand_a
     return filtered_groups
 
 
-def refresh_schema_cache():
-
-    global _db_columns_cache, _db_cache_time
-    _db_columns_cache = {}
-    _db_cache_time = 0
-
-
 def _load_dynamic_fields_for_report(report_type: str) -> list:
 
     dynamic_groups = []
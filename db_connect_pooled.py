@@ -1,15 +1,113 @@
 
 import os
 import time
+import collections
 import threading
 import logging
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
-from sqlalchemy import create_engine, text, pool
+from sqlalchemy import create_engine, text, pool, event, exc
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.engine import Engine
 from config import DB_CONFIG
-from functools import lru_cache
-from typing import List, Dict, Any, Optional, Tuple
+import tracing
+from sql_classifier import split_values
+from query_cache import query_cache
+from statement_capture import statement_capture
+from db_transaction import ScriptTransaction, TransactionError
+from row_formats import check_format, from_dicts, from_result
+from pool_telemetry import PoolTelemetry, AdaptivePoolSizer, ADAPTIVE as ADAPTIVE_POOL, POOL_MAX
+from contextlib import contextmanager
+from typing import List, Dict, Any, Iterator, NamedTuple, Optional, Tuple
+
+_FETCH_CHUNK = 1000   # rows per fetchmany() in fetch_capped
+_BULK_MAX_ROWS = 1000          # rows per execute_many chunk
+_DEFAULT_MAX_PACKET = 4 * 1024 * 1024   # used when @@max_allowed_packet can't be read
+_PING_IDLE_SECS = float(os.environ.get("ORS_POOL_PING_IDLE", "30"))   # ping pooled connections idle longer than this
+_RETRY_SAFE_WRITE_ERRORS = (2006,)      # server gone away: the statement never reached MySQL
+_REMOTE_BULK_BODY_BYTES = 512 * 1024    # JSON per /api/bulk request (server cap is 1 MB)
+_REMOTE_BULK_MAX_ROWS = 10000           # BulkRequest.rows max_items
+
+
+class BulkResult(NamedTuple):
+    rows: int                              # affected rows over all successful chunks
+    chunks: int
+    errors: List[Tuple[int, int, str]]     # (first row index, row count, error) per failed chunk
+
+
+def _bulk_chunks(params_list, row_len: int, budget: int, max_rows: int):
+    """Yield (start index, rows) runs whose rendered size stays within ``budget``."""
+    start, size = 0, 0
+    for i, params in enumerate(params_list):
+        # Rendered literal: value text plus quotes/escaping/separator slack
+        row_size = row_len + sum(len(str(v)) + 4 for v in params)
+        if i > start and (size + row_size > budget or i - start >= max_rows):
+            yield start, params_list[start:i]
+            start, size = i, 0
+        size += row_size
+    if start < len(params_list):
+        yield start, params_list[start:]
+
+
+def _multi_row_statement(split, rows) -> Tuple[str, Dict[str, Any]]:
+    """``head (row), (row), ... tail`` with one named bind per value."""
+    pieces = split.row.split("%s")
+    parts, binds = [split.head], {}
+    n = 0
+    for r, params in enumerate(rows):
+        if r:
+            parts.append(", ")
+        for piece, value in zip(pieces, params):
+            parts.append(f"{piece}:p{n}")
+            binds[f"p{n}"] = value
+            n += 1
+        parts.append(pieces[-1])
+    parts.append(split.tail)
+    return "".join(parts), binds
+
+
+def mysql_error_code(exc: Exception) -> Optional[int]:
+    """The MySQL error number behind a driver / SQLAlchemy exception, if any."""
+    args = getattr(getattr(exc, "orig", exc), "args", ())
+    return args[0] if args and isinstance(args[0], int) else None
+
+
+def _retry_safe(e: DBAPIError, is_select: bool) -> bool:
+    """Whether a statement that failed on a dropped connection can run again.
+
+    Reads always can.  A write only when MySQL never received it; after
+    "lost connection during query" (2013) it may already have been applied.
+    """
+    if not e.connection_invalidated:
+        return False
+    return is_select or mysql_error_code(e) in _RETRY_SAFE_WRITE_ERRORS
+
+
+class Transaction:
+    """Statements on one pooled connection, committed together (see db_transaction.py)."""
+
+    def __init__(self, manager: "DatabaseManagerPooled", conn):
+        self._manager = manager
+        self._conn = conn
+        self.statements = 0
+        self.failed: Optional[Exception] = None
+        self._writes: List[str] = []
+
+    def execute(self, query: str, params=None, row_format: str = "dict") -> Any:
+        """Rows for SELECT, else rowcount; raises on error (and dooms the transaction)."""
+        prepared_query, param_dict = self._manager._prepare_params(query, params)
+        self.statements += 1
+        try:
+            with tracing.span("db.execute"):
+                result = self._conn.execute(text(tracing.sql_comment() + prepared_query), param_dict)
+                if query.strip().upper().startswith("SELECT"):
+                    return from_result(result, row_format)
+                self._writes.append(query)
+                return result.rowcount
+        except Exception as e:
+            if self.failed is None:
+                self.failed = e
+            raise
 
 
 class DatabaseManagerPooled:
@@ -22,7 +120,12 @@ class DatabaseManagerPooled:
         self.lock = threading.Lock()
         self._is_disconnected_for_idle = False
         self._idle_monitor_started = False
-        
+        self._tx_local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._liveness = {"pings": 0, "ping_failures": 0, "checkouts_unpinged": 0, "disconnect_retries": 0}
+        self.pool_telemetry = PoolTelemetry()
+        self._pool_sizer = AdaptivePoolSizer(lambda: self.engine) if ADAPTIVE_POOL else None
+
         self.setup_logging()
         
         if not lazy_connect:
@@ -44,11 +147,12 @@ class DatabaseManagerPooled:
             self.engine = create_engine(
                 connection_string,
                 poolclass=pool.QueuePool,
-                pool_size=int(os.environ.get("ORS_POOL_SIZE",    "50")),   # 50 persistent connections
+                # 50 persistent connections (the adaptive sizer's maximum when enabled)
+                pool_size=POOL_MAX if self._pool_sizer else int(os.environ.get("ORS_POOL_SIZE", "50")),
                 max_overflow=int(os.environ.get("ORS_POOL_OVERFLOW", "150")),  # +150 burst connections (200 total)
                 pool_timeout=int(os.environ.get("ORS_POOL_TIMEOUT",  "30")),  # wait up to 30s for a slot
                 pool_recycle=1800,
-                pool_pre_ping=True,
+                pool_pre_ping=False,   # see _install_pool_events
                 echo=False,
                 connect_args={
                     'connect_timeout': 5,
@@ -56,11 +160,15 @@ class DatabaseManagerPooled:
                     'write_timeout': 30,
                 }
             )
-            
+            self._install_pool_events(self.engine)
+            self.pool_telemetry.attach(self.engine)
+            if self._pool_sizer:
+                self._pool_sizer.reapply()
+                self._pool_sizer.start()
 
             with self.engine.connect() as conn:
                 conn.execute(text("SELECT 1"))
-            
+
             self.last_used = time.time()
             self._is_disconnected_for_idle = False
             self.logger.info("MySQL connection pool created successfully")
@@ -140,6 +248,81 @@ class DatabaseManagerPooled:
         thread.start()
         self.logger.info(f"Idle monitor started (timeout: {self.idle_timeout}s)")
 
+    def _ready_engine(self) -> Optional[Engine]:
+        """The engine, connecting first if there is none; None if that fails.
+
+        Lock-free once connected: dead pooled connections are caught by the
+        checkout ping and by the disconnect retry in ``_run``, so queries no
+        longer probe the server (or serialize on ``self.lock``) up front.
+        """
+        engine = self.engine
+        if engine is None:
+            with self.lock:
+                if not self.reconnect_if_needed():
+                    return None
+                engine = self.engine
+        self.last_used = time.time()
+        return engine
+
+    # ── Pool liveness ─────────────────────────────────────────────────────
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._stats_lock:
+            self._liveness[name] += n
+
+    def _install_pool_events(self, engine: Engine) -> None:
+        """Ping a pooled connection on checkout only if it sat idle longer
+        than ``_PING_IDLE_SECS`` (replaces pool_pre_ping's ping per checkout)."""
+
+        def stamp(dbapi_conn, record, *_):
+            record.info["ors_idle_since"] = time.monotonic()
+
+        def on_checkout(dbapi_conn, record, proxy):
+            idle = time.monotonic() - record.info.get("ors_idle_since", 0.0)
+            if idle <= _PING_IDLE_SECS:
+                self._count("checkouts_unpinged")
+                return
+            self._count("pings")
+            try:
+                dbapi_conn.ping(reconnect=False)
+            except Exception as e:
+                self._count("ping_failures")
+                # The pool discards this connection and checks out another
+                raise exc.DisconnectionError(f"Idle connection failed ping: {e}")
+
+        event.listen(engine, "connect", stamp)
+        event.listen(engine, "checkin", stamp)
+        event.listen(engine, "checkout", on_checkout)
+
+    def _checkout(self, engine: Engine):
+        """``engine.connect()`` with the wait recorded for pool telemetry."""
+        start = time.perf_counter()
+        try:
+            with tracing.span("db.checkout"):
+                conn = engine.connect()
+        except exc.TimeoutError:
+            self.pool_telemetry.record_timeout()
+            raise
+        self.pool_telemetry.record_wait(time.perf_counter() - start)
+        return conn
+
+    def pool_report(self) -> dict:
+        """Liveness counters, pool telemetry and adaptive sizing state."""
+        return {
+            "liveness":  self.liveness_stats(),
+            "telemetry": self.pool_telemetry.stats(),
+            "adaptive":  self._pool_sizer.stats() if self._pool_sizer else None,
+        }
+
+    def liveness_stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._liveness)
+        checkouts = stats["pings"] + stats["checkouts_unpinged"]
+        stats["checkouts"] = checkouts
+        stats["ping_ratio"] = round(stats["pings"] / checkouts, 3) if checkouts else None
+        stats["ping_idle_secs"] = _PING_IDLE_SECS
+        return stats
+
     def reconnect_if_needed(self) -> bool:
 
         if not self.engine:
@@ -163,6 +346,7 @@ class DatabaseManagerPooled:
 
     def _prepare_params(self, query: str, params):
         """Convert %s-style params to SQLAlchemy :paramN style."""
+        statement_capture.record(query, params)
         if params and isinstance(params, (tuple, list)):
             modified_query = query
             param_dict = {}
@@ -173,26 +357,163 @@ class DatabaseManagerPooled:
             return modified_query, param_dict
         return query, params or {}
 
-    def execute_query(self, query: str, params: Optional[tuple] = None) -> Optional[Any]:
-
-        with self.lock:
-
-            if not self.reconnect_if_needed():
-                self.logger.error("Failed to connect to database")
-                return None
-
-            self.last_used = time.time() 
+    def _run(self, engine: Engine, query: str, params, row_format: str = "dict"):
+        """Run one statement on a pooled connection: rows for SELECT, else rowcount.
+
+        Pool checkout and execution are traced separately, and the statement
+        carries the current trace's SQL comment so it can be found in
+        SHOW PROCESSLIST and the slow query log.  A statement that hits a
+        dropped connection is retried once on a fresh one when that is safe
+        (see ``_retry_safe``).
+        """
+        tx = getattr(self._tx_local, "tx", None)
+        if tx is not None:
+            return tx.execute(query, params, row_format)
+        prepared_query, param_dict = self._prepare_params(query, params)
+        is_select = query.strip().upper().startswith("SELECT")
+        for attempt in range(2):
+            conn = self._checkout(engine)
+            try:
+                with conn:
+                    with tracing.span("db.execute"):
+                        result = conn.execute(text(tracing.sql_comment() + prepared_query), param_dict)
+
+                        if is_select:
+                            return from_result(result, row_format)
+                        else:
+                            conn.commit()
+                            query_cache.invalidate_for(query)
+                            return result.rowcount
+            except DBAPIError as e:
+                if attempt or not _retry_safe(e, is_select):
+                    raise
+                self._count("disconnect_retries")
+                self.logger.warning(f"Connection dropped ({e.orig}); retrying on a fresh connection")
+
+    @contextmanager
+    def transaction(self):
+        """Run the block's statements on one connection and commit them together.
+
+        Yields a ``Transaction``; ``execute_query`` / ``execute_query_with_exception``
+        on this thread join it too.  Any exception in the block, or any
+        statement that failed (even one whose error execute_query swallowed),
+        rolls back; the latter raises TransactionError on exit.  Nested
+        ``transaction()`` blocks join the outer one.
+        """
+        outer = getattr(self._tx_local, "tx", None)
+        if outer is not None:
+            yield outer
+            return
+        engine = self._ready_engine()
+        if engine is None:
+            raise TransactionError("Failed to connect to database")
+
+        conn = self._checkout(engine)
+        with conn:
+            tx = Transaction(self, conn)
+            self._tx_local.tx = tx
+            try:
+                yield tx
+                if tx.failed is not None:
+                    raise TransactionError(f"Statement failed inside transaction: {tx.failed}",
+                                           code=mysql_error_code(tx.failed))
+                with tracing.span("db.commit"):
+                    conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                self._tx_local.tx = None
+                self.last_used = time.time()
+                for query in tx._writes:
+                    query_cache.invalidate_for(query)
+
+    def fetch_capped(self, query: str, params=None, max_rows: Optional[int] = None,
+                     max_bytes: Optional[int] = None, size_of=None) -> Tuple[List[Dict[str, Any]], List[str], bool]:
+        """Run a SELECT, reading at most ``max_rows`` rows or about ``max_bytes``.
+
+        Rows come from a server-side cursor ``_FETCH_CHUNK`` at a time and
+        ``size_of(chunk)`` reports each chunk's size, so an oversized result
+        is never held whole.  Returns ``(rows, column names, truncated)``.
+        Raises on errors.
+        """
+        engine = self._ready_engine()
+        if engine is None:
+            raise Exception("Failed to connect to database")
+
+        prepared_query, param_dict = self._prepare_params(query, params)
+        conn = self._checkout(engine)
+        with conn:
+            with tracing.span("db.execute"):
+                result = conn.execution_options(stream_results=True).execute(
+                    text(tracing.sql_comment() + prepared_query), param_dict
+                )
+                columns = list(result.keys())
+                rows, size, truncated = [], 0, False
+                while True:
+                    want = _FETCH_CHUNK if max_rows is None else min(_FETCH_CHUNK, max_rows + 1 - len(rows))
+                    chunk = [dict(row._mapping) for row in result.fetchmany(want)]
+                    if not chunk:
+                        break
+                    rows.extend(chunk)
+                    if max_rows is not None and len(rows) > max_rows:
+                        del rows[max_rows:]
+                        truncated = True
+                        break
+                    if size_of is not None and max_bytes is not None:
+                        size += size_of(chunk)
+                        if size > max_bytes:
+                            truncated = bool(result.fetchmany(1))
+                            break
+                if truncated:
+                    # Closing an unbuffered result reads the rest of it off
+                    # the wire; dropping the connection is cheaper
+                    conn.invalidate()
+                return rows, columns, truncated
+
+    def iter_query(self, query: str, params=None, batch_size: int = _FETCH_CHUNK) -> Iterator[Any]:
+        """Stream a SELECT's rows from a server-side cursor, ``batch_size`` at a time.
+
+        Yields SQLAlchemy ``Row`` objects (tuple-like; ``row[0]``,
+        ``row.column`` and ``row._fields`` work), so a large export holds
+        one batch in memory rather than the whole result.  Raises on
+        errors.  Stopping early drops the connection instead of draining
+        the rest of the result.
+        """
+        engine = self._ready_engine()
+        if engine is None:
+            raise Exception("Failed to connect to database")
+
+        prepared_query, param_dict = self._prepare_params(query, params)
+        conn = self._checkout(engine)
+        with conn:
+            done = False
+            try:
+                with tracing.span("db.execute"):
+                    result = conn.execution_options(stream_results=True).execute(
+                        text(tracing.sql_comment() + prepared_query), param_dict
+                    )
+                while True:
+                    batch = result.fetchmany(batch_size)
+                    if not batch:
+                        done = True
+                        break
+                    yield from batch
+                    self.last_used = time.time()
+            finally:
+                if not done:
+                    conn.invalidate()
+
+    def execute_query(self, query: str, params: Optional[tuple] = None, row_format: str = "dict") -> Optional[Any]:
+        """Rows for SELECT (shaped by ``row_format``, see row_formats.py), else rowcount; None on error."""
+        check_format(row_format)
+        engine = self._ready_engine()
+        if engine is None:
+            self.logger.error("Failed to connect to database")
+            return None
 
         try:
-            prepared_query, param_dict = self._prepare_params(query, params)
-            with self.engine.connect() as conn:
-                result = conn.execute(text(prepared_query), param_dict)
-                
-                if query.strip().upper().startswith("SELECT"):
-                    return [dict(row._mapping) for row in result]
-                else:
-                    conn.commit()
-                    return result.rowcount
+            return self._run(engine, query, params, row_format)
 
         except Exception as e:
             error_msg = str(e).lower()
@@ -205,88 +526,116 @@ class DatabaseManagerPooled:
             
             return None
 
-    def execute_query_with_exception(self, query: str, params: Optional[tuple] = None) -> Tuple[Optional[Any], Optional[Exception]]:
-
-        with self.lock:
-
-            if not self.reconnect_if_needed():
-                return None, Exception("Failed to connect to database")
-
-            self.last_used = time.time()  
+    def execute_query_with_exception(self, query: str, params: Optional[tuple] = None,
+                                     row_format: str = "dict") -> Tuple[Optional[Any], Optional[Exception]]:
+        check_format(row_format)
+        engine = self._ready_engine()
+        if engine is None:
+            return None, Exception("Failed to connect to database")
 
         try:
-            prepared_query, param_dict = self._prepare_params(query, params)
-            with self.engine.connect() as conn:
-                result = conn.execute(text(prepared_query), param_dict)
-                
-                if query.strip().upper().startswith("SELECT"):
-                    data = [dict(row._mapping) for row in result]
-                    return data, None
-                else:
-                    conn.commit()
-                    return result.rowcount, None
+            return self._run(engine, query, params, row_format), None
 
         except Exception as e:
             self.logger.error(f"Query failed: {e}")
             return None, e
 
-    @lru_cache(maxsize=128)
-    def execute_cached_query(self, query: str, params_tuple: Optional[tuple] = None) -> Optional[List[Dict[str, Any]]]:
-  
+    def execute_cached_query(self, query: str, params_tuple=None, ttl: Optional[float] = None) -> Optional[List[Dict[str, Any]]]:
+        """SELECT through the shared query cache (see query_cache.py).
+
+        ``ttl`` overrides ORS_QUERY_CACHE_TTL for this entry.  Failed
+        queries are not cached.  Inside ``transaction()`` the cache is
+        bypassed: the block must see its own uncommitted writes, and those
+        must never be stored for other readers.
+        """
         if not query.strip().upper().startswith("SELECT"):
             self.logger.warning("Cached queries only support SELECT statements")
             return self.execute_query(query, params_tuple)
-        
-        return self.execute_query(query, params_tuple)
+        if getattr(self._tx_local, "tx", None) is not None:
+            return self.execute_query(query, params_tuple)
+
+        hit, rows = query_cache.get(query, params_tuple)
+        if hit:
+            return rows
+        rows = self.execute_query(query, params_tuple)
+        if rows is not None:
+            query_cache.put(query, params_tuple, rows, ttl)
+        return rows
 
     def clear_cache(self):
         """Clear the query cache"""
-        self.execute_cached_query.cache_clear()
+        query_cache.clear()
         self.logger.info("Query cache cleared")
 
-    def execute_many(self, query: str, params_list: List[tuple], chunk_size: int = 100) -> Optional[int]:
-
+    def _max_packet(self, conn) -> int:
+        """The server's max_allowed_packet, read once per engine."""
+        if getattr(self, "_max_packet_bytes", None) is None:
+            try:
+                self._max_packet_bytes = int(conn.execute(text("SELECT @@max_allowed_packet")).scalar())
+            except Exception:
+                self._max_packet_bytes = _DEFAULT_MAX_PACKET
+        return self._max_packet_bytes
+
+    def execute_bulk(self, query: str, params_list: List[tuple], chunk_size: int = _BULK_MAX_ROWS) -> BulkResult:
+        """Run one statement for many parameter rows in as few round trips as possible.
+
+        A single-row ``INSERT/REPLACE ... VALUES (...) [ON DUPLICATE KEY
+        UPDATE ...]`` is rewritten into multi-row VALUES lists, chunked to
+        stay well under max_allowed_packet; anything else goes through the
+        driver's executemany.  Each chunk commits on its own, and a failed
+        chunk is rolled back and reported without stopping the rest.
+        """
         if not params_list:
-            return 0
-            
-        with self.lock:
-            if not self.reconnect_if_needed():
-                self.logger.error("Failed to connect to database")
-                return None
-            self.last_used = time.time()
-
-        try:
-            modified_query, _ = self._prepare_params(query, tuple(range(query.count("%s"))))
-
-            param_dicts = []
-            for params in params_list:
-                param_dict = {f"param{i}": val for i, val in enumerate(params)}
-                param_dicts.append(param_dict)
-            
-            total_rows = 0
-            with self.engine.connect() as conn:
-                for i in range(0, len(param_dicts), chunk_size):
-                    chunk = param_dicts[i:i + chunk_size]
-                    for param_dict in chunk:
-                        result = conn.execute(text(modified_query), param_dict)
-                        total_rows += result.rowcount
+            return BulkResult(0, 0, [])
+
+        engine = self._ready_engine()
+        if engine is None:
+            self.logger.error("Failed to connect to database")
+            return BulkResult(0, 0, [(0, len(params_list), "Failed to connect to database")])
+
+        split = split_values(query)
+        if split is None:
+            prepared_query, _ = self._prepare_params(query, tuple(range(query.count("%s"))))
+        total, chunks, errors = 0, 0, []
+        conn = self._checkout(engine)
+        with conn:
+            budget = self._max_packet(conn) // 2
+            row_len = len(split.row) if split else len(query)
+            for start, rows in _bulk_chunks(params_list, row_len, budget, chunk_size):
+                chunks += 1
+                try:
+                    with tracing.span("db.execute", rows=len(rows)):
+                        if split is not None:
+                            sql, binds = _multi_row_statement(split, rows)
+                            result = conn.execute(text(tracing.sql_comment() + sql), binds)
+                        else:
+                            binds = [{f"param{i}": v for i, v in enumerate(params)} for params in rows]
+                            result = conn.execute(text(tracing.sql_comment() + prepared_query), binds)
+                        total += max(result.rowcount, 0)
                     conn.commit()
-            
-            return total_rows
-
-        except Exception as e:
-            self.logger.error(f"Batch query failed: {e}\nQuery: {query}")
+                except Exception as e:
+                    conn.rollback()
+                    errors.append((start, len(rows), str(e)))
+                    self.logger.error(f"Bulk chunk failed (rows {start}-{start + len(rows) - 1}): {e}\nQuery: {query}")
+        if len(errors) < chunks:
+            query_cache.invalidate_for(query)
+        return BulkResult(total, chunks, errors)
+
+    def execute_many(self, query: str, params_list: List[tuple], chunk_size: int = _BULK_MAX_ROWS) -> Optional[int]:
+        """Affected rows of ``execute_bulk``, or None if any chunk failed."""
+        result = self.execute_bulk(query, params_list, chunk_size)
+        if result.errors:
             return None
+        return result.rows
 
     def test_connection(self) -> bool:
 
-        with self.lock:
-            if not self.reconnect_if_needed():
-                return False
-            self.last_used = time.time()
-        
+        engine = self._ready_engine()
+        if engine is None:
+            return False
+
         try:
-            with self.engine.connect() as conn:
+            with engine.connect() as conn:
                 result = conn.execute(text("SELECT 1 AS test"))
                 row = result.fetchone()
                 return row and row[0] == 1
@@ -301,9 +650,17 @@ class DatabaseManagerPooled:
             'connected': self.engine is not None,
             'idle_seconds': round(idle_seconds, 1),
             'idle_timeout': self.idle_timeout,
-            'will_disconnect_in': max(0, round(self.idle_timeout - idle_seconds, 1)) if self.engine else 0
+            'will_disconnect_in': max(0, round(self.idle_timeout - idle_seconds, 1)) if self.engine else 0,
+            'query_cache': query_cache.stats(),
+            'liveness': self.liveness_stats(),
+            'pool': self.pool_telemetry.stats(),
+            'statement_capture': statement_capture.stats(),
         }
 
+    def set_client_identity(self, user: str = None, branch: str = None) -> None:
+        """Interface parity with the API managers; direct connections are not accounted."""
+        self.client_identity = (user, branch)
+
     def shutdown(self):
 
         if self.engine:
@@ -385,7 +742,7 @@ class RemoteDatabaseManager:
             return True
         return self._refresh_token()
 
-    def _call(self, endpoint: str, sql: str, params=None):
+    def _call(self, endpoint: str, sql: str, params=None, page_token: str = None, max_rows: int = None):
         """POST to endpoint, auto-refresh token on 401."""
         import requests as _req
         if not self._ensure_token():
@@ -394,27 +751,36 @@ class RemoteDatabaseManager:
         payload = {"sql": sql}
         if params is not None:
             payload["params"] = list(params)
-
-        for attempt in range(3):
-            try:
-                resp = self._session.post(
-                    f"{self._api_url}{endpoint}",
-                    json=payload,
-                    timeout=(5, 45),
-                )
-                if resp.status_code == 401 and attempt == 0:
-                    # Token expired — refresh and retry once
-                    self._token = None
-                    self._refresh_token()
-                    continue
-                return resp, None
-            except Exception as e:
-                if self._is_transient_network_error(e) and attempt < 2:
-                    wait_s = 0.8 * (attempt + 1)
-                    self.logger.warning(f"Transient API network error, retrying in {wait_s:.1f}s: {e}")
-                    time.sleep(wait_s)
-                    continue
-                return None, e
+        if page_token:
+            payload["page_token"] = page_token
+        if max_rows:
+            payload["max_rows"] = max_rows
+
+        with tracing.client_call(endpoint) as headers:
+            for attempt in range(3):
+                try:
+                    resp = self._session.post(
+                        f"{self._api_url}{endpoint}",
+                        json=payload,
+                        headers=headers,
+                        timeout=(5, 45),
+                    )
+                    if resp.status_code == 401 and attempt == 0:
+                        # Token expired — refresh and retry once
+                        self._token = None
+                        self._refresh_token()
+                        continue
+                    return resp, None
+                except Exception as e:
+                    if self._is_transient_network_error(e) and attempt < 2:
+                        wait_s = 0.8 * (attempt + 1)
+                        self.logger.warning(
+                            f"Transient API network error, retrying in {wait_s:.1f}s "
+                            f"(rid={headers['X-Request-ID']}): {e}"
+                        )
+                        time.sleep(wait_s)
+                        continue
+                    return None, e
 
         return None, Exception("API call failed after retry")
 
@@ -433,54 +799,98 @@ class RemoteDatabaseManager:
                 f"Non-JSON response (HTTP {resp.status_code}): {resp.text[:200]}"
             )
 
-    def execute_query(self, query: str, params=None):
+    def _page(self, endpoint: str, query: str, params=None, page_token: str = None, max_rows: int = None):
+        """One call with 429 back-off; returns (decoded JSON, error)."""
         import time as _time
         for attempt in range(3):
-            resp, err = self._call("/api/exec", query, params)
+            resp, err = self._call(endpoint, query, params, page_token, max_rows)
             if err:
-                self.logger.error(f"execute_query error: {err}")
-                return None
+                return None, err
             try:
-                data, decode_err = self._json_or_error(resp)
+                return self._json_or_error(resp)
             except _RateLimitError:
                 wait = 2 * (attempt + 1)
                 self.logger.warning(f"Rate limited (429) — retrying in {wait}s")
                 _time.sleep(wait)
-                continue
-            if decode_err:
-                self.logger.error(str(decode_err))
-                return None
-            if data.get("error"):
-                self.logger.error(f"Server error: {data['error']}")
-                return None
-            return data.get("result")
-        self.logger.error("execute_query: still rate-limited after 3 attempts")
-        return None
+        return None, Exception("API temporarily rate limited. Please try again in a moment.")
 
-    def execute_query_with_exception(self, query: str, params=None):
-        import time as _time
-        for attempt in range(3):
-            resp, err = self._call("/api/exec_safe", query, params)
+    def _rest_of_result(self, endpoint: str, query: str, params, data: dict, error_key: str):
+        """Follow ``next_token`` until the result is complete; returns (rows, error).
+
+        The server caps each response (ORS_MAX_ROWS / ORS_MAX_RESULT_BYTES),
+        so a large SELECT arrives as several pages.  A page without a
+        ``result`` (e.g. a ``{"detail": ...}`` rejection) is an error, not
+        the end of the result.
+        """
+        rows = data.get("result")
+        token = data.get("next_token")
+        while token:
+            page, err = self._page(endpoint, query, params, token)
             if err:
                 return None, err
-            try:
-                data, decode_err = self._json_or_error(resp)
-            except _RateLimitError:
-                wait = 2 * (attempt + 1)
-                self.logger.warning(f"Rate limited (429) — retrying in {wait}s")
-                _time.sleep(wait)
-                continue
-            if decode_err:
-                return None, decode_err
-            if data.get("exec_error"):
-                # Reconstruct a minimal exception with error code for deadlock detection
-                exc = Exception(data["exec_error"])
-                code = data.get("error_code")
-                if code is not None:
-                    exc.args = (code, data["exec_error"])
-                return None, exc
-            return data.get("result"), None
-        return None, Exception("API temporarily rate limited. Please try again in a moment.")
+            if page.get(error_key):
+                return None, Exception(page[error_key])
+            if "result" not in page:
+                return None, Exception(page.get("detail") or "Result page missing from server response")
+            rows.extend(page.get("result") or [])
+            token = page.get("next_token")
+        return rows, None
+
+    def execute_query(self, query: str, params=None, row_format: str = "dict"):
+        check_format(row_format)
+        data, err = self._page("/api/exec", query, params)
+        if err:
+            self.logger.error(f"execute_query error: {err}")
+            return None
+        if data.get("error"):
+            self.logger.error(f"Server error: {data['error']}")
+            return None
+        rows, err = self._rest_of_result("/api/exec", query, params, data, "error")
+        if err:
+            self.logger.error(f"execute_query error: {err}")
+            return None
+        if isinstance(rows, int):
+            query_cache.invalidate_for(query)
+        return from_dicts(rows, row_format)
+
+    def execute_query_with_exception(self, query: str, params=None, row_format: str = "dict"):
+        check_format(row_format)
+        data, err = self._page("/api/exec_safe", query, params)
+        if err:
+            return None, err
+        if data.get("exec_error"):
+            # Reconstruct a minimal exception with error code for deadlock detection
+            exc = Exception(data["exec_error"])
+            code = data.get("error_code")
+            if code is not None:
+                exc.args = (code, data["exec_error"])
+            return None, exc
+        result, err = self._rest_of_result("/api/exec_safe", query, params, data, "exec_error")
+        if err is None and isinstance(result, int):
+            query_cache.invalidate_for(query)
+        return from_dicts(result, row_format), err
+
+    def iter_query(self, query: str, params=None, batch_size: int = _FETCH_CHUNK) -> Iterator[tuple]:
+        """Stream a SELECT page by page (``max_rows=batch_size`` per request).
+
+        Yields namedtuple rows like DatabaseManagerPooled.iter_query yields
+        ``Row`` objects.  Raises on errors.
+        """
+        row_type, token = None, None
+        while True:
+            page, err = self._page("/api/exec_safe", query, params, token, batch_size)
+            if err:
+                raise err
+            if page.get("exec_error"):
+                raise Exception(page["exec_error"])
+            rows = page.get("result") or []
+            if rows and row_type is None:
+                row_type = collections.namedtuple("Row", list(rows[0]), rename=True)
+            for row in rows:
+                yield row_type._make(row.values())
+            token = page.get("next_token")
+            if not token:
+                return
 
     def test_connection(self) -> bool:
         try:
@@ -489,26 +899,149 @@ class RemoteDatabaseManager:
         except Exception:
             return False
 
-    def execute_cached_query(self, query: str, params_tuple=None):
-        return self.execute_query(query, params_tuple)
+    def execute_cached_query(self, query: str, params_tuple=None, ttl: Optional[float] = None):
+        """SELECT through the shared query cache (see query_cache.py)."""
+        hit, rows = query_cache.get(query, params_tuple)
+        if hit:
+            return rows
+        rows = self.execute_query(query, params_tuple)
+        if isinstance(rows, list):
+            query_cache.put(query, params_tuple, rows, ttl)
+        return rows
 
     def clear_cache(self):
-        pass  # no local cache in remote mode
-
-    def execute_many(self, query: str, params_list, chunk_size: int = 100):
-        # Send in chunks to avoid oversized payloads
-        total = 0
-        for i in range(0, len(params_list), chunk_size):
-            chunk = params_list[i:i + chunk_size]
-            for p in chunk:
-                result = self.execute_query(query, p)
-                if isinstance(result, int):
-                    total += result
-        return total
+        query_cache.clear()
+
+    def _post_json(self, endpoint: str, payload: dict):
+        """POST a prepared body with token refresh and 429 back-off; returns (response, error)."""
+        if not self._ensure_token():
+            return None, Exception("Could not obtain API token")
+        with tracing.client_call(endpoint) as headers:
+            for attempt in range(3):
+                try:
+                    resp = self._session.post(
+                        f"{self._api_url}{endpoint}", json=payload, headers=headers, timeout=(5, 120),
+                    )
+                except Exception as e:
+                    return None, e
+                if resp.status_code == 401 and attempt == 0:
+                    self._token = None
+                    self._refresh_token()
+                    continue
+                if resp.status_code == 429 and attempt < 2:
+                    wait = 2 * (attempt + 1)
+                    self.logger.warning(f"Rate limited (429) — retrying in {wait}s")
+                    time.sleep(wait)
+                    continue
+                return resp, None
+        return None, Exception("API call failed after retry")
+
+    def transaction(self) -> ScriptTransaction:
+        """Queue writes and commit them together through /api/transaction.
+
+        SELECTs inside the block run immediately; see db_transaction.py.
+        """
+        def send(statements):
+            resp, err = self._post_json("/api/transaction", {"statements": statements})
+            if err:
+                raise TransactionError(str(err))
+            if resp.status_code == 404:
+                return None
+            if resp.status_code != 200:
+                raise TransactionError(f"HTTP {resp.status_code}: {resp.text[:200]}")
+            data = resp.json()
+            if not data.get("exec_error"):
+                for stmt in statements:
+                    query_cache.invalidate_for(stmt["sql"])
+            return data
+        return ScriptTransaction(self.execute_query_with_exception, send, self.execute_query_with_exception)
+
+    def _bulk_via_batch(self, query: str, rows) -> Tuple[int, List[str]]:
+        """/api/batch fallback for servers without /api/bulk: 100 statements per request."""
+        total, errors = 0, []
+        for i in range(0, len(rows), 100):
+            queries = [{"sql": query, "params": list(p)} for p in rows[i:i + 100]]
+            resp, err = self._post_json("/api/batch", {"queries": queries})
+            if err or resp.status_code != 200:
+                errors.append(str(err) if err else f"HTTP {resp.status_code}: {resp.text[:200]}")
+                continue
+            for entry in resp.json().get("results", []):
+                if entry.get("error"):
+                    errors.append(entry["error"])
+                elif isinstance(entry.get("result"), int):
+                    total += entry["result"]
+        return total, errors
+
+    def execute_many(self, query: str, params_list, chunk_size: int = _REMOTE_BULK_MAX_ROWS) -> Optional[int]:
+        """Run one write for many rows through /api/bulk.
+
+        Rows go in requests of about ``_REMOTE_BULK_BODY_BYTES`` of JSON
+        (the server refuses bodies over 1 MB), so a 600-row save is one or
+        two round trips instead of 600.  Returns the total affected rows, or
+        None if any chunk failed; chunks that succeeded stay committed.
+        """
+        total, errors = 0, []
+        bulk = True
+        for start, rows in _bulk_chunks(params_list, 4, _REMOTE_BULK_BODY_BYTES, chunk_size):
+            if bulk:
+                resp, err = self._post_json("/api/bulk", {"sql": query, "rows": [list(p) for p in rows]})
+                if err:
+                    errors.append(f"rows {start}-{start + len(rows) - 1}: {err}")
+                    continue
+                if resp.status_code == 200:
+                    data = resp.json()
+                    total += data.get("result") or 0
+                    for e in data.get("errors", []):
+                        errors.append(f"rows {start + e['first_row']}-{start + e['first_row'] + e['rows'] - 1}: {e['error']}")
+                    continue
+                if resp.status_code != 404:
+                    errors.append(f"rows {start}-{start + len(rows) - 1}: HTTP {resp.status_code} {resp.text[:200]}")
+                    continue
+                bulk = False   # older server without /api/bulk
+            affected, failed = self._bulk_via_batch(query, rows)
+            total += affected
+            errors.extend(failed)
+        if total:
+            query_cache.invalidate_for(query)
+        for e in errors:
+            self.logger.error(f"execute_many error: {e}")
+        return None if errors else total
 
     def get_connection_status(self) -> dict:
         connected = self.test_connection()
-        return {"connected": connected, "mode": "remote_api", "api_url": self._api_url}
+        return {"connected": connected, "mode": "remote_api", "api_url": self._api_url,
+                "query_cache": query_cache.stats()}
+
+    def post_events(self, heartbeats=None, activity=None) -> bool:
+        """Hand heartbeat / activity events to the server's group commit
+        (/api/events) instead of writing them one statement at a time."""
+        if not self._ensure_token():
+            return False
+        payload = {"heartbeats": heartbeats or [], "activity": activity or []}
+        with tracing.client_call("/api/events") as headers:
+            for attempt in range(2):
+                try:
+                    resp = self._session.post(
+                        f"{self._api_url}/api/events", json=payload, headers=headers, timeout=(5, 15),
+                    )
+                except Exception as e:
+                    self.logger.warning(f"post_events failed: {e}")
+                    return False
+                if resp.status_code == 401 and attempt == 0:
+                    self._token = None
+                    self._refresh_token()
+                    continue
+                return resp.status_code == 200
+        return False
+
+    def set_client_identity(self, user: str = None, branch: str = None) -> None:
+        """Tag every request with the logged-in user/branch for the server's
+        per-client cost accounting (X-ORS-User / X-ORS-Branch)."""
+        for header, value in (("X-ORS-User", user), ("X-ORS-Branch", branch)):
+            if value:
+                self._session.headers[header] = str(value)
+            else:
+                self._session.headers.pop(header, None)
 
     def shutdown(self):
         self._session.close()
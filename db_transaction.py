@@ -0,0 +1,107 @@
+"""
+Multi-statement transactions for the DB managers.
+
+    with db_manager.transaction() as tx:
+        tx.execute("UPDATE daily_reports SET ... WHERE id = %s", (report_id,))
+        tx.execute("INSERT INTO payable_tbl ... VALUES (%s, %s)", (a, b))
+
+Leaving the block commits; an exception inside it, or a statement that
+fails, rolls everything back and raises.
+
+Direct mode (DatabaseManagerPooled) runs the statements on one pooled
+connection as they are issued, and ``execute_query`` calls made on the
+same thread inside the block join the transaction.
+
+API mode (RemoteDatabaseManager / APIDbManager) uses ``ScriptTransaction``:
+SELECTs run immediately against committed data, writes are queued and sent
+together to ``POST /api/transaction`` when the block ends, where the server
+runs them in one database transaction.  ``tx.execute`` returns None for a
+queued write; the affected row counts are in ``tx.results`` after the
+commit.  Logic that must read its own uncommitted writes only works in
+direct mode.
+"""
+
+import logging
+from typing import Any, Callable, List, Optional
+
+from sql_classifier import classify
+
+logger = logging.getLogger(__name__)
+
+
+class TransactionError(Exception):
+    """A statement in a transaction failed and the transaction was rolled back.
+
+    ``index`` is the failing statement's position and ``code`` the MySQL
+    error code (1213 for deadlocks) when known.
+    """
+
+    def __init__(self, message: str, index: Optional[int] = None, code: Optional[int] = None):
+        super().__init__(message)
+        self.index = index
+        self.code = code
+
+
+def _is_select(sql: str) -> bool:
+    # The server's rule: /api/transaction rejects whatever classify() calls a SELECT
+    return classify(sql).is_select
+
+
+class ScriptTransaction:
+    """Client side of ``POST /api/transaction``: queues writes, sends them on commit.
+
+    ``read(sql, params)`` returns ``(result, error)`` for immediate SELECTs;
+    ``send(statements)`` posts the queued ``[{"sql", "params"}]`` and returns
+    the decoded response, or None if the server has no /api/transaction, in
+    which case ``fallback(sql, params)`` runs the statements one by one as
+    before (not atomic).
+    """
+
+    def __init__(self, read: Callable, send: Callable, fallback: Callable):
+        self._read = read
+        self._send = send
+        self._fallback = fallback
+        self.statements: List[dict] = []
+        self.results: Optional[List[Any]] = None
+
+    def execute(self, sql: str, params=None) -> Any:
+        if _is_select(sql):
+            result, err = self._read(sql, params)
+            if err is not None:
+                raise err
+            return result
+        self.statements.append({"sql": sql, "params": list(params) if params else None})
+        return None
+
+    def commit(self) -> List[Any]:
+        if not self.statements:
+            self.results = []
+            return self.results
+        data = self._send(self.statements)
+        if data is None:
+            logger.warning("Server has no /api/transaction; running %d statement(s) without a transaction",
+                           len(self.statements))
+            results: List[Any] = []
+            for i, stmt in enumerate(self.statements):
+                result, err = self._fallback(stmt["sql"], stmt["params"])
+                if err is not None:
+                    raise TransactionError(str(err), index=i)
+                results.append(result)
+            self.results = results
+            return results
+        if data.get("exec_error"):
+            raise TransactionError(data["exec_error"], index=data.get("failed_index"), code=data.get("error_code"))
+        self.results = data.get("results") or []
+        return self.results
+
+    # Context manager protocol: commit on success, drop the queue on error
+    def __enter__(self) -> "ScriptTransaction":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> Optional[bool]:
+        if exc_type is None:
+            self.commit()
+        else:
+            self.statements.clear()
+        return None
+
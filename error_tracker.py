@@ -4,15 +4,18 @@ Tracks exceptions, audit trails, and system events in a SQLite database.
 """
 
 import os
+import re
 import sys
 import json
+import time
+import hashlib
 import sqlite3
 import logging
 import threading
 import traceback
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta, timezone
 from pathlib import Path
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 
 # Create data directory
 DATA_DIR = Path(__file__).parent / "data"
@@ -20,70 +23,214 @@ DATA_DIR.mkdir(exist_ok=True)
 
 ERROR_DB = DATA_DIR / "errors.db"
 AUDIT_DB = DATA_DIR / "audit.db"
+AUDIT_DIR = DATA_DIR / "audit"   # one SQLite file per UTC day
+
+ERROR_RETENTION_DAYS = int(os.environ.get("ORS_ERROR_RETENTION_DAYS", "30"))
+ERROR_COMPACT_INTERVAL = int(os.environ.get("ORS_ERROR_COMPACT_SECS", "3600"))
+AUDIT_RETENTION_DAYS = int(os.environ.get("ORS_AUDIT_RETENTION_DAYS", "90"))
+AUDIT_ROLLUP_RETENTION_DAYS = int(os.environ.get("ORS_AUDIT_ROLLUP_RETENTION_DAYS", "730"))
+_FINGERPRINT_FRAMES = 3   # innermost stack frames that contribute to a fingerprint
+_MIGRATION_STALE_SECS = 600   # a legacy migration silent this long is taken over
+
+# Volatile parts of exception messages (ids, amounts, quoted values) are
+# replaced so that "Duplicate entry '123'" and "Duplicate entry '456'" group.
+_NORMALIZE_PATTERNS = (
+    (re.compile(r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"), "<uuid>"),
+    (re.compile(r"0x[0-9a-fA-F]+"), "0x?"),
+    (re.compile(r"'[^']*'"), "'?'"),
+    (re.compile(r'"[^"]*"'), '"?"'),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+)
+_TB_FRAME_RE = re.compile(r'File "([^"]+)", line \d+, in (\S+)')
+
+
+def _normalize_message(message: str) -> str:
+    for pattern, repl in _NORMALIZE_PATTERNS:
+        message = pattern.sub(repl, message)
+    return message[:500]
+
+
+def _fingerprint(error_type: str, message: str, frames: List[str]) -> Tuple[str, str]:
+    """Return (fingerprint, normalized_message) for an error occurrence."""
+    normalized = _normalize_message(message or "")
+    raw = "|".join([error_type, normalized] + frames[-_FINGERPRINT_FRAMES:])
+    return hashlib.sha1(raw.encode("utf-8", "replace")).hexdigest(), normalized
+
+
+def _frames_from_exception(exc: BaseException) -> List[str]:
+    return [
+        f"{os.path.basename(f.filename)}:{f.name}"
+        for f in traceback.extract_tb(exc.__traceback__)
+    ]
+
+
+def _frames_from_text(stack_trace: str) -> List[str]:
+    return [
+        f"{os.path.basename(path)}:{func}"
+        for path, func in _TB_FRAME_RE.findall(stack_trace or "")
+    ]
 
 
 class ErrorTracker:
-    """Track exceptions and errors."""
+    """Track exceptions grouped by fingerprint.
+
+    Each distinct error (type + normalized message + innermost stack frames)
+    is stored once in ``error_groups`` with an occurrence counter and
+    first/last-seen timestamps.  Hourly per-group counts live in
+    ``error_counts`` for charting.  The group id is the stable error ID
+    returned by ``track`` / ``log_exception``.
+    """
 
     def __init__(self, db_path: Path = ERROR_DB):
         self.db_path = db_path
         self.lock = threading.Lock()
+        self._group_ids: Dict[str, int] = {}   # fingerprint -> group id
+        self._compactor_started = False
         self._init_db()
 
     def _init_db(self):
         """Create tables if they don't exist."""
         with sqlite3.connect(self.db_path) as conn:
             conn.execute("""
-                CREATE TABLE IF NOT EXISTS errors (
+                CREATE TABLE IF NOT EXISTS error_groups (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL UNIQUE,
                     error_type TEXT NOT NULL,
                     message TEXT,
+                    normalized_message TEXT,
                     stack_trace TEXT,
                     source TEXT,
                     remote_ip TEXT,
+                    occurrences INTEGER NOT NULL DEFAULT 1,
+                    first_seen TEXT NOT NULL,
+                    last_seen TEXT NOT NULL,
                     resolved INTEGER DEFAULT 0,
                     resolved_at TEXT,
-                    notes TEXT,
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+                    notes TEXT
                 )
             """)
             conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_errors_timestamp ON errors(timestamp DESC)
+                CREATE INDEX IF NOT EXISTS idx_error_groups_last_seen ON error_groups(last_seen DESC)
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_error_groups_resolved ON error_groups(resolved)
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS error_counts (
+                    group_id INTEGER NOT NULL,
+                    bucket TEXT NOT NULL,
+                    count INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (group_id, bucket)
+                ) WITHOUT ROWID
             """)
             conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_errors_resolved ON errors(resolved)
+                CREATE INDEX IF NOT EXISTS idx_error_counts_bucket ON error_counts(bucket)
             """)
             conn.commit()
 
-    def track(self, exc: Exception, source: str = "unknown", remote_ip: str = None) -> int:
-        """Record an exception."""
-        with self.lock:
-            with sqlite3.connect(self.db_path) as conn:
-                error_id = conn.execute("""
-                    INSERT INTO errors (timestamp, error_type, message, stack_trace, source, remote_ip)
-                    VALUES (?, ?, ?, ?, ?, ?)
+    @staticmethod
+    def _bucket(ts: datetime) -> str:
+        return ts.strftime("%Y-%m-%dT%H:00")
+
+    def _record(
+        self,
+        conn: sqlite3.Connection,
+        fingerprint: str,
+        error_type: str,
+        message: str,
+        normalized: str,
+        stack_trace,
+        source: str,
+        remote_ip: str,
+        seen_at: datetime,
+        occurrences: int = 1,
+        first_seen: datetime = None,
+    ) -> int:
+        """Upsert one group and its hourly count.  Caller holds self.lock.
+
+        ``stack_trace`` may be a callable so the (expensive) formatting only
+        happens the first time a fingerprint is seen.
+        """
+        ts = seen_at.isoformat()
+        group_id = self._group_ids.get(fingerprint)
+        if group_id is not None:
+            updated = conn.execute("""
+                UPDATE error_groups
+                SET occurrences = occurrences + ?, last_seen = MAX(last_seen, ?),
+                    message = ?, remote_ip = ?, resolved = 0
+                WHERE id = ?
+            """, (occurrences, ts, message, remote_ip, group_id)).rowcount
+            if not updated:
+                # Group was compacted away (possibly by another process)
+                del self._group_ids[fingerprint]
+                group_id = None
+
+        if group_id is None:
+            row = conn.execute(
+                "SELECT id FROM error_groups WHERE fingerprint = ?", (fingerprint,)
+            ).fetchone()
+            if row:
+                group_id = row[0]
+                conn.execute("""
+                    UPDATE error_groups
+                    SET occurrences = occurrences + ?, last_seen = MAX(last_seen, ?),
+                        message = ?, remote_ip = ?, resolved = 0
+                    WHERE id = ?
+                """, (occurrences, ts, message, remote_ip, group_id))
+            else:
+                group_id = conn.execute("""
+                    INSERT INTO error_groups
+                    (fingerprint, error_type, message, normalized_message, stack_trace,
+                     source, remote_ip, occurrences, first_seen, last_seen)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """, (
-                    datetime.utcnow().isoformat(),
-                    type(exc).__name__,
-                    str(exc),
-                    traceback.format_exc(),
+                    fingerprint,
+                    error_type,
+                    message,
+                    normalized,
+                    stack_trace() if callable(stack_trace) else stack_trace,
                     source,
-                    remote_ip
+                    remote_ip,
+                    occurrences,
+                    (first_seen or seen_at).isoformat(),
+                    ts,
                 )).lastrowid
+            self._group_ids[fingerprint] = group_id
+
+        conn.execute("""
+            INSERT INTO error_counts (group_id, bucket, count) VALUES (?, ?, ?)
+            ON CONFLICT(group_id, bucket) DO UPDATE SET count = count + excluded.count
+        """, (group_id, self._bucket(seen_at), occurrences))
+        return group_id
+
+    def track(self, exc: Exception, source: str = "unknown", remote_ip: str = None) -> int:
+        """Record an exception occurrence.  Returns the stable error-group ID."""
+        error_type = type(exc).__name__
+        message = str(exc)
+        fingerprint, normalized = _fingerprint(error_type, message, _frames_from_exception(exc))
+
+        def _stack_trace():
+            return "".join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+
+        with self.lock:
+            with sqlite3.connect(self.db_path) as conn:
+                error_id = self._record(
+                    conn, fingerprint, error_type, message[:1000], normalized,
+                    _stack_trace, source, remote_ip, datetime.utcnow(),
+                )
                 conn.commit()
                 return error_id
 
     def get_recent(self, hours: int = 24, unresolved_only: bool = True) -> List[Dict]:
-        """Get recent errors."""
+        """Get error groups seen within the last ``hours``, newest first."""
         cutoff = (datetime.utcnow() - timedelta(hours=hours)).isoformat()
-        query = "SELECT * FROM errors WHERE timestamp > ? "
+        query = "SELECT *, last_seen AS timestamp FROM error_groups WHERE last_seen > ? "
         params = [cutoff]
 
         if unresolved_only:
             query += "AND resolved = 0 "
 
-        query += "ORDER BY timestamp DESC LIMIT 100"
+        query += "ORDER BY last_seen DESC LIMIT 100"
 
         with sqlite3.connect(self.db_path) as conn:
             conn.row_factory = sqlite3.Row
@@ -91,42 +238,178 @@ class ErrorTracker:
             return [dict(row) for row in rows]
 
     def get_counts(self, hours: int = 24) -> Dict[str, int]:
-        """Get error counts by type."""
-        cutoff = (datetime.utcnow() - timedelta(hours=hours)).isoformat()
+        """Get unresolved occurrence counts by type (hour granularity)."""
+        cutoff = self._bucket(datetime.utcnow() - timedelta(hours=hours))
         with sqlite3.connect(self.db_path) as conn:
             conn.row_factory = sqlite3.Row
             rows = conn.execute("""
-                SELECT error_type, COUNT(*) as count
-                FROM errors
-                WHERE timestamp > ? AND resolved = 0
-                GROUP BY error_type
+                SELECT g.error_type, SUM(c.count) as count
+                FROM error_counts c
+                JOIN error_groups g ON g.id = c.group_id
+                WHERE c.bucket >= ? AND g.resolved = 0
+                GROUP BY g.error_type
                 ORDER BY count DESC
             """, [cutoff]).fetchall()
             return {row['error_type']: row['count'] for row in rows}
 
+    def get_timeseries(self, hours: int = 24, error_id: int = None) -> List[Dict]:
+        """Hourly occurrence counts for charting, oldest bucket first."""
+        cutoff = self._bucket(datetime.utcnow() - timedelta(hours=hours))
+        query = "SELECT bucket, SUM(count) AS count FROM error_counts WHERE bucket >= ? "
+        params = [cutoff]
+
+        if error_id is not None:
+            query += "AND group_id = ? "
+            params.append(error_id)
+
+        query += "GROUP BY bucket ORDER BY bucket"
+
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(query, params).fetchall()
+            return [dict(row) for row in rows]
+
     def resolve(self, error_id: int, notes: str = None):
-        """Mark an error as resolved."""
+        """Mark an error group as resolved.  A new occurrence reopens it."""
         with self.lock:
             with sqlite3.connect(self.db_path) as conn:
                 conn.execute("""
-                    UPDATE errors
+                    UPDATE error_groups
                     SET resolved = 1, resolved_at = ?, notes = ?
                     WHERE id = ?
                 """, (datetime.utcnow().isoformat(), notes, error_id))
                 conn.commit()
 
+    def compact(self, retention_days: int = None) -> Dict[str, int]:
+        """Fold legacy per-occurrence rows into groups and drop expired data.
+
+        - rows in the pre-fingerprint ``errors`` table are merged into
+          ``error_groups`` / ``error_counts`` and the table is dropped
+        - hourly counts and groups not seen within ``retention_days`` are deleted
+        """
+        days = ERROR_RETENTION_DAYS if retention_days is None else retention_days
+        cutoff_dt = datetime.utcnow() - timedelta(days=days)
+        stats = {"folded": 0, "groups_deleted": 0, "buckets_deleted": 0}
+
+        with self.lock:
+            with sqlite3.connect(self.db_path) as conn:
+                legacy = conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'errors'"
+                ).fetchone()
+                if legacy:
+                    rows = conn.execute("""
+                        SELECT timestamp, error_type, message, stack_trace, source,
+                               remote_ip, resolved
+                        FROM errors ORDER BY timestamp
+                    """).fetchall()
+                    for ts, error_type, message, stack_trace, source, remote_ip, resolved in rows:
+                        try:
+                            seen_at = datetime.fromisoformat(ts)
+                        except (TypeError, ValueError):
+                            continue
+                        if resolved or seen_at < cutoff_dt:
+                            continue
+                        fingerprint, normalized = _fingerprint(
+                            error_type, message or "", _frames_from_text(stack_trace)
+                        )
+                        self._record(
+                            conn, fingerprint, error_type, (message or "")[:1000], normalized,
+                            stack_trace, source, remote_ip, seen_at,
+                        )
+                        stats["folded"] += 1
+                    conn.execute("DROP TABLE errors")
+
+                stats["buckets_deleted"] = conn.execute(
+                    "DELETE FROM error_counts WHERE bucket < ?", (self._bucket(cutoff_dt),)
+                ).rowcount
+                stats["groups_deleted"] = conn.execute(
+                    "DELETE FROM error_groups WHERE last_seen < ?", (cutoff_dt.isoformat(),)
+                ).rowcount
+                if stats["groups_deleted"]:
+                    conn.execute(
+                        "DELETE FROM error_counts WHERE group_id NOT IN (SELECT id FROM error_groups)"
+                    )
+                    self._group_ids.clear()
+                conn.commit()
+
+                if legacy or stats["groups_deleted"]:
+                    conn.execute("VACUUM")
+        return stats
+
+    def start_compactor(self, interval: int = ERROR_COMPACT_INTERVAL):
+        """Run ``compact`` in a daemon thread every ``interval`` seconds."""
+        if self._compactor_started or interval <= 0:
+            return
+        self._compactor_started = True
+
+        def compactor():
+            log = logging.getLogger("ErrorTracker")
+            while True:
+                try:
+                    stats = self.compact()
+                    if any(stats.values()):
+                        log.info(f"Error store compacted: {stats}")
+                except Exception as e:
+                    log.error(f"Error store compaction failed: {e}")
+                time.sleep(interval)
+
+        thread = threading.Thread(target=compactor, daemon=True, name="ErrorCompactor")
+        thread.start()
+
 
 class AuditLogger:
-    """Track all database writes (INSERT, UPDATE, DELETE) with user and timestamp."""
+    """Track all database writes (INSERT, UPDATE, DELETE) with user and timestamp.
 
-    def __init__(self, db_path: Path = AUDIT_DB):
+    Raw entries are partitioned by UTC day into ``AUDIT_DIR/audit_YYYYMMDD.db``
+    so expiring a day is a file delete.  Hourly rollups of counts and total
+    ``duration_ms`` per table and operation are kept in ``db_path`` and
+    outlive the raw partitions.
+    """
+
+    def __init__(self, db_path: Path = AUDIT_DB, partition_dir: Path = AUDIT_DIR):
         self.db_path = db_path
+        self.partition_dir = partition_dir
+        self.partition_dir.mkdir(exist_ok=True)
         self.lock = threading.Lock()
+        self._ready_partitions = set()   # partition paths whose schema exists
+        self._maintenance_started = False
         self._init_db()
 
     def _init_db(self):
-        """Create audit table if it doesn't exist."""
+        """Create rollup table if it doesn't exist."""
         with sqlite3.connect(self.db_path) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS audit_hourly (
+                    hour TEXT NOT NULL,
+                    table_name TEXT NOT NULL,
+                    operation TEXT NOT NULL,
+                    count INTEGER NOT NULL DEFAULT 0,
+                    error_count INTEGER NOT NULL DEFAULT 0,
+                    total_duration_ms REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (hour, table_name, operation)
+                ) WITHOUT ROWID
+            """)
+            # Single-row claim on the legacy migration, shared by worker processes
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS audit_migration (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    owner TEXT NOT NULL DEFAULT '',
+                    heartbeat REAL NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("INSERT OR IGNORE INTO audit_migration (id) VALUES (1)")
+            conn.commit()
+
+    # ── Partitions ────────────────────────────────────────────────────────
+
+    def _partition_path(self, day: date) -> Path:
+        return self.partition_dir / f"audit_{day.strftime('%Y%m%d')}.db"
+
+    def _open_partition(self, day: date) -> sqlite3.Connection:
+        """Open (and create on first use) the partition for ``day``."""
+        path = self._partition_path(day)
+        conn = sqlite3.connect(path)
+        if path not in self._ready_partitions:
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS audit_log (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -146,12 +429,81 @@ class AuditLogger:
                 CREATE INDEX IF NOT EXISTS idx_audit_timestamp ON audit_log(timestamp DESC)
             """)
             conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_audit_user ON audit_log(user)
+                CREATE INDEX IF NOT EXISTS idx_audit_table_op ON audit_log(table_name, operation, timestamp)
             """)
             conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_audit_table ON audit_log(table_name)
+                CREATE INDEX IF NOT EXISTS idx_audit_ip ON audit_log(remote_ip, timestamp)
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_audit_user ON audit_log(user, timestamp)
             """)
             conn.commit()
+            self._ready_partitions.add(path)
+        return conn
+
+    def partitions(self) -> List[date]:
+        """Days that have a raw partition on disk, oldest first."""
+        days = []
+        for path in self.partition_dir.glob("audit_*.db"):
+            try:
+                days.append(datetime.strptime(path.stem[len("audit_"):], "%Y%m%d").date())
+            except ValueError:
+                continue
+        return sorted(days)
+
+    def drop_partitions(self, before: date) -> int:
+        """Delete raw partitions older than ``before``.  Rollups are kept."""
+        dropped = 0
+        with self.lock:
+            for day in self.partitions():
+                if day >= before:
+                    break
+                path = self._partition_path(day)
+                try:
+                    path.unlink()
+                    self._ready_partitions.discard(path)
+                    dropped += 1
+                except OSError:
+                    pass
+        return dropped
+
+    # ── Writes ────────────────────────────────────────────────────────────
+
+    def _write(self, rows: List[tuple]):
+        """Insert rows (timestamp first) into partitions and rollups.  Caller holds self.lock."""
+        by_day: Dict[date, List[tuple]] = {}
+        rollups: Dict[tuple, List[float]] = {}
+        for row in rows:
+            ts, operation, table_name, status, duration_ms = row[0], row[1], row[2], row[7], row[9]
+            by_day.setdefault(datetime.fromisoformat(ts).date(), []).append(row)
+            agg = rollups.setdefault((ts[:13] + ":00", table_name or "unknown", operation), [0, 0, 0.0])
+            agg[0] += 1
+            agg[1] += 1 if status != "success" else 0
+            agg[2] += duration_ms or 0.0
+
+        for day, day_rows in by_day.items():
+            conn = self._open_partition(day)
+            try:
+                conn.executemany("""
+                    INSERT INTO audit_log
+                    (timestamp, operation, table_name, sql_query, user, remote_ip,
+                     affected_rows, status, error_msg, duration_ms)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, day_rows)
+                conn.commit()
+            finally:
+                conn.close()
+
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executemany("""
+                INSERT INTO audit_hourly (hour, table_name, operation, count, error_count, total_duration_ms)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(hour, table_name, operation) DO UPDATE SET
+                    count = count + excluded.count,
+                    error_count = error_count + excluded.error_count,
+                    total_duration_ms = total_duration_ms + excluded.total_duration_ms
+            """, [key + tuple(agg) for key, agg in rollups.items()])
+            conn.commit()
 
     def log(
         self,
@@ -167,50 +519,208 @@ class AuditLogger:
     ):
         """Log a database operation."""
         with self.lock:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute("""
-                    INSERT INTO audit_log
-                    (timestamp, operation, table_name, sql_query, user, remote_ip,
-                     affected_rows, status, error_msg, duration_ms)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    datetime.utcnow().isoformat(),
-                    operation,
-                    table_name,
-                    sql_query[:500],  # Truncate long queries
-                    user,
-                    remote_ip,
-                    affected_rows,
-                    status,
-                    error_msg[:500] if error_msg else None,
-                    duration_ms
-                ))
-                conn.commit()
+            self._write([(
+                datetime.utcnow().isoformat(),
+                operation,
+                table_name,
+                sql_query[:500],  # Truncate long queries
+                user,
+                remote_ip,
+                affected_rows,
+                status,
+                error_msg[:500] if error_msg else None,
+                duration_ms
+            )])
+
+    # ── Reads ─────────────────────────────────────────────────────────────
+
+    def query(
+        self,
+        start: datetime,
+        end: datetime,
+        table_name: str = None,
+        operation: str = None,
+        user: str = None,
+        remote_ip: str = None,
+        status: str = None,
+        limit: int = 200,
+        cursor: str = None,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """Page through entries in [start, end), newest first.
+
+        Returns ``(rows, next_cursor)``; pass ``next_cursor`` back to get the
+        following page.  Only the partitions overlapping the range are opened.
+        """
+        filters = ""
+        filter_params: list = []
+        for column, value in (("table_name", table_name), ("operation", operation),
+                              ("user", user), ("remote_ip", remote_ip), ("status", status)):
+            if value:
+                filters += f"AND {column} = ? "
+                filter_params.append(value)
+
+        before = None
+        if cursor:
+            ts, _, row_id = cursor.rpartition("|")
+            cursor_dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+            if cursor_dt.tzinfo is not None:
+                # Stored timestamps are naive UTC; compare like with like
+                cursor_dt = cursor_dt.astimezone(timezone.utc).replace(tzinfo=None)
+                ts = cursor_dt.isoformat()
+            before = (ts, int(row_id))
+            end = min(end, cursor_dt + timedelta(microseconds=1))
+
+        rows: List[Dict] = []
+        day = end.date()
+        while day >= start.date() and len(rows) < limit:
+            path = self._partition_path(day)
+            if path.exists():
+                query = "SELECT * FROM audit_log WHERE timestamp >= ? AND timestamp < ? " + filters
+                params = [start.isoformat(), end.isoformat()] + filter_params
+                if before:
+                    query += "AND (timestamp, id) < (?, ?) "
+                    params.extend(before)
+                query += "ORDER BY timestamp DESC, id DESC LIMIT ?"
+                params.append(limit - len(rows))
+                with sqlite3.connect(path) as conn:
+                    conn.row_factory = sqlite3.Row
+                    rows.extend(dict(row) for row in conn.execute(query, params).fetchall())
+            day -= timedelta(days=1)
+
+        next_cursor = None
+        if len(rows) >= limit:
+            last = rows[-1]
+            next_cursor = f"{last['timestamp']}|{last['id']}"
+        return rows, next_cursor
 
     def get_recent(self, hours: int = 24, user: str = None, table_name: str = None) -> List[Dict]:
         """Get recent audit entries."""
-        cutoff = (datetime.utcnow() - timedelta(hours=hours)).isoformat()
-        query = "SELECT * FROM audit_log WHERE timestamp > ? "
-        params = [cutoff]
+        end = datetime.utcnow()
+        rows, _ = self.query(end - timedelta(hours=hours), end, table_name=table_name, user=user)
+        return rows
+
+    def get_user_activity(self, user: str, hours: int = 24) -> List[Dict]:
+        """Get all activity for a specific user."""
+        return self.get_recent(hours=hours, user=user)
 
-        if user:
-            query += "AND user = ? "
-            params.append(user)
+    def get_rollups(
+        self,
+        start: datetime,
+        end: datetime,
+        table_name: str = None,
+        operation: str = None,
+    ) -> List[Dict]:
+        """Hourly counts and total duration per table/operation in [start, end)."""
+        query = "SELECT * FROM audit_hourly WHERE hour >= ? AND hour < ? "
+        params = [start.strftime("%Y-%m-%dT%H:00"), end.isoformat()]
 
         if table_name:
             query += "AND table_name = ? "
             params.append(table_name)
 
-        query += "ORDER BY timestamp DESC LIMIT 200"
+        if operation:
+            query += "AND operation = ? "
+            params.append(operation)
+
+        query += "ORDER BY hour, table_name, operation"
 
         with sqlite3.connect(self.db_path) as conn:
             conn.row_factory = sqlite3.Row
             rows = conn.execute(query, params).fetchall()
             return [dict(row) for row in rows]
 
-    def get_user_activity(self, user: str, hours: int = 24) -> List[Dict]:
-        """Get all activity for a specific user."""
-        return self.get_recent(hours=hours, user=user)
+    # ── Maintenance ───────────────────────────────────────────────────────
+
+    def migrate_legacy(self, chunk_size: int = 5000) -> int:
+        """Move rows from the pre-partitioning ``audit_log`` table into partitions.
+
+        The table is renamed to ``audit_log_migrating`` and each chunk is
+        deleted from it once written, so a run that fails or dies part way
+        is resumed by the next one.  One worker process migrates at a time
+        (the ``audit_migration`` claim); a claim whose heartbeat is older
+        than ``_MIGRATION_STALE_SECS`` is taken over.  A process killed
+        between writing a chunk and deleting it leaves that one chunk
+        copied twice.
+        """
+        owner = f"{os.getpid()}:{threading.get_ident()}"
+        with sqlite3.connect(self.db_path) as conn:
+            tables = {name for name, in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' "
+                "AND name IN ('audit_log', 'audit_log_migrating')"
+            )}
+            if not tables:
+                return 0
+            now = time.time()
+            claimed = conn.execute(
+                "UPDATE audit_migration SET owner = ?, heartbeat = ? WHERE id = 1 AND heartbeat < ?",
+                (owner, now, now - _MIGRATION_STALE_SECS),
+            ).rowcount
+            conn.commit()
+            if not claimed:
+                return 0   # another process is migrating
+            moved = 0
+            try:
+                if "audit_log_migrating" not in tables:
+                    conn.execute("ALTER TABLE audit_log RENAME TO audit_log_migrating")
+                    conn.commit()
+                while True:
+                    chunk = conn.execute("""
+                        SELECT id, timestamp, operation, table_name, sql_query, user, remote_ip,
+                               affected_rows, status, error_msg, duration_ms
+                        FROM audit_log_migrating ORDER BY id LIMIT ?
+                    """, (chunk_size,)).fetchall()
+                    if not chunk:
+                        break
+                    with self.lock:
+                        self._write([row[1:] for row in chunk])
+                    conn.execute("DELETE FROM audit_log_migrating WHERE id <= ?", (chunk[-1][0],))
+                    conn.execute("UPDATE audit_migration SET heartbeat = ? WHERE id = 1 AND owner = ?",
+                                 (time.time(), owner))
+                    conn.commit()
+                    moved += len(chunk)
+                conn.execute("DROP TABLE audit_log_migrating")
+                conn.commit()
+            finally:
+                # Release the claim so the next run resumes straight away after a failure
+                conn.execute("UPDATE audit_migration SET heartbeat = 0 WHERE id = 1 AND owner = ?", (owner,))
+                conn.commit()
+            conn.execute("VACUUM")
+            return moved
+
+    def prune(self, retention_days: int = None) -> Dict[str, int]:
+        """Drop expired raw partitions and rollups."""
+        days = AUDIT_RETENTION_DAYS if retention_days is None else retention_days
+        today = datetime.utcnow().date()
+        stats = {"migrated": self.migrate_legacy()}
+        stats["partitions_dropped"] = self.drop_partitions(today - timedelta(days=days))
+        rollup_cutoff = (today - timedelta(days=AUDIT_ROLLUP_RETENTION_DAYS)).isoformat()
+        with self.lock:
+            with sqlite3.connect(self.db_path) as conn:
+                stats["rollups_deleted"] = conn.execute(
+                    "DELETE FROM audit_hourly WHERE hour < ?", (rollup_cutoff,)
+                ).rowcount
+                conn.commit()
+        return stats
+
+    def start_maintenance(self, interval: int = 3600):
+        """Run ``prune`` in a daemon thread every ``interval`` seconds."""
+        if self._maintenance_started or interval <= 0:
+            return
+        self._maintenance_started = True
+
+        def maintenance():
+            log = logging.getLogger("AuditLogger")
+            while True:
+                try:
+                    stats = self.prune()
+                    if any(stats.values()):
+                        log.info(f"Audit store pruned: {stats}")
+                except Exception as e:
+                    log.error(f"Audit store maintenance failed: {e}")
+                time.sleep(interval)
+
+        thread = threading.Thread(target=maintenance, daemon=True, name="AuditMaintenance")
+        thread.start()
 
 
 # Global instances
@@ -219,7 +729,7 @@ audit_logger = AuditLogger()
 
 
 def log_exception(exc: Exception, source: str = "unknown", remote_ip: str = None) -> int:
-    """Convenience function to log an exception."""
+    """Convenience function to log an exception.  Returns the error-group ID."""
     return error_tracker.track(exc, source=source, remote_ip=remote_ip)
 
 
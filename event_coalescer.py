@@ -0,0 +1,186 @@
+"""
+Group commit for the desktop apps' heartbeat and activity writes.
+
+Every client used to send its own ``UPDATE user_ping_logs`` per heartbeat,
+``INSERT INTO activity_log`` per event, and hourly purge DELETEs.  The API
+server now takes them on ``POST /api/events``, buffers them in memory and
+writes them once per ``ORS_EVENT_FLUSH_SECS``:
+
+  * heartbeats — the latest per session, applied as one multi-row
+    ``UPDATE ... SET last_seen = CASE id ...`` per chunk (an UPDATE rather
+    than an upsert, so a session purged meanwhile is not re-created)
+  * activity   — one multi-row INSERT per chunk
+
+Purging runs here as a scheduled job every ``ORS_EVENT_PURGE_SECS``.  With
+Redis the workers share a lock so only one of them purges per interval.
+
+Buffered events are lost if the worker dies before the next flush, which
+is acceptable for presence and activity data; a clean shutdown flushes.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+FLUSH_SECS  = float(os.environ.get("ORS_EVENT_FLUSH_SECS", "1"))
+PURGE_SECS  = int(os.environ.get("ORS_EVENT_PURGE_SECS", "3600"))
+MAX_PENDING = int(os.environ.get("ORS_EVENT_MAX_PENDING", "50000"))   # activity rows held before dropping
+CHUNK_ROWS  = 500
+PURGE_LOCK_KEY = "ors-lock:events-purge"   # outside "ors:*", which cache clears delete
+
+_ACTIVITY_COLUMNS = ("event_time", "event_type", "username", "ip_address", "hostname", "details")
+
+PURGE_STATEMENTS = (
+    ("user_ping_logs", "DELETE FROM user_ping_logs WHERE login_time < CURDATE()"),
+    ("activity_log",   "DELETE FROM activity_log WHERE event_time < NOW() - INTERVAL 1 HOUR"),
+)
+
+logger = logging.getLogger(__name__)
+
+
+class EventCoalescer:
+    """Buffers heartbeat and activity events and writes them in batches."""
+
+    def __init__(self, db, on_write: Optional[Callable[[List[str]], None]] = None, redis=None):
+        self.db = db
+        self.on_write = on_write          # called with the tables each flush wrote
+        self.redis = redis                # for the cross-worker purge lock
+        self._lock = threading.Lock()
+        self._heartbeats: Dict[int, Tuple[str, int]] = {}   # session id -> (last_seen, ping ms)
+        self._activity: List[tuple] = []
+        self._started = False
+        self._stats = {
+            "heartbeats_received": 0, "heartbeats_written": 0,
+            "activity_received": 0, "activity_written": 0, "activity_dropped": 0,
+            "flushes": 0, "statements": 0, "errors": 0,
+            "purges": 0, "purged_rows": 0, "last_purge": None, "last_error": None,
+        }
+
+    # ── Intake ────────────────────────────────────────────────────────────
+
+    def add(self, heartbeats: List[dict], activity: List[dict]) -> int:
+        """Queue events; returns how many were accepted."""
+        accepted = 0
+        with self._lock:
+            for hb in heartbeats:
+                # Only the newest heartbeat per session matters
+                self._heartbeats[hb["session_id"]] = (hb["last_seen"], hb["ping_ms"])
+                accepted += 1
+            self._stats["heartbeats_received"] += len(heartbeats)
+            room = MAX_PENDING - len(self._activity)
+            for ev in activity[:max(room, 0)]:
+                self._activity.append(tuple(ev.get(col) for col in _ACTIVITY_COLUMNS))
+                accepted += 1
+            self._stats["activity_received"] += len(activity)
+            if len(activity) > room:
+                self._stats["activity_dropped"] += len(activity) - max(room, 0)
+        return accepted
+
+    # ── Flushing ──────────────────────────────────────────────────────────
+
+    def _execute(self, sql: str, params: tuple) -> bool:
+        _, err = self.db.execute_query_with_exception(sql, params)
+        with self._lock:
+            self._stats["statements"] += 1
+            if err:
+                self._stats["errors"] += 1
+                self._stats["last_error"] = str(err)[:300]
+        if err:
+            logger.error(f"Event flush failed: {err}")
+        return err is None
+
+    def flush(self) -> None:
+        with self._lock:
+            heartbeats, self._heartbeats = self._heartbeats, {}
+            activity, self._activity = self._activity, []
+        if not heartbeats and not activity:
+            return
+
+        written = []
+        items = list(heartbeats.items())
+        for i in range(0, len(items), CHUNK_ROWS):
+            chunk = items[i:i + CHUNK_ROWS]
+            cases = " ".join("WHEN %s THEN %s" for _ in chunk)
+            ids = ", ".join("%s" for _ in chunk)
+            params = tuple(v for sid, (seen, _) in chunk for v in (sid, seen))
+            params += tuple(v for sid, (_, ms) in chunk for v in (sid, ms))
+            params += tuple(sid for sid, _ in chunk)
+            if self._execute(
+                f"UPDATE user_ping_logs SET last_seen = CASE id {cases} END, "
+                f"last_ping_ms = CASE id {cases} END WHERE id IN ({ids})",
+                params,
+            ):
+                with self._lock:
+                    self._stats["heartbeats_written"] += len(chunk)
+                if "user_ping_logs" not in written:
+                    written.append("user_ping_logs")
+
+        row = "(" + ", ".join("%s" for _ in _ACTIVITY_COLUMNS) + ")"
+        for i in range(0, len(activity), CHUNK_ROWS):
+            chunk = activity[i:i + CHUNK_ROWS]
+            if self._execute(
+                f"INSERT INTO activity_log ({', '.join(_ACTIVITY_COLUMNS)}) VALUES "
+                + ", ".join(row for _ in chunk),
+                tuple(v for ev in chunk for v in ev),
+            ):
+                with self._lock:
+                    self._stats["activity_written"] += len(chunk)
+                if "activity_log" not in written:
+                    written.append("activity_log")
+
+        with self._lock:
+            self._stats["flushes"] += 1
+        if written and self.on_write is not None:
+            self.on_write(written)
+
+    # ── Purging ───────────────────────────────────────────────────────────
+
+    def purge(self) -> None:
+        """Delete expired heartbeat and activity rows (once across workers with Redis)."""
+        if self.redis is not None:
+            try:
+                if not self.redis.set(PURGE_LOCK_KEY, os.getpid(), nx=True, ex=max(PURGE_SECS - 5, 1)):
+                    return   # another worker purged this interval
+            except Exception:
+                pass         # Redis down — purge anyway; the DELETEs are idempotent
+        removed = 0
+        for table, sql in PURGE_STATEMENTS:
+            result, err = self.db.execute_query_with_exception(sql)
+            if err:
+                logger.error(f"Event purge ({table}) failed: {err}")
+            elif isinstance(result, int):
+                removed += result
+        with self._lock:
+            self._stats["purges"] += 1
+            self._stats["purged_rows"] += removed
+            self._stats["last_purge"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        logger.info(f"Event purge removed {removed} row(s)")
+
+    # ── Background thread ─────────────────────────────────────────────────
+
+    def start(self) -> None:
+        if self._started:
+            return
+        self._started = True
+
+        def run():
+            next_purge = time.monotonic() + 60   # first purge shortly after startup
+            while True:
+                time.sleep(FLUSH_SECS)
+                try:
+                    self.flush()
+                    if PURGE_SECS > 0 and time.monotonic() >= next_purge:
+                        next_purge = time.monotonic() + PURGE_SECS
+                        self.purge()
+                except Exception as e:
+                    logger.error(f"Event coalescer error: {e}")
+
+        threading.Thread(target=run, daemon=True, name="ors-events").start()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, pending_heartbeats=len(self._heartbeats),
+                        pending_activity=len(self._activity), flush_secs=FLUSH_SECS,
+                        purge_secs=PURGE_SECS)
@@ -9,6 +9,7 @@ from PyQt5.QtCore import Qt, QDate
 from api_db_manager import db_manager
 from db_worker import run_func_async
 from date_range_widget import DateRangeWidget
+from schema_catalog import schema_catalog
 import datetime
 
 
@@ -377,23 +378,19 @@ class FundTransferPage(QWidget):
         except Exception:
             pass
         try:
-            existing = db_manager.execute_query(
-                "SELECT INDEX_NAME FROM INFORMATION_SCHEMA.STATISTICS "
-                "WHERE TABLE_SCHEMA = DATABASE() "
-                "AND TABLE_NAME = 'extra_space_fund_transfer' "
-                "AND INDEX_NAME IN ('uq_extra_space', 'uq_extra_space_date')"
-            )
-            existing_names = {r['INDEX_NAME'] for r in existing} if existing else set()
+            existing_names = schema_catalog.indexes('extra_space_fund_transfer', db=db_manager)
 
             if 'uq_extra_space' in existing_names:
                 db_manager.execute_query(
                     "ALTER TABLE extra_space_fund_transfer DROP INDEX uq_extra_space"
                 )
+                schema_catalog.invalidate()
 
             if 'uq_extra_space_date' not in existing_names:
                 db_manager.execute_query(
                     "ALTER TABLE extra_space_fund_transfer ADD UNIQUE KEY uq_extra_space_date (report_date)"
                 )
+                schema_catalog.invalidate()
         except Exception:
             pass
 
@@ -9,6 +9,7 @@ from PyQt5.QtPrintSupport import QPrinter, QPrintDialog
 from api_db_manager import db_manager
 from db_worker import run_query_async
 from date_range_widget import DateRangeWidget
+from schema_catalog import schema_catalog
 
 COLUMN_GROUPS = [
     ("GCASH OUT",         [("Lotes", ["gcash_out_lotes"], True),
@@ -433,23 +434,8 @@ class GlobalOtherServicesPage(QWidget):
             self.os_filter_selector.blockSignals(False)
 
     # ── Column existence cache ────────────────────────────────────────────
-    _col_cache: dict = {}
-
     def _get_table_cols(self, tbl):
-        if tbl not in self.__class__._col_cache:
-            try:
-                rows = db_manager.execute_query(
-                    "SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS "
-                    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
-                    (tbl,)
-                )
-                self.__class__._col_cache[tbl] = {
-                    (r['COLUMN_NAME'] if isinstance(r, dict) else r[0])
-                    for r in rows
-                } if rows else set()
-            except Exception:
-                self.__class__._col_cache[tbl] = set()
-        return self.__class__._col_cache[tbl]
+        return schema_catalog.columns(tbl, db=db_manager)
 
     # ── Populate ──────────────────────────────────────────────────────────
     def populate_table(self):
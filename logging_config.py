@@ -5,10 +5,14 @@ Structured logging with rotation, by module, and multiple outputs.
 
 import os
 import sys
+import copy
 import json
+import time
+import queue
+import atexit
 import logging
 from pathlib import Path
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 from datetime import datetime
 
 # Create logs directory
@@ -30,6 +34,8 @@ class ColoredFormatter(logging.Formatter):
     """Add colors to console logs."""
 
     def format(self, record):
+        # Color a copy so handlers that run after this one see the plain level
+        record = copy.copy(record)
         log_color = COLORS.get(record.levelname, COLORS["RESET"])
         record.levelname = f"{log_color}{record.levelname}{COLORS['RESET']}"
         return super().format(record)
@@ -52,14 +58,138 @@ class JSONFormatter(logging.Formatter):
         return json.dumps(log_data)
 
 
-def setup_logging(app_name: str = "ors", level: str = "INFO"):
+class FastJSONFormatter(logging.Formatter):
+    """JSONFormatter-compatible output built from pre-serialized fragments.
+
+    The constant part of each line (level, module, path) is encoded once per
+    call site and cached; only the timestamp, message and exception are
+    encoded per record.  The finished line is memoized on the record so the
+    main and error file handlers share one serialization.
+    """
+
+    _encode = json.JSONEncoder().encode
+
+    def __init__(self):
+        super().__init__()
+        self._prefixes = {}   # (levelname, name, pathname) -> encoded fragment
+
+    def format(self, record):
+        line = getattr(record, "_ors_json", None)
+        if line is not None:
+            return line
+        encode = self._encode
+        key = (record.levelname, record.name, record.pathname)
+        fragments = self._prefixes.get(key)
+        if fragments is None:
+            fragments = (
+                f', "level": {encode(record.levelname)}, "module": {encode(record.name)}',
+                f', "pathname": {encode(record.pathname)}',
+            )
+            self._prefixes[key] = fragments
+        line = (
+            f'{{"timestamp": "{datetime.utcfromtimestamp(record.created).isoformat()}"'
+            f'{fragments[0]}'
+            f', "message": {encode(record.getMessage())}'
+            f'{fragments[1]}'
+            f', "lineno": {record.lineno}'
+        )
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            line += f', "exception": {encode(record.exc_text)}'
+        line += "}"
+        record._ors_json = line
+        return line
+
+
+class RequestLogSampler(logging.Filter):
+    """Sample high-volume INFO/DEBUG lines once a per-second budget is spent.
+
+    Up to ``per_second`` records pass each second; beyond that only every
+    ``keep_every``-th record is kept.  WARNING and above always pass.
+    Counters are approximate (updated without a lock).
+    """
+
+    def __init__(self, per_second: int = 50, keep_every: int = 10):
+        super().__init__()
+        self.per_second = per_second
+        self.keep_every = max(1, keep_every)
+        self._second = 0
+        self._seen_this_second = 0
+        self.kept = 0
+        self.sampled_out = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.per_second <= 0:
+            return True
+        now = int(time.monotonic())
+        if now != self._second:
+            self._second = now
+            self._seen_this_second = 0
+        self._seen_this_second += 1
+        over = self._seen_this_second - self.per_second
+        if over <= 0 or over % self.keep_every == 0:
+            self.kept += 1
+            return True
+        self.sampled_out += 1
+        return False
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """Non-blocking QueueHandler for request threads.
+
+    INFO/DEBUG records are dropped (and counted) when the queue is full;
+    WARNING and above wait for space so they are never lost.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Merge args now (they may be mutated later) but leave formatting to
+        # the listener thread.  Exception text is rendered here because the
+        # traceback must not outlive the calling frame.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if record.levelno >= logging.WARNING:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+# Active queue pipeline / sampler (set up by setup_logging)
+_queue_handler = None
+_queue_listener = None
+_request_sampler = RequestLogSampler(
+    per_second=int(os.environ.get("ORS_ACCESS_LOG_QPS", "50")),
+    keep_every=int(os.environ.get("ORS_ACCESS_LOG_SAMPLE", "10")),
+)
+
+
+def setup_logging(app_name: str = "ors", level: str = "INFO", queued: bool = False):
     """
     Setup centralized logging for the application.
 
     Args:
         app_name: Name of the application (for log file naming)
         level: Logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
+        queued: Route records through a bounded queue to a dedicated writer
+            thread so callers never block on console/file I/O
+            (queue size: ORS_LOG_QUEUE_MAX)
     """
+    global _queue_handler, _queue_listener
     log_level = getattr(logging, level.upper(), logging.INFO)
 
     # Root logger configuration
@@ -69,6 +199,11 @@ def setup_logging(app_name: str = "ors", level: str = "INFO"):
     # Remove any existing handlers
     for handler in root_logger.handlers[:]:
         root_logger.removeHandler(handler)
+    if _queue_listener is not None:
+        _queue_listener.stop()
+        _queue_listener = None
+        _queue_handler = None
+    handlers = []
 
     # ── Console Handler (colored) ──────────────────────────────────────────────
     console_handler = logging.StreamHandler(sys.stdout)
@@ -78,7 +213,7 @@ def setup_logging(app_name: str = "ors", level: str = "INFO"):
         datefmt="%Y-%m-%d %H:%M:%S"
     )
     console_handler.setFormatter(console_formatter)
-    root_logger.addHandler(console_handler)
+    handlers.append(console_handler)
 
     # ── File Handler (JSON, rotated daily) ─────────────────────────────────────
     file_path = LOG_DIR / f"{app_name}.log"
@@ -88,9 +223,9 @@ def setup_logging(app_name: str = "ors", level: str = "INFO"):
         backupCount=30,  # Keep 30 days of logs
     )
     file_handler.setLevel(log_level)
-    file_formatter = JSONFormatter()
+    file_formatter = FastJSONFormatter() if queued else JSONFormatter()
     file_handler.setFormatter(file_formatter)
-    root_logger.addHandler(file_handler)
+    handlers.append(file_handler)
 
     # ── Error File Handler (ERROR+ only, rotated) ─────────────────────────────
     error_path = LOG_DIR / f"{app_name}_errors.log"
@@ -101,9 +236,19 @@ def setup_logging(app_name: str = "ors", level: str = "INFO"):
     )
     error_handler.setLevel(logging.ERROR)
     error_handler.setFormatter(file_formatter)
-    root_logger.addHandler(error_handler)
+    handlers.append(error_handler)
+
+    if queued:
+        log_queue = queue.Queue(maxsize=int(os.environ.get("ORS_LOG_QUEUE_MAX", "10000")))
+        _queue_handler = _DroppingQueueHandler(log_queue)
+        _queue_listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _queue_listener.start()
+        root_logger.addHandler(_queue_handler)
+    else:
+        for handler in handlers:
+            root_logger.addHandler(handler)
 
-    root_logger.info(f"Logging initialized: {app_name} at level {level}")
+    root_logger.info(f"Logging initialized: {app_name} at level {level}{' (queued)' if queued else ''}")
     root_logger.info(f"Logs directory: {LOG_DIR}")
 
     return root_logger
@@ -112,3 +257,37 @@ def setup_logging(app_name: str = "ors", level: str = "INFO"):
 def get_logger(name: str) -> logging.Logger:
     """Get a logger for a specific module."""
     return logging.getLogger(name)
+
+
+def get_sampled_logger(name: str) -> logging.Logger:
+    """Get a logger whose INFO/DEBUG output is sampled at high volume.
+
+    Use for per-request lines; warnings and errors are always kept.
+    Tune with ORS_ACCESS_LOG_QPS (full-fidelity lines per second) and
+    ORS_ACCESS_LOG_SAMPLE (keep 1 in N beyond that).
+    """
+    logger = logging.getLogger(name)
+    if _request_sampler not in logger.filters:
+        logger.addFilter(_request_sampler)
+    return logger
+
+
+def get_logging_stats() -> dict:
+    """Queue depth plus dropped/sampled counters for the stats endpoint."""
+    return {
+        "queued":      _queue_handler is not None,
+        "queue_depth": _queue_handler.queue.qsize() if _queue_handler else 0,
+        "queue_max":   _queue_handler.queue.maxsize if _queue_handler else 0,
+        "dropped":     _queue_handler.dropped if _queue_handler else 0,
+        "sampled_out": _request_sampler.sampled_out,
+        "sampled_kept": _request_sampler.kept,
+    }
+
+
+def _stop_queue_listener():
+    """Flush queued records on interpreter exit."""
+    if _queue_listener is not None:
+        _queue_listener.stop()
+
+
+atexit.register(_stop_queue_listener)
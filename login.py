@@ -697,6 +697,17 @@ class LoginWindow(QWidget):
                     # ping_monitor removed
                     self.save_credentials(db_username)
 
+                    # Identify this session to the API server's per-client accounting
+                    _branch_id = branch if role not in ('admin', 'super_admin') else None
+                    db_manager.set_client_identity(db_username, _branch_id)
+                    try:
+                        from api_config import API_MODE as _API_MODE
+                        if _API_MODE:
+                            import api_db_manager as _admin_api
+                            _admin_api.db_manager.set_client_identity(db_username, _branch_id)
+                    except ImportError:
+                        pass
+
                     # Show splash immediately — no blocking dialog before loading
                     splash = self._make_splash(db_username, role, user_data)
                     splash.show()
@@ -731,6 +742,7 @@ class LoginWindow(QWidget):
                             if _API_MODE:
                                 from Client.api_db_manager import APIDbManager
                                 _client_db = APIDbManager()
+                                _client_db.set_client_identity(db_username, branch)
                                 if not _client_db.connect():
                                     splash.close()
                                     self.show_message(
@@ -17,6 +17,9 @@ except ImportError:
 from PyQt5.QtWidgets import QApplication, QMessageBox
 from app_logging import setup_logging, get_logger
 setup_logging()
+
+import tracing
+tracing.configure_export(service_name="ors-desktop")   # only when ORS_TRACE_FILE is set
 from Client.client_dashboard import ClientDashboard
 from login import LoginWindow
 
@@ -134,6 +137,7 @@ class LoginManager:
             if _API_MODE:
                 from Client.api_db_manager import APIDbManager
                 _client_db = APIDbManager()
+                _client_db.set_client_identity(username, branch)
                 _client_db.connect()
             else:
                 _client_db = db_manager
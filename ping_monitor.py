@@ -4,6 +4,8 @@ import socket
 import time
 from datetime import datetime
 
+from schema_catalog import schema_catalog
+
 logger = logging.getLogger(__name__)
 
 from PyQt5.QtCore import Qt, QTimer, QObject
@@ -40,6 +42,7 @@ class PingMonitor(QObject):
         self._session_id = None  # PK of the current session row
         self._ip_address = None  # Lazy-loaded on first use
         self._activity_table_ok = False
+        self._server_events = None  # True once the API server accepted events (/api/events)
 
     # ── Public API ────────────────────────────────────────────────────────
 
@@ -49,6 +52,7 @@ class PingMonitor(QObject):
         self._username = username
         self._role = role
         self._session_id = None
+        self._server_events = None
 
         # Lazy-load IP address on first login (not on import)
         if self._ip_address is None:
@@ -104,13 +108,20 @@ class PingMonitor(QObject):
             def run(self):
                 try:
                     now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                    # API mode: the server batches these into one INSERT a second.
+                    # Older servers have no /api/events; write directly then.
+                    if hasattr(self.db, "post_events") and self.db.post_events(activity=[{
+                        "event_time": now, "event_type": self.event_type,
+                        "username": self.username, "ip_address": self.ip,
+                        "hostname": self.hostname, "details": self.details or None,
+                    }]):
+                        return
                     self.db.execute_query(
                         "INSERT INTO activity_log "
                         "(event_time, event_type, username, ip_address, hostname, details) "
                         "VALUES (%s, %s, %s, %s, %s, %s)",
                         (now, self.event_type, self.username, self.ip, self.hostname,
                          self.details or None),
-                        timeout=3  # Short timeout for logging
                     )
                 except Exception as e:
                     logger.debug(f"PingMonitor log_event failed (background): {e}")
@@ -179,6 +190,14 @@ class PingMonitor(QObject):
 
         try:
             now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            if hasattr(self._db, "post_events"):
+                # API mode: coalesced server-side with every other client's heartbeat.
+                # Older servers have no /api/events; fall back to the direct UPDATE.
+                self._server_events = self._db.post_events(heartbeats=[
+                    {"session_id": self._session_id, "last_seen": now, "ping_ms": ping_ms}
+                ])
+                if self._server_events:
+                    return
             self._db.execute_query(
                 "UPDATE user_ping_logs SET last_seen=%s, last_ping_ms=%s WHERE id=%s",
                 (now, ping_ms, self._session_id)
@@ -199,8 +218,12 @@ class PingMonitor(QObject):
             logger.error("PingMonitor session close failed: %s", e)
 
     def _auto_purge(self):
-        """Delete previous-day rows every hour, no login required."""
-        if not self._db:
+        """Delete previous-day rows every hour, no login required.
+
+        Skipped while the API server accepts our events (/api/events): it
+        runs this purge itself (event_coalescer.py).
+        """
+        if not self._db or self._server_events:
             return
         try:
             self._db.execute_query(
@@ -244,14 +267,9 @@ class PingMonitor(QObject):
         if not self._db:
             return
         try:
-            # Use INFORMATION_SCHEMA so execute_query returns rows (SELECT path)
-            cols = self._db.execute_query(
-                "SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS "
-                "WHERE TABLE_NAME = 'user_ping_logs' "
-                "AND TABLE_SCHEMA = DATABASE()"
-            )
-            col_names = {row['COLUMN_NAME'] for row in cols} if cols else set()
-            if 'login_time' not in col_names or 'ip_address' not in col_names:
+            # Empty when the table is new (created after the catalog loaded)
+            col_names = schema_catalog.columns('user_ping_logs', db=self._db)
+            if col_names and ('login_time' not in col_names or 'ip_address' not in col_names):
                 # Old schema detected — safe to drop since data is purged daily
                 self._db.execute_query("DROP TABLE user_ping_logs")
                 self._db.execute_query("""
@@ -268,6 +286,7 @@ class PingMonitor(QObject):
                         INDEX idx_upl_user_login (username, login_time)
                     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
                 """)
+                schema_catalog.invalidate()
                 logger.info("PingMonitor table migrated to new schema.")
         except Exception as e:
             logger.error("PingMonitor migration failed: %s", e)
@@ -0,0 +1,260 @@
+"""
+Connection pool telemetry and optional adaptive sizing for DatabaseManagerPooled.
+
+Telemetry (always on):
+  * checkout wait — histogram of the time ``engine.connect()`` waited for a
+    pooled connection, plus pool timeouts
+  * connection age — how long connections lived when closed, and the age
+    of the oldest open one
+  * churn — connections created / closed per minute, and how many were
+    created as overflow (beyond the persistent pool)
+
+Adaptive sizing (``ORS_POOL_ADAPTIVE=1``): the number of idle connections
+the pool keeps (its persistent size) follows the observed concurrency.  The
+checked-out count is sampled every second; every ``ORS_POOL_ADAPT_SECS``
+the persistent size becomes the window's peak plus ``HEADROOM``, clamped
+to ``ORS_POOL_MIN`` .. ``ORS_POOL_MAX``.  The hard ceiling (persistent
+maximum + ``ORS_POOL_OVERFLOW``) does not change.  Shrinking is lazy: a
+surplus connection is closed when it is next returned to the pool, so with
+several workers per host the idle connections held against MySQL's
+``max_connections`` drop after a quiet spell instead of staying at the
+configured maximum.
+
+QueuePool has no public resize, so the sizer sets the ``maxsize`` of the
+pool's idle queue (``pool._pool``), which is what ``pool.size()`` reports;
+QueuePool's own overflow counter stays relative to the size the engine was
+created with, so telemetry counts overflow against ``pool.size()`` instead.
+Written against the SQLAlchemy 2.0 QueuePool (2.0.43, as pinned in
+Requirements.txt); on any other major version the sizer leaves the pool alone.
+"""
+
+import bisect
+import collections
+import functools
+import logging
+import math
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+POOL_SIZE     = int(os.environ.get("ORS_POOL_SIZE", "50"))
+ADAPTIVE      = os.environ.get("ORS_POOL_ADAPTIVE", "0") == "1"
+POOL_MIN      = int(os.environ.get("ORS_POOL_MIN", "5"))
+POOL_MAX      = int(os.environ.get("ORS_POOL_MAX", str(POOL_SIZE)))
+ADAPT_SECS    = float(os.environ.get("ORS_POOL_ADAPT_SECS", "60"))
+HEADROOM      = 1.25
+SAMPLE_SECS   = 1.0
+
+_WAIT_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+_AGE_BUCKETS_S   = (1, 10, 60, 300, 900, 1800, 3600)
+_RATE_WINDOW     = 60.0
+
+logger = logging.getLogger(__name__)
+
+
+class _Histogram:
+    """Fixed-bucket histogram; ``bounds`` are inclusive upper edges."""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.total:
+            return None
+        rank = q * self.total
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return self.max
+
+    def summary(self, unit: str) -> dict:
+        labels = [f"<={b}{unit}" for b in self.bounds] + [f">{self.bounds[-1]}{unit}"]
+        return {
+            "count":   self.total,
+            "mean":    round(self.sum / self.total, 2) if self.total else None,
+            "p50":     self.quantile(0.50),
+            "p95":     self.quantile(0.95),
+            "p99":     self.quantile(0.99),
+            "max":     round(self.max, 2),
+            "buckets": {label: n for label, n in zip(labels, self.counts) if n},
+        }
+
+
+class PoolTelemetry:
+    """Pool event counters for one DatabaseManagerPooled (survives reconnects)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wait = _Histogram(_WAIT_BUCKETS_MS)
+        self._lifetimes = _Histogram(_AGE_BUCKETS_S)
+        self._created: collections.deque = collections.deque()
+        self._closed: collections.deque = collections.deque()
+        self._open: Dict[int, float] = {}            # id(connection record) -> created at
+        self._counts = {"created": 0, "closed": 0, "overflow_created": 0, "invalidated": 0, "timeouts": 0}
+
+    # ── Event hooks ───────────────────────────────────────────────────────
+
+    def attach(self, engine) -> None:
+        from sqlalchemy import event
+
+        pool = engine.pool
+        try:
+            created_size = pool.size()   # overflow() counts from this, whatever the sizer does later
+        except AttributeError:
+            created_size = None
+
+        def on_connect(dbapi_conn, record):
+            now = time.monotonic()
+            record.info["ors_created"] = now
+            with self._lock:
+                self._counts["created"] += 1
+                self._created.append(now)
+                self._open[id(record)] = now
+                if created_size is not None:
+                    # Open connections (this one included) beyond the current persistent size
+                    if pool.overflow() + created_size > pool.size():
+                        self._counts["overflow_created"] += 1
+
+        def on_close(dbapi_conn, record):
+            now = time.monotonic()
+            with self._lock:
+                self._counts["closed"] += 1
+                self._closed.append(now)
+                created = self._open.pop(id(record), None)
+                if created is not None:
+                    self._lifetimes.add(now - created)
+
+        def on_invalidate(dbapi_conn, record, exception):
+            with self._lock:
+                self._counts["invalidated"] += 1
+
+        event.listen(engine, "connect", on_connect)
+        event.listen(engine, "close", on_close)
+        event.listen(engine, "invalidate", on_invalidate)
+
+    def record_wait(self, seconds: float) -> None:
+        with self._lock:
+            self._wait.add(seconds * 1000)
+
+    def record_timeout(self) -> None:
+        with self._lock:
+            self._counts["timeouts"] += 1
+
+    # ── Reporting ─────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _per_minute(stamps: collections.deque, now: float) -> int:
+        """Caller holds the lock."""
+        while stamps and now - stamps[0] > _RATE_WINDOW:
+            stamps.popleft()
+        return len(stamps)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            oldest = min(self._open.values()) if self._open else None
+            return dict(
+                self._counts,
+                open=len(self._open),
+                created_per_min=self._per_minute(self._created, now),
+                closed_per_min=self._per_minute(self._closed, now),
+                oldest_connection_secs=round(now - oldest, 1) if oldest is not None else None,
+                checkout_wait_ms=self._wait.summary("ms"),
+                connection_lifetime_secs=self._lifetimes.summary("s"),
+            )
+
+
+class AdaptivePoolSizer:
+    """Moves a QueuePool's persistent size between bounds from observed concurrency."""
+
+    def __init__(self, get_engine: Callable, minimum: int = POOL_MIN, maximum: int = POOL_MAX,
+                 window: float = ADAPT_SECS):
+        self.get_engine = get_engine
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.window = window
+        self._lock = threading.Lock()
+        self._started = False
+        self._peak = 0
+        self._resizes: List[dict] = []
+        self._target: Optional[int] = None
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1)
+    def _supported() -> bool:
+        import sqlalchemy
+        if sqlalchemy.__version__.split(".")[0] == "2":
+            return True
+        logger.warning(f"Adaptive pool sizing disabled: written for SQLAlchemy 2.x, found {sqlalchemy.__version__}")
+        return False
+
+    @staticmethod
+    def _queue(engine):
+        # QueuePool keeps idle connections in a bounded queue; its maxsize is
+        # the persistent pool size (what pool.size() reports)
+        return engine.pool._pool
+
+    def apply(self, size: int) -> None:
+        engine = self.get_engine()
+        if engine is None or not self._supported():
+            return
+        try:
+            queue = self._queue(engine)
+        except AttributeError:
+            return   # not a QueuePool
+        size = min(max(size, self.minimum), self.maximum)
+        if queue.maxsize == size:
+            return
+        previous, queue.maxsize = queue.maxsize, size
+        with self._lock:
+            self._target = size
+            self._resizes.append({"at": time.strftime("%Y-%m-%d %H:%M:%S"), "from": previous, "to": size})
+            del self._resizes[:-20]
+        logger.info(f"Adaptive pool: persistent size {previous} -> {size}")
+
+    def reapply(self) -> None:
+        """Carry the current size over to a new engine (after a reconnect)."""
+        self.apply(self._target or self.minimum)
+
+    def start(self) -> None:
+        if self._started:
+            return
+        self._started = True
+
+        def run():
+            next_adapt = time.monotonic() + self.window
+            while True:
+                time.sleep(SAMPLE_SECS)
+                try:
+                    engine = self.get_engine()
+                    if engine is None:
+                        continue
+                    with self._lock:
+                        self._peak = max(self._peak, engine.pool.checkedout())
+                    if time.monotonic() >= next_adapt:
+                        next_adapt = time.monotonic() + self.window
+                        with self._lock:
+                            peak, self._peak = self._peak, 0
+                        self.apply(math.ceil(peak * HEADROOM))
+                except Exception as e:
+                    logger.error(f"Adaptive pool sizer error: {e}")
+
+        threading.Thread(target=run, daemon=True, name="ors-pool-sizer").start()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"min": self.minimum, "max": self.maximum, "window_secs": self.window,
+                    "target": self._target, "window_peak": self._peak, "resizes": list(self._resizes)}
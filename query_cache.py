@@ -0,0 +1,166 @@
+"""
+Client-side SELECT cache shared by the DB managers' ``execute_cached_query``.
+
+Entries are keyed by SQL and params, live for a per-entry TTL
+(``ORS_QUERY_CACHE_TTL`` by default) and are evicted least-recently-used
+beyond ``ORS_QUERY_CACHE_ENTRIES``.  Each entry remembers the tables its
+SELECT reads, so:
+
+  * a write made through a DB manager in this process drops the entries
+    that read the written table (``invalidate``)
+  * in API mode, writes by other clients arrive through the invalidation
+    stream (see cache_invalidation.py) and do the same
+
+Hits return copies of the cached rows, so callers may modify what they get.
+
+    >>> cache = QueryCache(max_entries=2, default_ttl=60)
+    >>> cache.put("SELECT * FROM branches WHERE id = %s", [1], [{"id": 1}])
+    >>> cache.get("SELECT * FROM branches WHERE id = %s", (1,))
+    (True, [{'id': 1}])
+    >>> cache.invalidate(["BRANCHES"])
+    1
+    >>> cache.get("SELECT * FROM branches WHERE id = %s", (1,))
+    (False, None)
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+from sql_classifier import classify
+
+DEFAULT_TTL = float(os.environ.get("ORS_QUERY_CACHE_TTL", "60"))
+MAX_ENTRIES = int(os.environ.get("ORS_QUERY_CACHE_ENTRIES", "512"))
+
+logger = logging.getLogger(__name__)
+
+_Key = Tuple[str, Any]
+
+
+def _freeze(value) -> Any:
+    """Hashable form of a params value (lists become tuples)."""
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+
+def _table_name(name: str) -> str:
+    return name.lower().rsplit(".", 1)[-1].strip("`")
+
+
+def _copy(rows):
+    if isinstance(rows, list):
+        return [dict(r) if isinstance(r, dict) else r for r in rows]
+    return rows
+
+
+class QueryCache:
+    """Thread-safe TTL + LRU cache of SELECT results with table invalidation."""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, default_ttl: float = DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[_Key, Tuple[float, Any, Tuple[str, ...]]]" = OrderedDict()
+        self._by_table: Dict[str, Set[_Key]] = {}
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0, "invalidated": 0}
+
+    def _drop(self, key: _Key) -> None:
+        """Caller holds self._lock."""
+        _, _, tables = self._entries.pop(key)
+        for table in tables:
+            keys = self._by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[table]
+
+    def get(self, sql: str, params=None) -> Tuple[bool, Any]:
+        """``(True, rows)`` on a fresh hit, else ``(False, None)``."""
+        key = (sql, _freeze(params))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return False, None
+            if entry[0] <= time.monotonic():
+                self._drop(key)
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            rows = entry[1]
+        return True, _copy(rows)
+
+    def put(self, sql: str, params, rows, ttl: Optional[float] = None) -> None:
+        ttl = self.default_ttl if ttl is None else ttl
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        key = (sql, _freeze(params))
+        tables = tuple({_table_name(t) for t in classify(sql).tables})
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + ttl, _copy(rows), tables)
+            for table in tables:
+                self._by_table.setdefault(table, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self._stats["evicted"] += 1
+
+    def invalidate(self, tables: Iterable[str]) -> int:
+        """Drop every entry that reads one of ``tables``; returns how many."""
+        removed = 0
+        with self._lock:
+            for table in {_table_name(t) for t in tables}:
+                for key in list(self._by_table.get(table, ())):
+                    self._drop(key)
+                    removed += 1
+            self._stats["invalidated"] += removed
+        return removed
+
+    def invalidate_for(self, sql: str) -> None:
+        """Invalidate after a successful write statement."""
+        info = classify(sql)
+        if info.is_select:
+            return
+        if info.target:
+            self.invalidate([info.target])
+        else:
+            self.clear()   # statement we can't attribute to a table
+
+    def clear(self) -> None:
+        with self._lock:
+            self._stats["invalidated"] += len(self._entries)
+            self._entries.clear()
+            self._by_table.clear()
+
+    def on_invalidation_event(self, event: dict) -> None:
+        """Callback for cache_invalidation.register_invalidation."""
+        if event.get("ns") == "table" and event.get("tables"):
+            self.invalidate(event["tables"])
+        else:
+            self.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return dict(self._stats, entries=len(self._entries), max_entries=self.max_entries,
+                        default_ttl=self.default_ttl,
+                        hit_ratio=round(self._stats["hits"] / lookups, 3) if lookups else None)
+
+
+# Global instance
+query_cache = QueryCache()
+
+try:
+    from cache_invalidation import register_invalidation
+    register_invalidation(query_cache.on_invalidation_event)
+except ImportError:
+    pass
@@ -0,0 +1,421 @@
+"""
+query_plan_audit.py — EXPLAIN the statements the app issues and flag poor plans.
+
+Usage:
+    ORS_CAPTURE_STATEMENTS=statements.jsonl python main.py     # or the API server / load_test.py
+    python query_plan_audit.py statements.jsonl
+    python query_plan_audit.py statements.jsonl --analyze --ddl suggested_indexes.sql
+    python query_plan_audit.py --sql "SELECT ... FROM daily_reports d JOIN branches b ON ..."
+    python query_plan_audit.py statements.jsonl --json > plan_audit.json
+
+Statements come from a capture file (see statement_capture.py) and/or
+``--sql``.  Each SELECT, UPDATE, DELETE and INSERT ... SELECT is run through
+``EXPLAIN FORMAT=JSON`` with the params it was captured with, against the
+database in config.py unless --host/--database etc. say otherwise.  Point
+it at a local copy: EXPLAIN does not execute the statement, but
+``--analyze`` (EXPLAIN ANALYZE, MySQL 8.0.18+) runs each SELECT for real to
+report its actual time and rows.
+
+Findings per statement:
+  * full_scan      — a table read with access type ALL (or a full index
+                     scan) over at least --min-rows estimated rows
+  * index_ignored  — the table has candidate indexes but the plan used none
+  * collation_cast — a column is wrapped in CONVERT/COLLATE inside a
+                     condition, which keeps MySQL from using its index (the
+                     ``COLLATE utf8mb4_general_ci`` joins to ``branches``)
+  * filesort / temporary — ORDER BY, GROUP BY or DISTINCT needing a sort
+                     pass or an internal temporary table
+
+The report ends with suggested DDL — an index on the columns a scanned
+table is filtered or joined on, or a table collation change where a cast
+hides an index that already exists — and the indexes of the audited tables
+that no audited plan used (plus ``sys.schema_unused_indexes`` when
+performance_schema is enabled).  Unused-index results are only as complete
+as the capture: run the app through the screens that matter first.
+"""
+
+import argparse
+import json
+import re
+import sys
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from sql_classifier import classify
+from cache_policy import fingerprint
+import statement_capture
+
+_AUDITED_STATEMENTS = ("SELECT", "UPDATE", "DELETE", "INSERT", "REPLACE")
+_SYSTEM_SCHEMA_RE = re.compile(r"\b(?:information_schema|performance_schema|mysql|sys)\s*\.", re.I)
+_MAX_INDEX_COLUMNS = 3
+
+# FROM / JOIN table references with their alias ("FROM daily_reports d", "JOIN `ors`.`branches` AS b")
+_TABLE_REF_RE = re.compile(
+    r"\b(?:FROM|JOIN|UPDATE|INTO)\s+`?(\w+)`?(?:\.`?(\w+)`?)?(?:\s+(?:AS\s+)?`?(\w+)`?)?", re.I)
+_NOT_ALIASES = frozenset((
+    "WHERE", "JOIN", "INNER", "LEFT", "RIGHT", "OUTER", "CROSS", "NATURAL", "STRAIGHT_JOIN",
+    "ON", "USING", "GROUP", "ORDER", "HAVING", "LIMIT", "UNION", "FOR", "LOCK", "WINDOW",
+    "SET", "VALUES", "VALUE", "SELECT", "PARTITION", "FORCE", "IGNORE", "USE", "WITH",
+))
+_ACTUAL_RE = re.compile(r"actual time=([\d.]+)\.\.([\d.]+) rows=([\d.]+) loops=(\d+)")
+
+
+class Finding(NamedTuple):
+    kind: str      # full_scan, index_ignored, collation_cast, filesort, temporary
+    table: str     # "alias (table)" or "" for statement-level findings
+    detail: str
+
+
+# ── Plan parsing ──────────────────────────────────────────────────────────────
+
+def table_aliases(sql: str) -> Dict[str, str]:
+    """alias -> table for the FROM / JOIN references in ``sql`` (tables map to themselves).
+
+    >>> sorted(table_aliases("SELECT * FROM daily_reports d JOIN `ors`.`branches` AS b ON b.name = d.branch "
+    ...                      "LEFT JOIN corporations WHERE d.date = %s").items())
+    [('b', 'branches'), ('branches', 'branches'), ('corporations', 'corporations'), ('d', 'daily_reports'), ('daily_reports', 'daily_reports')]
+    """
+    aliases = {}
+    for m in _TABLE_REF_RE.finditer(sql):
+        table = (m.group(2) or m.group(1)).lower()
+        aliases[table] = table
+        alias = m.group(3)
+        if alias and alias.upper() not in _NOT_ALIASES:
+            aliases[alias.lower()] = table
+    return aliases
+
+
+def plan_tables(plan) -> Tuple[List[dict], Set[str]]:
+    """Every table access in an EXPLAIN FORMAT=JSON plan, and the statement-level flags."""
+    tables: List[dict] = []
+    flags: Set[str] = set()
+
+    def walk(node):
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if key == "table" and isinstance(value, dict) and "table_name" in value:
+                    tables.append(value)
+                elif key == "using_filesort" and value is True:
+                    flags.add("filesort")
+                elif key == "using_temporary_table" and value is True:
+                    flags.add("temporary")
+                walk(value)
+        elif isinstance(node, list):
+            for value in node:
+                walk(value)
+
+    walk(plan)
+    return tables, flags
+
+
+def condition_columns(condition: str, alias: str) -> Tuple[List[str], List[str], Dict[str, str]]:
+    """Columns of ``alias`` in an attached condition: (equality, other, casts).
+
+    ``casts`` maps a column wrapped in CONVERT(... USING cs) / COLLATE to the
+    charset or collation it was cast to.
+
+    >>> cond = ("((`ors`.`d`.`date` between '2025-01-01' and '2025-01-31') and "
+    ...         "((convert(`ors`.`d`.`branch` using utf8mb4) collate utf8mb4_general_ci) = "
+    ...         "(`ors`.`b`.`name` collate utf8mb4_general_ci)))")
+    >>> condition_columns(cond, "d")
+    (['branch'], ['date'], {'branch': 'utf8mb4_general_ci'})
+    >>> condition_columns(cond, "b")
+    (['name'], [], {'name': 'utf8mb4_general_ci'})
+    """
+    eq: List[str] = []
+    other: List[str] = []
+    casts: Dict[str, str] = {}
+    for m in re.finditer(rf"(?:`[^`]+`\.)?`{re.escape(alias)}`\.`([^`]+)`", condition):
+        column = m.group(1)
+        window = condition[m.end():m.end() + 120]
+        wrapper = re.match(r"\s+(?:using\s+(\w+)\)?)?\s*(?:collate\s+(\w+))?", window)
+        if wrapper and (wrapper.group(1) or wrapper.group(2)):
+            casts[column] = wrapper.group(2) or wrapper.group(1)
+        after = re.sub(r"\s+(?:using|collate)\s+\w+|\)", "", window).lstrip()
+        before = re.sub(r"(?:\s|\(|convert|cast)*$", "", condition[:m.start()])
+        is_eq = after.startswith("=") or (before.endswith("=") and not before.endswith(("<=", ">=", "!=")))
+        if column not in eq and column not in other:
+            (eq if is_eq else other).append(column)
+        elif is_eq and column in other:
+            other.remove(column)
+            eq.append(column)
+    return eq, other, casts
+
+
+def _actual(analyze_text: str) -> Optional[dict]:
+    """Total time and rows from the top line of EXPLAIN ANALYZE output."""
+    m = _ACTUAL_RE.search(analyze_text or "")
+    if not m:
+        return None
+    return {"ms": round(float(m.group(2)), 2), "rows": int(float(m.group(3))),
+            "table_scans": analyze_text.count("Table scan on ")}
+
+
+# ── Auditor ───────────────────────────────────────────────────────────────────
+
+class PlanAuditor:
+    """Runs EXPLAIN for statements and collects findings and suggestions."""
+
+    def __init__(self, conn, min_rows: int = 1000, analyze: bool = False):
+        self.conn = conn
+        self.min_rows = min_rows
+        self.analyze = analyze
+        self._columns: Dict[str, Dict[str, dict]] = {}           # table -> column -> metadata
+        self._indexes: Dict[str, Dict[str, List[str]]] = {}      # table -> index -> columns
+        self._unique: Set[Tuple[str, str]] = set()
+        self.used_indexes: Set[Tuple[str, str]] = set()
+        self.suggestions: Dict[str, str] = {}                    # DDL -> reason
+        self.results: List[dict] = []
+
+    def _query(self, sql: str, params=None) -> List[tuple]:
+        with self.conn.cursor() as cursor:
+            cursor.execute(sql, params)
+            return list(cursor.fetchall())
+
+    def _bind(self, sql: str, params) -> str:
+        """Inline params the way DatabaseManagerPooled binds them (positional %s)."""
+        for value in params or ():
+            sql = sql.replace("%s", self.conn.escape(value), 1)
+        return sql
+
+    def load_schema(self, tables: Set[str]) -> None:
+        """Column collations and index definitions for ``tables`` (one query each)."""
+        tables = sorted(t for t in tables if t not in self._indexes)
+        if not tables:
+            return
+        marks = ", ".join(["%s"] * len(tables))
+        for table, column, column_type, collation in self._query(
+                "SELECT TABLE_NAME, COLUMN_NAME, COLUMN_TYPE, COLLATION_NAME FROM INFORMATION_SCHEMA.COLUMNS "
+                f"WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ({marks})", tables):
+            self._columns.setdefault(table.lower(), {})[column.lower()] = {"type": column_type, "collation": collation}
+        for table, index, column, non_unique in self._query(
+                "SELECT TABLE_NAME, INDEX_NAME, COLUMN_NAME, NON_UNIQUE FROM INFORMATION_SCHEMA.STATISTICS "
+                f"WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ({marks}) "
+                "ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX", tables):
+            self._indexes.setdefault(table.lower(), {}).setdefault(index, []).append((column or "").lower())
+            if not non_unique:
+                self._unique.add((table.lower(), index))
+        for table in tables:
+            self._indexes.setdefault(table, {})
+
+    def audit(self, sql: str, params=None, source: str = "") -> Optional[dict]:
+        info = classify(sql)
+        if info.statement not in _AUDITED_STATEMENTS:
+            return None    # SET, SHOW, DDL ...
+        if not info.tables and info.statement in ("SELECT", "INSERT", "REPLACE"):
+            return None    # INSERT ... VALUES, SELECT without a table
+        aliases = table_aliases(sql)
+        if not aliases or _SYSTEM_SCHEMA_RE.search(sql):
+            return None
+        self.load_schema(set(aliases.values()))
+        bound = self._bind(sql, params)
+        result = {"fp": fingerprint(sql), "sql": sql, "params": params, "source": source,
+                  "findings": [], "est_rows": 0, "actual": None, "error": None}
+        try:
+            plan = json.loads(self._query("EXPLAIN FORMAT=JSON " + bound)[0][0])
+        except Exception as e:
+            result["error"] = str(e)
+            self.results.append(result)
+            return result
+
+        tables, flags = plan_tables(plan)
+        for entry in tables:
+            self._check_table(entry, aliases, result)
+        if "filesort" in flags:
+            result["findings"].append(Finding("filesort", "", "ORDER BY / GROUP BY sorts rows in a filesort pass"))
+        if "temporary" in flags:
+            result["findings"].append(Finding("temporary", "", "GROUP BY / DISTINCT / UNION uses an internal temporary table"))
+
+        if self.analyze and info.is_select:
+            try:
+                result["actual"] = _actual(self._query("EXPLAIN ANALYZE " + bound)[0][0])
+            except Exception as e:
+                result["error"] = f"EXPLAIN ANALYZE: {e}"
+        self.results.append(result)
+        return result
+
+    def _check_table(self, entry: dict, aliases: Dict[str, str], result: dict) -> None:
+        alias = entry["table_name"]
+        table = aliases.get(alias.lower())
+        label = f"{alias} ({table})" if table and table != alias.lower() else alias
+        access = entry.get("access_type")
+        rows = int(entry.get("rows_examined_per_scan") or 0)
+        possible = entry.get("possible_keys") or []
+        key = entry.get("key")
+        result["est_rows"] += rows
+        if table and key:
+            for name in re.findall(r"\w+", key):
+                if name in self._indexes.get(table, {}):
+                    self.used_indexes.add((table, name))
+
+        eq, other, casts = condition_columns(entry.get("attached_condition", ""), alias)
+        for column, target in casts.items():
+            meta = self._columns.get(table or "", {}).get(column.lower(), {})
+            have = meta.get("collation")
+            detail = f"{alias}.{column} cast to {target}"
+            if have:
+                detail += f" (column is {have})"
+            result["findings"].append(Finding("collation_cast", label, detail))
+            if table and have and have != target and "_" in target:   # cast to a collation, not just a charset
+                charset = target.split("_")[0]
+                self.suggestions.setdefault(
+                    f"ALTER TABLE `{table}` CONVERT TO CHARACTER SET {charset} COLLATE {target};",
+                    f"{alias}.{column} is cast from {have} to {target} in {result['fp']}; "
+                    "matching collations let the join use the index and the COLLATE clause can go")
+
+        scanned = access in ("ALL", "index") and rows >= self.min_rows
+        ignored = bool(possible) and not key and rows >= self.min_rows
+        if scanned:
+            result["findings"].append(Finding(
+                "full_scan", label, f"access {access} over ~{rows} rows"
+                + (f"; possible keys: {', '.join(possible)}" if possible else "")))
+        elif ignored:
+            result["findings"].append(Finding(
+                "index_ignored", label, f"~{rows} rows; possible keys {', '.join(possible)} unused"))
+        if (scanned or ignored) and table and table in self._indexes:
+            self._suggest_index(table, eq, other, casts, result["fp"])
+
+    def _suggest_index(self, table: str, eq: List[str], other: List[str], casts: Dict[str, str], fp: str) -> None:
+        known = self._columns.get(table, {})
+        columns = [c for c in eq if c.lower() in known] + [c for c in other if c.lower() in known][:1]
+        columns = columns[:_MAX_INDEX_COLUMNS]
+        if not columns:
+            return
+        lead = columns[0].lower()
+        for name, index_columns in self._indexes[table].items():
+            if index_columns and index_columns[0] == lead:
+                return   # an index already leads with it; a cast or a type mismatch is keeping it out
+        name = f"idx_{table}_{'_'.join(columns)}"[:64]
+        self.suggestions.setdefault(
+            f"ALTER TABLE `{table}` ADD INDEX `{name}` ({', '.join(f'`{c}`' for c in columns)});",
+            f"{table} is scanned in {fp}, filtered/joined on {', '.join(columns)}")
+
+    def unused_indexes(self) -> Dict[str, List[str]]:
+        """Non-unique indexes of the audited tables that no audited plan used."""
+        unused: Dict[str, List[str]] = {}
+        for table, indexes in sorted(self._indexes.items()):
+            for name in sorted(indexes):
+                if name != "PRIMARY" and (table, name) not in self._unique and (table, name) not in self.used_indexes:
+                    unused.setdefault(table, []).append(name)
+        return unused
+
+    def server_unused_indexes(self) -> Optional[Dict[str, List[str]]]:
+        """``sys.schema_unused_indexes`` for this schema, or None where sys / performance_schema is off."""
+        try:
+            rows = self._query("SELECT object_name, index_name FROM sys.schema_unused_indexes "
+                               "WHERE object_schema = DATABASE() ORDER BY object_name, index_name")
+        except Exception:
+            return None
+        unused: Dict[str, List[str]] = {}
+        for table, index in rows:
+            unused.setdefault(table, []).append(index)
+        return unused
+
+
+# ── Report ────────────────────────────────────────────────────────────────────
+
+def _sort_key(result: dict):
+    return (-len(result["findings"]), -(result["actual"] or {}).get("ms", 0), -result["est_rows"])
+
+
+def print_report(auditor: PlanAuditor, out=sys.stdout) -> None:
+    results = sorted(auditor.results, key=_sort_key)
+    flagged = [r for r in results if r["findings"] or r["error"]]
+    print(f"{len(results)} statement(s) explained, {len(flagged)} flagged", file=out)
+    for r in flagged:
+        timing = f"   {r['actual']['ms']} ms, {r['actual']['rows']} rows" if r["actual"] else ""
+        print(f"\n== {r['fp']}   est. {r['est_rows']} rows examined{timing}   [{r['source']}]", file=out)
+        print("   " + " ".join(r["sql"].split())[:200], file=out)
+        if r["error"]:
+            print(f"   error           {r['error']}", file=out)
+        for f in r["findings"]:
+            print(f"   {f.kind:<15} {(f.table + ': ') if f.table else ''}{f.detail}", file=out)
+
+    print("\n-- Suggested DDL " + "-" * 60, file=out)
+    if not auditor.suggestions:
+        print("(none)", file=out)
+    for ddl, reason in auditor.suggestions.items():
+        print(f"-- {reason}\n{ddl}", file=out)
+
+    print("\n-- Indexes no audited plan used " + "-" * 45, file=out)
+    unused = auditor.unused_indexes()
+    for table, names in unused.items():
+        print(f"{table}: {', '.join(names)}", file=out)
+    if not unused:
+        print("(none)", file=out)
+    server = auditor.server_unused_indexes()
+    if server:
+        print("\n-- sys.schema_unused_indexes (unused since server start) " + "-" * 20, file=out)
+        for table, names in server.items():
+            print(f"{table}: {', '.join(names)}", file=out)
+
+
+def write_ddl(auditor: PlanAuditor, path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("-- Suggested by query_plan_audit.py; review before running.\n\n")
+        for ddl, reason in auditor.suggestions.items():
+            f.write(f"-- {reason}\n{ddl}\n\n")
+
+
+def _connect(args):
+    import pymysql
+    from config import DB_CONFIG
+
+    return pymysql.connect(
+        host=args.host or DB_CONFIG["host"],
+        port=args.port or int(DB_CONFIG.get("port", 3306)),
+        user=args.user or DB_CONFIG["user"],
+        password=DB_CONFIG["password"] if args.password is None else args.password,
+        database=args.database or DB_CONFIG["database"],
+    )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="EXPLAIN captured ORS statements and flag poor plans")
+    parser.add_argument("capture", nargs="*", help="statement capture file(s) (ORS_CAPTURE_STATEMENTS)")
+    parser.add_argument("--sql", action="append", default=[], help="a statement to audit (repeatable)")
+    parser.add_argument("--analyze", action="store_true", help="also run EXPLAIN ANALYZE (executes SELECTs)")
+    parser.add_argument("--min-rows", type=int, default=1000, help="ignore scans estimated below this many rows")
+    parser.add_argument("--ddl", help="write the suggested DDL to this .sql file")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON instead of a report")
+    parser.add_argument("--host")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--user")
+    parser.add_argument("--password")
+    parser.add_argument("--database")
+    args = parser.parse_args(argv)
+
+    statements = [(entry["sql"], entry.get("params"), path)
+                  for path in args.capture for entry in statement_capture.load(path)]
+    statements += [(sql, None, "--sql") for sql in args.sql]
+    if not statements:
+        parser.error("no statements: pass a capture file or --sql")
+
+    conn = _connect(args)
+    try:
+        auditor = PlanAuditor(conn, min_rows=args.min_rows, analyze=args.analyze)
+        seen = set()
+        for sql, params, source in statements:
+            key = (fingerprint(sql), json.dumps(params, default=str))
+            if key not in seen:
+                seen.add(key)
+                auditor.audit(sql, params, source)
+        if args.json:
+            json.dump({
+                "statements": [dict(r, findings=[f._asdict() for f in r["findings"]])
+                               for r in sorted(auditor.results, key=_sort_key)],
+                "suggested_ddl": [{"ddl": ddl, "reason": reason} for ddl, reason in auditor.suggestions.items()],
+                "unused_indexes": auditor.unused_indexes(),
+                "server_unused_indexes": auditor.server_unused_indexes(),
+            }, sys.stdout, indent=2, default=str)
+            print()
+        else:
+            print_report(auditor)
+        if args.ddl:
+            write_ddl(auditor, args.ddl)
+    finally:
+        conn.close()
+    return 1 if any(r["findings"] for r in auditor.results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
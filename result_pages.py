@@ -0,0 +1,252 @@
+"""
+Result size caps and continuation tokens for SELECTs run by the API server.
+
+A SELECT is read from a server-side cursor until it passes
+``ORS_MAX_ROWS`` rows or roughly ``ORS_MAX_RESULT_BYTES`` of JSON.  When
+there is more, the response carries a ``next_token``; sending the same SQL
+and params back with ``page_token`` set returns the next page.  The desktop
+DB managers follow tokens themselves, so callers still get the full result.
+
+How the next page is found:
+  * keyset — when the statement is a single-table SELECT ending in
+    ``ORDER BY col [ASC|DESC], ...`` over plain result columns that include
+    a NOT NULL unique key of the table (the primary key, usually), the page
+    query wraps the statement and continues strictly after the last row's
+    key (``WHERE (a, id) > (…)``).  The key is unique, so no two rows tie
+    and MySQL's collation decides the order both times.  MySQL can seek
+    through the index instead of re-reading skipped rows.
+  * offset — anything else re-runs the statement with ``LIMIT offset, …``.
+    Without an ORDER BY the row order between pages is whatever MySQL
+    returns, as with any unordered LIMIT.
+
+Locking reads (FOR UPDATE / FOR SHARE) are not paged.
+
+Tokens are HMAC-signed with the JWT secret and bound to the SQL and params
+they were issued for, and expire after ``ORS_PAGE_TOKEN_TTL`` seconds.
+"""
+
+import base64
+import datetime
+import decimal
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from typing import Any, List, Optional, Sequence, Tuple
+
+from sql_classifier import page_shape
+
+MAX_ROWS       = int(os.environ.get("ORS_MAX_ROWS", "20000"))
+MAX_BYTES      = int(os.environ.get("ORS_MAX_RESULT_BYTES", str(16 * 1024 * 1024)))
+TOKEN_TTL_SECS = int(os.environ.get("ORS_PAGE_TOKEN_TTL", "3600"))
+
+_NO_LIMIT = "18446744073709551615"   # MySQL's documented "all remaining rows"
+_KEYS_TTL = 300                      # seconds a table's unique keys are cached
+_KEY_TYPES = (str, int, decimal.Decimal, datetime.date)   # floats don't round-trip exactly
+
+
+class PageTokenError(ValueError):
+    """The page token is malformed, forged, expired or for another query."""
+
+
+class ResultTooLarge(Exception):
+    """The result passed the caps and this statement can't be paged."""
+
+
+class _SizeEstimator:
+    """JSON size of fetched chunks: every 4th chunk is measured, the rest
+    are extrapolated from the average so far."""
+
+    def __init__(self):
+        self.chunks = 0
+        self.rows = 0
+        self.bytes = 0
+
+    def __call__(self, chunk: List[dict]) -> int:
+        self.chunks += 1
+        if self.chunks % 4 == 1:
+            size = len(json.dumps(chunk, default=str))
+            self.rows += len(chunk)
+            self.bytes += size
+            return size
+        return int(len(chunk) * self.bytes / max(self.rows, 1))
+
+
+def _query_digest(sql: str, params) -> str:
+    return hashlib.sha256(f"{sql}|{params}".encode()).hexdigest()[:16]
+
+
+def _key_value(value) -> Any:
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, (datetime.date, decimal.Decimal)):
+        return str(value)
+    return value
+
+
+def _quote(name: str) -> str:
+    return "`" + name.replace("`", "``") + "`"
+
+
+class ResultPager:
+    """Runs capped SELECTs and issues / follows continuation tokens."""
+
+    def __init__(self, db, secret: str, max_rows: int = MAX_ROWS, max_bytes: int = MAX_BYTES):
+        self.db = db
+        self._secret = secret.encode()
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._stats = {"pages": 0, "truncated": 0, "keyset": 0, "offset": 0, "too_large": 0}
+        self._unique_keys: dict = {}     # table -> (expires at, [frozenset of lower-case columns])
+
+    # ── Tokens ────────────────────────────────────────────────────────────
+
+    def _sign(self, state: dict) -> str:
+        body = base64.urlsafe_b64encode(json.dumps(state, separators=(",", ":")).encode()).decode()
+        mac = hmac.new(self._secret, body.encode(), hashlib.sha256).hexdigest()[:32]
+        return f"{body}.{mac}"
+
+    def _read(self, token: str, sql: str, params) -> dict:
+        body, _, mac = token.partition(".")
+        expected = hmac.new(self._secret, body.encode(), hashlib.sha256).hexdigest()[:32]
+        if not hmac.compare_digest(mac, expected):
+            raise PageTokenError("Invalid page token")
+        try:
+            state = json.loads(base64.urlsafe_b64decode(body.encode()))
+        except ValueError:
+            raise PageTokenError("Invalid page token")
+        if state.get("q") != _query_digest(sql, params):
+            raise PageTokenError("Page token does not match this query")
+        if time.time() - state.get("t", 0) > TOKEN_TTL_SECS:
+            raise PageTokenError("Page token expired; run the query again")
+        return state
+
+    # ── Page queries ──────────────────────────────────────────────────────
+
+    @staticmethod
+    def _page_query(sql: str, params, state: dict) -> Tuple[str, Optional[tuple]]:
+        """The statement that returns the page after ``state``."""
+        params = tuple(params or ())
+        if state["m"] == "keyset":
+            order = page_shape(sql).order_by
+            clauses, values = [], []
+            for i, (col, desc) in enumerate(order.columns):
+                terms = [f"{_quote(c)} = %s" for c, _ in order.columns[:i]]
+                # NULLs sort first in MySQL: they're behind an ascending key
+                # but still ahead of a descending one
+                after = f"({_quote(col)} < %s OR {_quote(col)} IS NULL)" if desc else f"{_quote(col)} > %s"
+                clauses.append("(" + " AND ".join(terms + [after]) + ")")
+                values.extend(state["k"][:i + 1])
+            order_sql = ", ".join(f"{_quote(c)} {'DESC' if d else 'ASC'}" for c, d in order.columns)
+            query = (f"SELECT * FROM (\n{order.base}\n) AS _ors_page "
+                     f"WHERE {' OR '.join(clauses)} ORDER BY {order_sql}")
+            return query, params + tuple(values)
+
+        base = sql.rstrip().rstrip(";")
+        if state["w"]:
+            base = f"SELECT * FROM (\n{base}\n) AS _ors_page"
+        return f"{base}\nLIMIT {int(state['o'])}, {_NO_LIMIT}", params or None
+
+    def _table_unique_keys(self, table: str) -> List[frozenset]:
+        """Column sets of the NOT NULL unique indexes of ``table`` (cached)."""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._unique_keys.get(table)
+        if cached and cached[0] > now:
+            return cached[1]
+        schema, _, name = table.rpartition(".")
+        keys: dict = {}
+        try:
+            rows = self.db.execute_query(
+                "SELECT INDEX_NAME, COLUMN_NAME, NULLABLE FROM INFORMATION_SCHEMA.STATISTICS "
+                "WHERE TABLE_SCHEMA = COALESCE(%s, DATABASE()) AND TABLE_NAME = %s AND NON_UNIQUE = 0",
+                (schema or None, name),
+            ) or []
+        except Exception:
+            rows = []
+        for row in rows:
+            cols = keys.setdefault(row["INDEX_NAME"], set())
+            # A unique index over a nullable column allows repeated NULLs
+            cols.add(None if row["NULLABLE"] else (row["COLUMN_NAME"] or "").lower())
+        unique = [frozenset(cols) for cols in keys.values() if None not in cols]
+        with self._lock:
+            self._unique_keys[table] = (now + _KEYS_TTL, unique)
+        return unique
+
+    def forget_unique_keys(self) -> None:
+        """Drop cached unique keys (after a schema change)."""
+        with self._lock:
+            self._unique_keys.clear()
+
+    def _keyset_safe(self, shape) -> bool:
+        """Whether the ORDER BY columns include a unique key of the only table read."""
+        if not shape.table:
+            return False
+        ordered = {c.lower() for c, _ in shape.order_by.columns}
+        return any(key <= ordered for key in self._table_unique_keys(shape.table))
+
+    def _next_state(self, sql: str, params, rows: List[dict], columns: Sequence[str],
+                    state: Optional[dict]) -> dict:
+        """Continuation state after ``rows``, or ResultTooLarge if there is none."""
+        shape = page_shape(sql)
+        if shape.locking:
+            raise ResultTooLarge(
+                f"Result exceeds {self.max_rows} rows / {self.max_bytes // (1024 * 1024)} MB and "
+                f"a locking read (FOR UPDATE / FOR SHARE) cannot be paged; narrow the query"
+            )
+        delivered = (state["o"] if state else 0) + len(rows)
+        unique_columns = len(set(columns)) == len(columns)   # a derived table needs unique names
+        nxt = {"q": _query_digest(sql, params), "t": int(time.time()), "o": delivered}
+
+        order = shape.order_by
+        if order and unique_columns and all(c in columns for c, _ in order.columns) and self._keyset_safe(shape):
+            key = [rows[-1][c] for c, _ in order.columns]
+            if all(v is not None and isinstance(v, _KEY_TYPES) for v in key):
+                return dict(nxt, m="keyset", k=[_key_value(v) for v in key])
+
+        if not shape.has_limit:
+            return dict(nxt, m="offset", w=False)
+        if unique_columns:
+            return dict(nxt, m="offset", w=True)
+        raise ResultTooLarge(
+            f"Result exceeds {self.max_rows} rows / {self.max_bytes // (1024 * 1024)} MB and "
+            f"cannot be paged (duplicate column names with LIMIT); narrow the query"
+        )
+
+    # ── Public ────────────────────────────────────────────────────────────
+
+    def fetch(self, sql: str, params=None, page_token: Optional[str] = None,
+              max_rows: Optional[int] = None) -> Tuple[List[dict], Optional[str]]:
+        """Return ``(rows, next_token)`` for one page of a SELECT.
+
+        Raises PageTokenError, ResultTooLarge or the database error.
+        """
+        state = self._read(page_token, sql, params) if page_token else None
+        query, query_params = (sql, params) if state is None else self._page_query(sql, params, state)
+        cap = min(max_rows, self.max_rows) if max_rows else self.max_rows
+        rows, columns, truncated = self.db.fetch_capped(
+            query, query_params, max_rows=cap, max_bytes=self.max_bytes, size_of=_SizeEstimator()
+        )
+
+        token = None
+        try:
+            if truncated:
+                nxt = self._next_state(sql, params, rows, columns, state)
+                token = self._sign(nxt)
+        except ResultTooLarge:
+            with self._lock:
+                self._stats["too_large"] += 1
+            raise
+        with self._lock:
+            self._stats["pages"] += 1
+            if truncated:
+                self._stats["truncated"] += 1
+                self._stats[nxt["m"]] += 1
+        return rows, token
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, max_rows=self.max_rows, max_bytes=self.max_bytes)
@@ -0,0 +1,85 @@
+"""
+Result shapes for the DB managers' ``row_format`` option.
+
+``execute_query(sql, params, row_format=...)`` returns SELECT rows as:
+
+  * ``"dict"``     — a list of dicts (the default; what every caller expects)
+  * ``"tuple"``    — a ``TupleRows``: plain tuples plus one shared column index
+  * ``"row"``      — named rows (SQLAlchemy ``Row`` in direct mode, namedtuples
+                     in API mode): ``row[0]``, ``row.branch`` and ``row._fields``
+  * ``"columnar"`` — a dict of column name -> list of values
+
+A dict per row repeats every key and carries a hash table, which for wide
+tables such as ``daily_reports_brand_a`` costs far more than the values
+themselves; the other shapes share the column names across rows.
+
+    >>> rows = from_dicts([{"id": 1, "branch": "A"}, {"id": 2, "branch": "B"}], "tuple")
+    >>> rows
+    [(1, 'A'), (2, 'B')]
+    >>> rows.columns, rows.index["branch"], rows.column("branch")
+    (('id', 'branch'), 1, ['A', 'B'])
+    >>> from_dicts([{"id": 1, "branch": "A"}, {"id": 2, "branch": "B"}], "columnar")
+    {'id': [1, 2], 'branch': ['A', 'B']}
+    >>> from_dicts([{"id": 1, "branch": "A"}], "row")[0].branch
+    'A'
+"""
+
+import collections
+from typing import Any, Dict, List, Sequence
+
+ROW_FORMATS = ("dict", "tuple", "row", "columnar")
+
+
+class TupleRows(list):
+    """Rows as tuples; ``columns`` and ``index`` (name -> position) are shared."""
+
+    __slots__ = ("columns", "index")
+
+    def __init__(self, columns: Sequence[str], rows=()):
+        super().__init__(rows)
+        self.columns = tuple(columns)
+        self.index = {name: i for i, name in enumerate(self.columns)}
+
+    def column(self, name: str) -> List[Any]:
+        i = self.index[name]
+        return [row[i] for row in self]
+
+
+def check_format(row_format: str) -> None:
+    if row_format not in ROW_FORMATS:
+        raise ValueError(f"row_format must be one of {', '.join(ROW_FORMATS)}, not {row_format!r}")
+
+
+def _columnar(columns: Sequence[str], rows) -> Dict[str, List[Any]]:
+    values = list(zip(*rows)) if rows else [()] * len(columns)
+    return {name: list(col) for name, col in zip(columns, values)}
+
+
+def from_result(result, row_format: str = "dict"):
+    """Shape a SQLAlchemy result (direct mode)."""
+    if row_format == "dict":
+        return [dict(row._mapping) for row in result]
+    if row_format == "row":
+        return list(result)
+    columns = list(result.keys())
+    rows = [tuple(row) for row in result]
+    if row_format == "tuple":
+        return TupleRows(columns, rows)
+    return _columnar(columns, rows)
+
+
+def from_dicts(rows: List[dict], row_format: str = "dict"):
+    """Shape rows decoded from the API server's JSON (API mode).
+
+    Column names come from the first row, so an empty result has none.
+    """
+    if row_format == "dict" or not isinstance(rows, list):
+        return rows
+    columns = list(rows[0]) if rows else []
+    if row_format == "row":
+        row_type = collections.namedtuple("Row", columns, rename=True)
+        return [row_type._make(r.values()) for r in rows]
+    values = [tuple(r.values()) for r in rows]
+    if row_format == "tuple":
+        return TupleRows(columns, values)
+    return _columnar(columns, values)
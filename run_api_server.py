@@ -1,15 +1,141 @@
 """
 REST API Server Entry Point
-Run this to start the API server
+Run this to start the API server with one worker process per CPU core.
+
+    python run_api_server.py                # ORS_WORKERS or CPU count workers
+    python run_api_server.py --workers 4
+
+Gunicorn (Linux/macOS, when installed) supervises uvicorn workers:
+    kill -HUP <master pid>     graceful reload, workers replaced one by one
+Otherwise uvicorn's own multiprocess supervisor is used, which also restarts
+workers on SIGHUP.
+
+Each worker builds its own DB pool and warms it before accepting traffic
+(see api_server._warm_up); /api/ready reports per-worker readiness.
 """
 
 import sys
 import os
+import argparse
+import logging
 
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from api.app import app
+try:
+    from dotenv import load_dotenv as _load_dotenv
+    _load_dotenv(override=False)
+except ImportError:
+    pass
+
+log = logging.getLogger("run_api_server")
+
+API_HOST = os.environ.get("ORS_API_HOST", "0.0.0.0")
+API_PORT = int(os.environ.get("ORS_API_PORT", 5000))
+
+# Single-process defaults for the DB pool; split across workers so the total
+# number of MySQL connections stays the same regardless of worker count.
+_TOTAL_POOL_SIZE     = 50
+_TOTAL_POOL_OVERFLOW = 150
+
+
+def default_workers() -> int:
+    """ORS_WORKERS, else one worker per CPU core (capped by ORS_MAX_WORKERS)."""
+    env = os.environ.get("ORS_WORKERS")
+    if env:
+        return max(1, int(env))
+    return max(1, min(os.cpu_count() or 1, int(os.environ.get("ORS_MAX_WORKERS", "8"))))
+
+
+def _split_pool(workers: int) -> None:
+    """Give each worker its share of the pool unless sizes are set explicitly."""
+    if workers <= 1:
+        return
+    os.environ.setdefault("ORS_POOL_SIZE",     str(max(5, _TOTAL_POOL_SIZE // workers)))
+    os.environ.setdefault("ORS_POOL_OVERFLOW", str(max(10, _TOTAL_POOL_OVERFLOW // workers)))
+
+
+def _ssl_files():
+    base = os.path.dirname(os.path.abspath(__file__))
+    cert_file = os.path.join(base, "cert.pem")
+    key_file = os.path.join(base, "key.pem")
+    if os.path.exists(cert_file) and os.path.exists(key_file):
+        log.info("Using HTTPS with self-signed certificate")
+        log.info(f"⚠️  Certificate: {cert_file}")
+        return cert_file, key_file
+    log.warning("No SSL certificate found. Using HTTP (not secure)")
+    log.warning("To enable HTTPS, run: openssl req -x509 -newkey rsa:4096 -nodes -out cert.pem -keyout key.pem -days 365")
+    return None, None
+
+
+def _run_gunicorn(workers: int, cert_file, key_file) -> None:
+    """Replace this process with a Gunicorn master running uvicorn workers."""
+    args = [
+        sys.executable, "-m", "gunicorn", "api_server:app",
+        "--worker-class", "uvicorn.workers.UvicornWorker",
+        "--workers", str(workers),
+        "--bind", f"{API_HOST}:{API_PORT}",
+        # Workers connect to MySQL themselves; never preload in the master
+        # or all workers would inherit the same sockets.
+        "--graceful-timeout", os.environ.get("ORS_GRACEFUL_TIMEOUT", "30"),
+        "--timeout", os.environ.get("ORS_WORKER_TIMEOUT", "120"),
+    ]
+    if cert_file:
+        args += ["--certfile", cert_file, "--keyfile", key_file]
+    os.execv(sys.executable, args)
+
+
+def _run_uvicorn(workers: int, cert_file, key_file) -> None:
+    import uvicorn
+    uvicorn.run(
+        "api_server:app",
+        host=API_HOST,
+        port=API_PORT,
+        workers=workers,
+        # Allow enough threads to serve 400+ concurrent sync handlers
+        # without queuing behind the default anyio limit of 40.  Parked
+        # /api/invalidations long-polls count against this too.
+        limit_concurrency=int(os.environ.get("ORS_LIMIT_CONCURRENCY", "500")),
+        timeout_graceful_shutdown=int(os.environ.get("ORS_GRACEFUL_TIMEOUT", "30")),
+        ssl_keyfile=key_file,
+        ssl_certfile=cert_file,
+    )
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Start the ORS API server")
+    parser.add_argument("--workers", type=int, default=default_workers(),
+                        help="worker processes (default: ORS_WORKERS or CPU count)")
+    parser.add_argument("--server", choices=("auto", "gunicorn", "uvicorn"),
+                        default=os.environ.get("ORS_SERVER", "auto"),
+                        help="process supervisor (default: gunicorn when available)")
+    args = parser.parse_args(argv)
+
+    if not logging.getLogger().handlers:
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+
+    _split_pool(args.workers)
+    cert_file, key_file = _ssl_files()
+
+    use_gunicorn = args.server == "gunicorn"
+    if args.server == "auto" and os.name == "posix" and args.workers > 1:
+        try:
+            import gunicorn  # noqa: F401
+            use_gunicorn = True
+        except ImportError:
+            pass
+
+    log.info(
+        f"Starting ORS API Server on {API_HOST}:{API_PORT} with {args.workers} worker(s) "
+        f"via {'gunicorn' if use_gunicorn else 'uvicorn'} "
+        f"(pool {os.environ.get('ORS_POOL_SIZE', _TOTAL_POOL_SIZE)}+"
+        f"{os.environ.get('ORS_POOL_OVERFLOW', _TOTAL_POOL_OVERFLOW)} per worker)"
+    )
+    if use_gunicorn:
+        _run_gunicorn(args.workers, cert_file, key_file)
+    else:
+        _run_uvicorn(args.workers, cert_file, key_file)
+
 
 if __name__ == '__main__':
-    app.run()
+    main()
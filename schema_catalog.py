@@ -0,0 +1,168 @@
+"""
+Process-wide catalog of the database's tables, columns and indexes.
+
+Pages that adapt to the schema (optional columns, dynamic report fields)
+used to query INFORMATION_SCHEMA per table, each with its own cache.  The
+catalog loads every table's columns in one query the first time anything
+asks, and answers from memory after that:
+
+    from schema_catalog import schema_catalog
+
+    cols = schema_catalog.columns("daily_reports_brand_a")      # frozenset of names
+    if not schema_catalog.has_column("users", "os_group", db=self.db):
+        self.db.execute_query("ALTER TABLE users ADD COLUMN os_group VARCHAR(128) DEFAULT NULL")
+        schema_catalog.invalidate()
+
+``db`` is the manager used if a (re)load is needed; it defaults to the
+shared ``api_db_manager.db_manager``.  Table names are matched
+case-insensitively; column and index names are returned as MySQL reports
+them.  An unknown table gives an empty set, which callers treat as "don't
+know" rather than "no columns".
+
+Invalidation:
+  * ``invalidate()`` after this process changes the schema (ALTER / CREATE)
+    bumps ``version``; the next lookup reloads
+  * schema changes made through the API server by other clients arrive on
+    the invalidation stream (cache_invalidation.py, "schema" namespace)
+  * otherwise entries expire after ``ORS_SCHEMA_CATALOG_TTL`` seconds,
+    stretched by ``cache_ttl`` while the stream is live
+
+Index names (``indexes``) come from a second query, made only when asked.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Dict, FrozenSet, Optional
+
+from cache_invalidation import register_invalidation, cache_ttl
+
+CATALOG_TTL = float(os.environ.get("ORS_SCHEMA_CATALOG_TTL", "300"))
+
+logger = logging.getLogger(__name__)
+
+_EMPTY: FrozenSet[str] = frozenset()
+
+
+def _default_db():
+    from api_db_manager import db_manager
+    return db_manager
+
+
+class SchemaCatalog:
+    """Columns (and, on demand, index names) of every table in the current schema."""
+
+    def __init__(self, ttl: float = CATALOG_TTL):
+        self.ttl = ttl
+        self.version = 0
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._columns: Optional[Dict[str, FrozenSet[str]]] = None
+        self._indexes: Optional[Dict[str, FrozenSet[str]]] = None
+        self._loaded_at = 0.0
+        self._loaded_version = -1
+        self._stats = {"loads": 0, "load_failures": 0, "lookups": 0, "invalidations": 0}
+
+    # ── Loading ───────────────────────────────────────────────────────────
+
+    def _fresh(self) -> bool:
+        return (self._columns is not None and self._loaded_version == self.version
+                and time.monotonic() - self._loaded_at < cache_ttl(self.ttl))
+
+    def _group(self, rows) -> Dict[str, FrozenSet[str]]:
+        grouped: Dict[str, set] = {}
+        for row in rows or ():
+            table, name = (row.get("TABLE_NAME"), row.get("NAME")) if isinstance(row, dict) else (row[0], row[1])
+            if table and name:
+                grouped.setdefault(table.lower(), set()).add(name)
+        return {table: frozenset(names) for table, names in grouped.items()}
+
+    def _ensure(self, db) -> None:
+        if self._fresh():
+            return
+        with self._load_lock:
+            if self._fresh():
+                return
+            version = self.version
+            try:
+                rows = (db or _default_db()).execute_query(
+                    "SELECT TABLE_NAME, COLUMN_NAME AS NAME FROM INFORMATION_SCHEMA.COLUMNS "
+                    "WHERE TABLE_SCHEMA = DATABASE()",
+                    row_format="tuple",
+                )
+            except Exception as e:
+                with self._lock:
+                    self._stats["load_failures"] += 1
+                logger.error(f"Schema catalog load failed: {e}")
+                return   # keep serving what we had; retried on the next lookup
+            if not isinstance(rows, list):
+                with self._lock:
+                    self._stats["load_failures"] += 1
+                return
+            columns = self._group(rows)
+            with self._lock:
+                self._columns = columns
+                self._indexes = None
+                self._loaded_at = time.monotonic()
+                self._loaded_version = version
+                self._stats["loads"] += 1
+            logger.debug(f"Schema catalog loaded: {len(columns)} tables, {len(rows)} columns")
+
+    # ── Lookups ───────────────────────────────────────────────────────────
+
+    def columns(self, table: str, db=None) -> FrozenSet[str]:
+        """Column names of ``table``; empty if the table is unknown or the load failed."""
+        self._ensure(db)
+        with self._lock:
+            self._stats["lookups"] += 1
+            return (self._columns or {}).get(table.lower(), _EMPTY)
+
+    def has_column(self, table: str, column: str, db=None) -> bool:
+        return column in self.columns(table, db)
+
+    def has_table(self, table: str, db=None) -> bool:
+        self._ensure(db)
+        with self._lock:
+            return table.lower() in (self._columns or {})
+
+    def indexes(self, table: str, db=None) -> FrozenSet[str]:
+        """Index names of ``table`` (loaded for the whole schema on first use)."""
+        self._ensure(db)
+        if self._indexes is None:
+            try:
+                rows = (db or _default_db()).execute_query(
+                    "SELECT DISTINCT TABLE_NAME, INDEX_NAME AS NAME FROM INFORMATION_SCHEMA.STATISTICS "
+                    "WHERE TABLE_SCHEMA = DATABASE()",
+                    row_format="tuple",
+                )
+            except Exception as e:
+                logger.error(f"Schema catalog index load failed: {e}")
+                return _EMPTY
+            indexes = self._group(rows if isinstance(rows, list) else [])
+            with self._lock:
+                self._indexes = indexes
+        with self._lock:
+            return (self._indexes or {}).get(table.lower(), _EMPTY)
+
+    # ── Invalidation ──────────────────────────────────────────────────────
+
+    def invalidate(self) -> None:
+        """Drop the catalog after a schema change; the next lookup reloads it."""
+        with self._lock:
+            self.version += 1
+            self._indexes = None
+            self._stats["invalidations"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, version=self.version,
+                        tables=len(self._columns) if self._columns is not None else None,
+                        age_secs=round(time.monotonic() - self._loaded_at, 1) if self._columns is not None else None)
+
+
+# Global instance
+schema_catalog = SchemaCatalog()
+
+# Columns only change when the server runs an ALTER/CREATE
+register_invalidation(lambda _event: schema_catalog.invalidate(), namespaces=("schema",))
@@ -0,0 +1,535 @@
+"""
+Single-pass SQL classification for the API server.
+
+``classify(sql)`` tokenizes a statement once — skipping comments and string
+literals — and reports the statement type, the table it writes, the tables
+it reads and whether it contains a blocked DDL/admin statement.  Results are
+memoized in an LRU keyed by a BLAKE2b digest of the SQL, so a repeated
+statement costs one hash and a dict lookup.
+
+    >>> info = classify("select * FROM `branches` b JOIN corporations c ON c.id = b.corp_id")
+    >>> info.statement, info.is_select, info.target, info.tables
+    ('SELECT', True, None, ('branches', 'corporations'))
+
+Comments and literals are not SQL:
+
+    >>> classify("-- DROP TABLE x\\nSELECT 'GRANT ALL' FROM t /* TRUNCATE */").blocked is None
+    True
+    >>> classify("/* hint */ Update daily_reports SET note = 'deleted' WHERE id = 1").operation
+    'UPDATE'
+
+CTEs resolve to the statement that follows them and are not read tables:
+
+    >>> info = classify("WITH recent AS (SELECT id FROM reports WHERE d > ?) "
+    ...                 "SELECT * FROM recent r JOIN branches b ON b.id = r.id")
+    >>> info.statement, info.is_select, info.tables
+    ('SELECT', True, ('reports', 'branches'))
+    >>> info = classify("with x as (select 1) delete from payables where id in (select * from x)")
+    >>> info.statement, info.target, info.tables
+    ('DELETE', 'payables', ())
+
+Write targets and schema statements:
+
+    >>> classify("INSERT IGNORE INTO `ors`.`cash_flow` (a) SELECT a FROM staging").table
+    'ors.cash_flow'
+    >>> classify("alter TABLE daily_reports ADD COLUMN x INT").target
+    'daily_reports'
+    >>> classify("CREATE TABLE IF NOT EXISTS audit (id INT)").target
+    'audit'
+
+Blocked statements are found anywhere outside literals, including MySQL
+executable comments; ``TRUNCATE(x, 2)`` the function is allowed:
+
+    >>> classify("SELECT 1; drop   table users").blocked
+    'DROP TABLE'
+    >>> classify("SELECT 1 /*!50000 GRANT ALL ON *.* TO x */").blocked
+    'GRANT'
+
+``--`` starts a comment only when whitespace (or the end) follows it, as
+in MySQL; ``1 --x`` is an expression, so what follows is still checked:
+
+    >>> classify("SELECT 1 --x; DROP TABLE users").blocked
+    'DROP TABLE'
+    >>> classify("SELECT 1 --\\nFROM t").tables
+    ('t',)
+    >>> classify("SELECT TRUNCATE(amount, 2), EXTRACT(YEAR FROM d) FROM t").blocked is None
+    True
+
+``page_shape(sql)`` reports what result paging can rely on: the trailing
+top-level ORDER BY when it is a plain column list, and whether the
+statement has its own top-level LIMIT:
+
+    >>> shape = page_shape("SELECT d.id, d.report_date FROM daily_reports d "
+    ...                    "WHERE d.branch = %s ORDER BY d.report_date DESC, `id`")
+    >>> shape.order_by.columns, shape.order_by.base[-19:], shape.has_limit
+    ((('report_date', True), ('id', False)), 'WHERE d.branch = %s', False)
+    >>> page_shape("SELECT * FROM t ORDER BY FIELD(x, 'a', 'b')").order_by is None
+    True
+    >>> page_shape("SELECT * FROM t ORDER BY amount - 1").order_by is None
+    True
+    >>> page_shape("SELECT * FROM (SELECT a FROM t ORDER BY a LIMIT 5) s").has_limit
+    False
+
+``table`` is set only for one SELECT over one table, with no join,
+subquery, UNION, GROUP BY or DISTINCT, and no ORDER BY column that is an
+``AS`` alias — the case where a unique key of the table is also unique in
+the result:
+
+    >>> page_shape("SELECT id, amount FROM `ors`.`payables` WHERE d = %s ORDER BY id").table
+    'ors.payables'
+    >>> page_shape("SELECT p.id FROM payables p JOIN branches b ON b.id = p.branch_id ORDER BY id").table is None
+    True
+    >>> page_shape("SELECT branch AS id FROM payables ORDER BY id").table is None
+    True
+    >>> page_shape("SELECT * FROM t WHERE id > 5 FOR UPDATE").locking
+    True
+
+``split_values(sql)`` cuts a single-row INSERT/REPLACE around its VALUES
+row so bulk writes can repeat the row (only when the row holds every
+``%s`` placeholder):
+
+    >>> split_values("INSERT INTO t (a, b) VALUES (%s, NOW()) ON DUPLICATE KEY UPDATE b = VALUES(b)")
+    ValuesSplit(head='INSERT INTO t (a, b) VALUES ', row='(%s, NOW())', tail=' ON DUPLICATE KEY UPDATE b = VALUES(b)')
+    >>> split_values("UPDATE t SET a = %s WHERE id = %s") is None
+    True
+    >>> split_values("INSERT INTO t (a) VALUES (%s) ON DUPLICATE KEY UPDATE a = a + %s") is None
+    True
+"""
+
+import functools
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Tuple
+
+# Statements rejected by the API server (matched as whole-word sequences)
+BLOCKED_STATEMENTS = (
+    "DROP TABLE", "DROP DATABASE", "TRUNCATE",
+    "ALTER TABLE DROP", "ALTER TABLE RENAME",
+    "CREATE USER", "GRANT", "REVOKE", "FLUSH",
+    "DROP USER", "DROP INDEX",
+)
+
+SCHEMA_STATEMENTS = frozenset(("ALTER", "CREATE", "DROP", "RENAME", "TRUNCATE"))
+
+_CACHE_SIZE = int(os.environ.get("ORS_SQL_CLASSIFY_CACHE", "4096"))
+
+
+class SqlInfo(NamedTuple):
+    statement: str               # leading keyword, after any WITH clause
+    target: Optional[str]        # table written by INSERT/UPDATE/DELETE/DDL
+    tables: Tuple[str, ...]      # tables read (FROM / JOIN), CTE names excluded
+    blocked: Optional[str]       # matching BLOCKED_STATEMENTS entry, if any
+
+    @property
+    def is_select(self) -> bool:
+        return self.statement == "SELECT"
+
+    @property
+    def operation(self) -> str:
+        """Audit operation name."""
+        return self.statement or "UNKNOWN"
+
+    @property
+    def table(self) -> str:
+        """The written table, else the first table read, else "unknown"."""
+        if self.target:
+            return self.target
+        return self.tables[0] if self.tables else "unknown"
+
+
+class OrderBy(NamedTuple):
+    base: str                               # the statement without its ORDER BY
+    columns: Tuple[Tuple[str, bool], ...]   # (result column name, descending)
+
+
+class ValuesSplit(NamedTuple):
+    head: str     # up to and including VALUES
+    row: str      # the parenthesised row, placeholders included
+    tail: str     # ON DUPLICATE KEY UPDATE ... or ""
+
+
+class PageShape(NamedTuple):
+    order_by: Optional[OrderBy]   # None unless the ORDER BY is a plain column list
+    has_limit: bool               # statement has a top-level LIMIT
+    locking: bool = False         # FOR UPDATE / FOR SHARE / LOCK IN SHARE MODE
+    table: Optional[str] = None   # the one table a plain single-table SELECT reads
+
+
+# ── Tokenizer ─────────────────────────────────────────────────────────────────
+
+_TOKEN_RE = re.compile(r"""
+    (?P<skip>
+        --(?=[ \t\r\n]|$)[^\n]*             # line comments ("--" needs whitespace after it)
+      | \#[^\n]*
+      | /\*(?!!).*?\*/                      # block comments (not /*! ... */)
+      | /\*!\d* | \*/                       # executable comment markers: keep the body
+      | '(?:[^'\\]|\\.|'')*'                # string literals
+      | "(?:[^"\\]|\\.|"")*"
+      | \d[\w.]*                            # numbers
+    )
+  | `(?P<quoted>(?:[^`]|``)*)`
+  | (?P<word>[A-Za-z_$][\w$]*)
+  | (?P<punct>[(),;.])
+""", re.X | re.S)
+
+_WORD, _NAME, _PUNCT = 0, 1, 2   # token kinds: keyword-able word, quoted identifier, punctuation
+
+
+def _tokenize(sql: str):
+    """Return (kinds, uppers, texts) for every token outside comments and literals."""
+    kinds, uppers, texts = [], [], []
+    for m in _TOKEN_RE.finditer(sql):
+        group = m.lastgroup
+        if group == "skip":
+            continue
+        if group == "word":
+            text = m.group()
+            kinds.append(_WORD)
+            uppers.append(text.upper())
+            texts.append(text)
+        elif group == "quoted":
+            kinds.append(_NAME)
+            uppers.append("")           # never matches a keyword
+            texts.append(m.group("quoted").replace("``", "`"))
+        else:
+            kinds.append(_PUNCT)
+            uppers.append(m.group())
+            texts.append(m.group())
+    return kinds, uppers, texts
+
+
+# ── Parser ────────────────────────────────────────────────────────────────────
+
+_BLOCKED_BY_FIRST: dict = {}
+for _entry in BLOCKED_STATEMENTS:
+    _words = tuple(_entry.split())
+    _BLOCKED_BY_FIRST.setdefault(_words[0], []).append(_words)
+
+# Words after which "(" opens a subquery or list rather than a function call
+_NON_CALL_WORDS = frozenset((
+    "FROM", "JOIN", "IN", "EXISTS", "AS", "ON", "WHERE", "AND", "OR", "NOT",
+    "SELECT", "UNION", "ALL", "ANY", "SOME", "VALUES", "VALUE", "INTO", "SET",
+    "HAVING", "WITH", "LATERAL", "USING", "THEN", "ELSE", "WHEN", "BY",
+))
+
+# Words that end a table reference (so are never read as an alias)
+_CLAUSE_WORDS = frozenset((
+    "WHERE", "JOIN", "INNER", "LEFT", "RIGHT", "OUTER", "CROSS", "NATURAL",
+    "STRAIGHT_JOIN", "ON", "USING", "GROUP", "ORDER", "HAVING", "LIMIT", "UNION",
+    "FOR", "LOCK", "WINDOW", "SET", "VALUES", "SELECT", "INTO", "PARTITION",
+    "FORCE", "IGNORE", "USE", "WITH", "AS",
+))
+
+_TARGET_MODIFIERS = frozenset((
+    "LOW_PRIORITY", "DELAYED", "HIGH_PRIORITY", "IGNORE", "QUICK", "INTO",
+    "TABLE", "TEMPORARY", "IF", "NOT", "EXISTS", "OR", "REPLACE", "ONLINE",
+    "OFFLINE", "UNIQUE", "FULLTEXT", "SPATIAL", "VIEW", "DATABASE", "SCHEMA",
+))
+
+
+def _name_at(kinds, texts, i) -> Tuple[Optional[str], int]:
+    """Read a possibly qualified name (db.table) at ``i``; returns (name, next index)."""
+    n = len(kinds)
+    if i >= n or kinds[i] == _PUNCT:
+        return None, i
+    parts = [texts[i]]
+    i += 1
+    while i + 1 < n and texts[i] == "." and kinds[i + 1] != _PUNCT:
+        parts.append(texts[i + 1])
+        i += 2
+    return ".".join(parts), i
+
+
+def _skip_parens(uppers, i) -> int:
+    """``uppers[i]`` is "("; return the index just past its matching ")"."""
+    depth = 0
+    n = len(uppers)
+    while i < n:
+        if uppers[i] == "(":
+            depth += 1
+        elif uppers[i] == ")":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return n
+
+
+def _find_blocked(kinds, uppers) -> Optional[str]:
+    n = len(uppers)
+    for i, up in enumerate(uppers):
+        candidates = _BLOCKED_BY_FIRST.get(up)
+        if not candidates or kinds[i] != _WORD:
+            continue
+        for words in candidates:
+            if tuple(uppers[i:i + len(words)]) != words:
+                continue
+            # TRUNCATE(x, d) is MySQL's numeric function, not the statement
+            if words == ("TRUNCATE",) and i + 1 < n and uppers[i + 1] == "(":
+                continue
+            return " ".join(words)
+    return None
+
+
+def _skip_with(kinds, uppers, texts, i) -> Tuple[int, set]:
+    """Skip the WITH clause starting at ``i``; returns (next index, CTE names)."""
+    n = len(uppers)
+    ctes = set()
+    i += 1
+    if i < n and uppers[i] == "RECURSIVE":
+        i += 1
+    while i < n and kinds[i] != _PUNCT:
+        ctes.add(texts[i].lower())
+        i += 1
+        if i < n and uppers[i] == "(":          # column list
+            i = _skip_parens(uppers, i)
+        if i < n and uppers[i] == "AS":
+            i += 1
+        if i < n and uppers[i] == "(":
+            i = _skip_parens(uppers, i)
+        if i < n and uppers[i] == ",":
+            i += 1
+            continue
+        break
+    return i, ctes
+
+
+def _statement_start(kinds, uppers, texts) -> Tuple[str, int, set]:
+    """Leading statement keyword, its index and any CTE names."""
+    n = len(uppers)
+    i = 0
+    while i < n and uppers[i] in ("(", ";"):
+        i += 1
+    ctes: set = set()
+    if i < n and uppers[i] == "WITH":
+        i, ctes = _skip_with(kinds, uppers, texts, i)
+        while i < n and uppers[i] == "(":
+            i += 1
+    if i < n and kinds[i] == _WORD:
+        return uppers[i], i, ctes
+    return "", i, ctes
+
+
+def _find_target(statement, kinds, uppers, texts, i) -> Optional[str]:
+    """Table written by the statement whose keyword is at ``i``."""
+    n = len(uppers)
+    if statement in ("SELECT", ""):
+        return None
+    i += 1
+    if statement in ("CREATE", "DROP", "ALTER") and "INDEX" in uppers[i:i + 4]:
+        # CREATE [UNIQUE] INDEX name ON table / DROP INDEX name ON table
+        while i < n and uppers[i] != "ON":
+            i += 1
+        return _name_at(kinds, texts, i + 1)[0]
+    while i < n and kinds[i] == _WORD and uppers[i] in _TARGET_MODIFIERS:
+        i += 1
+    if statement == "DELETE":
+        while i < n and uppers[i] != "FROM":
+            i += 1
+        i += 1
+    return _name_at(kinds, texts, i)[0]
+
+
+def _read_tables(kinds, uppers, texts, ctes) -> list:
+    """Tables named after FROM / JOIN outside function calls."""
+    n = len(uppers)
+    tables = []
+    calls = []                 # per open "(": True if it is a function call
+    i = 0
+    while i < n:
+        up = uppers[i]
+        if up == "(":
+            prev = i - 1
+            calls.append(prev >= 0 and kinds[prev] != _PUNCT and uppers[prev] not in _NON_CALL_WORDS)
+        elif up == ")":
+            if calls:
+                calls.pop()
+        elif (up == "FROM" or up == "JOIN") and kinds[i] == _WORD and not (calls and calls[-1]):
+            i += 1
+            while i < n:
+                if uppers[i] == "(":            # derived table; its FROM is found later
+                    break
+                name, i = _name_at(kinds, texts, i)
+                if not name:
+                    break
+                if name.lower() not in ctes and name.upper() != "DUAL":
+                    tables.append(name)
+                # optional alias: [AS] name
+                if i < n and uppers[i] == "AS":
+                    i += 1
+                if i < n and kinds[i] != _PUNCT and uppers[i] not in _CLAUSE_WORDS:
+                    i += 1
+                if up == "FROM" and i < n and uppers[i] == ",":
+                    i += 1
+                    continue
+                break
+            continue
+        i += 1
+    return tables
+
+
+def _classify(sql: str) -> SqlInfo:
+    kinds, uppers, texts = _tokenize(sql)
+    statement, i, ctes = _statement_start(kinds, uppers, texts)
+    target = _find_target(statement, kinds, uppers, texts, i)
+    read = _read_tables(kinds, uppers, texts, ctes)
+    tables = tuple(dict.fromkeys(t for t in read if t != target))
+    return SqlInfo(statement, target, tables, _find_blocked(kinds, uppers))
+
+
+# ── Memoization ───────────────────────────────────────────────────────────────
+
+_cache: "OrderedDict[bytes, SqlInfo]" = OrderedDict()
+_cache_lock = threading.Lock()
+_hits = 0
+_misses = 0
+
+
+def classify(sql: str) -> SqlInfo:
+    """Classify ``sql``, memoized by BLAKE2b digest."""
+    global _hits, _misses
+    key = hashlib.blake2b(sql.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+    with _cache_lock:
+        info = _cache.get(key)
+        if info is not None:
+            _cache.move_to_end(key)
+            _hits += 1
+            return info
+        _misses += 1
+    info = _classify(sql)
+    with _cache_lock:
+        _cache[key] = info
+        if len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return info
+
+
+def cache_stats() -> dict:
+    with _cache_lock:
+        return {"entries": len(_cache), "max_entries": _CACHE_SIZE, "hits": _hits, "misses": _misses}
+
+
+# ── Paging shape ──────────────────────────────────────────────────────────────
+
+# Words that let one table row appear in several result rows, or a result row
+# stand for several table rows
+_MULTI_ROW_SOURCE_WORDS = frozenset(("JOIN", "STRAIGHT_JOIN", "UNION", "GROUP", "DISTINCT", "DISTINCTROW", "WITH"))
+
+@functools.lru_cache(maxsize=512)
+def page_shape(sql: str) -> PageShape:
+    """Trailing top-level ORDER BY column list and LIMIT presence of a SELECT."""
+    tokens = []                 # (upper, text, start, end) at depth 0
+    depth = 0
+    selects, multi_table = 0, False
+    for m in _TOKEN_RE.finditer(sql):
+        group = m.lastgroup
+        if group == "skip":
+            continue
+        text = m.group()
+        if group == "word":
+            upper = text.upper()
+            selects += upper == "SELECT"
+            multi_table = multi_table or upper in _MULTI_ROW_SOURCE_WORDS
+        if group == "punct" and text == ")":
+            depth -= 1
+        elif depth == 0:
+            if group == "quoted":
+                tokens.append(("", m.group("quoted").replace("``", "`"), m.start(), m.end()))
+            else:
+                tokens.append((text.upper(), text, m.start(), m.end()))
+        if group == "punct" and text == "(":
+            depth += 1
+
+    has_limit = any(t[0] == "LIMIT" for t in tokens)
+    ups = [t[0] for t in tokens]
+    locking = any(ups[i:i + 2] in (["FOR", "UPDATE"], ["FOR", "SHARE"]) or ups[i:i + 4] == ["LOCK", "IN", "SHARE", "MODE"]
+                  for i in range(len(ups)))
+    order_at = None
+    for i in range(len(tokens) - 1):
+        if tokens[i][0] == "ORDER" and tokens[i + 1][0] == "BY":
+            order_at = i
+    if order_at is None or depth != 0:
+        return PageShape(None, has_limit, locking)
+
+    # Only "name [ASC|DESC], ..." with nothing but whitespace between tokens;
+    # expressions, positions, LIMIT or FOR UPDATE all disqualify.
+    items = tokens[order_at + 2:]
+    while items and items[-1][0] == ";":
+        items.pop()
+    tail = sql[items[-1][3]:].strip() if items else ""
+    if not items or tail.strip(";").strip():
+        return PageShape(None, has_limit)
+    for prev, cur in zip(items, items[1:]):
+        if sql[prev[3]:cur[2]].strip():
+            return PageShape(None, has_limit)
+
+    columns = []
+    i, n = 0, len(items)
+    while i < n:
+        up, text = items[i][0], items[i][1]
+        if up in ("(", ")", ",", ".", ";") or up in _CLAUSE_WORDS:
+            return PageShape(None, has_limit)
+        name = text
+        i += 1
+        while i + 1 < n and items[i][1] == "." and items[i + 1][0] not in ("(", ",", "."):
+            name = items[i + 1][1]
+            i += 2
+        if i < n and items[i][0] == "(":
+            return PageShape(None, has_limit)       # function call
+        desc = False
+        if i < n and items[i][0] in ("ASC", "DESC"):
+            desc = items[i][0] == "DESC"
+            i += 1
+        columns.append((name, desc))
+        if i < n:
+            if items[i][0] != ",":
+                return PageShape(None, has_limit)
+            i += 1
+    base = sql[:tokens[order_at][2]].rstrip()
+
+    table = None
+    read = classify(sql).tables
+    if selects == 1 and not multi_table and len(read) == 1:
+        aliases = {tokens[i + 1][1].lower() for i in range(order_at - 1) if ups[i] == "AS"}
+        if not any(name.lower() in aliases for name, _ in columns):
+            table = read[0]
+    return PageShape(OrderBy(base, tuple(columns)), has_limit, locking, table)
+
+
+# ── Bulk VALUES rows ──────────────────────────────────────────────────────────
+
+@functools.lru_cache(maxsize=256)
+def split_values(sql: str) -> Optional[ValuesSplit]:
+    """Head / row / tail of a one-row INSERT or REPLACE ... VALUES (...)."""
+    if classify(sql).statement not in ("INSERT", "REPLACE"):
+        return None
+    depth = 0
+    values_end = row_start = row_end = None
+    for m in _TOKEN_RE.finditer(sql):
+        group = m.lastgroup
+        if group == "skip":
+            continue
+        text = m.group()
+        if row_end is not None:
+            if depth == 0 and text == ",":
+                return None                 # already several rows
+            break
+        if group == "punct" and text == "(":
+            if depth == 0 and values_end is not None:
+                row_start = m.start()
+            depth += 1
+        elif group == "punct" and text == ")":
+            depth -= 1
+            if depth == 0 and row_start is not None:
+                row_end = m.end()
+        elif depth == 0 and values_end is None and group == "word" and text.upper() in ("VALUES", "VALUE"):
+            values_end = m.end()
+    if row_end is None:
+        return None
+    head, row, tail = sql[:row_start], sql[row_start:row_end], sql[row_end:]
+    if "%s" in head or "%s" in tail or "%s" not in row:
+        return None
+    return ValuesSplit(head, row, tail)
@@ -0,0 +1,134 @@
+"""
+Capture of the distinct SQL statements a process issues, for query_plan_audit.py.
+
+Set ``ORS_CAPTURE_STATEMENTS`` to a file path and every statement that goes
+through DatabaseManagerPooled (desktop direct mode, and the API server on
+behalf of API-mode clients) is recorded once per fingerprint — the first
+time its shape is seen — as a JSON line:
+
+    {"fp": "3f9c0e6a1b2d4c57", "sql": "SELECT ... WHERE d.branch = %s",
+     "params": ["Main"], "first_seen": "2025-01-31 09:12:44"}
+
+The params of that first call are kept so the statement can be EXPLAINed
+as issued.  Fingerprints already in the file are loaded at startup, and
+before each append the writer takes an advisory lock (fcntl) and reads
+whatever other processes appended since, so several runs or API workers
+can share one capture file without duplicating entries.  Windows has no
+fcntl: there each process only knows the file as it was at startup, so
+give concurrent processes their own files.  When the variable is unset,
+recording is a single attribute check.
+
+Stdlib only, like tracing.py.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Set
+
+from cache_policy import fingerprint
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None   # Windows: no cross-process lock
+
+CAPTURE_FILE = os.environ.get("ORS_CAPTURE_STATEMENTS", "")
+_MAX_PARAM_CHARS = 200    # longer string params are stored truncated
+
+logger = logging.getLogger(__name__)
+
+
+def _param(value):
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    text = str(value)     # dates, Decimals, bytes: MySQL accepts their text form
+    return text[:_MAX_PARAM_CHARS]
+
+
+def _entries(lines) -> List[dict]:
+    entries = []
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(entry, dict) and entry.get("sql"):
+            entries.append(entry)
+    return entries
+
+
+def load(path: str) -> List[dict]:
+    """The entries of a capture file (unreadable lines skipped)."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return _entries(f)
+    except FileNotFoundError:
+        return []
+
+
+class StatementCapture:
+    """Appends each new statement fingerprint to a JSONL file; counts every call."""
+
+    def __init__(self, path: str = CAPTURE_FILE):
+        self.path = path
+        self.enabled = bool(path)
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+        self._offset = 0   # bytes of the file already read
+        if self.enabled:
+            try:
+                with open(path, "rb") as f:
+                    self._merge(f.read())
+            except FileNotFoundError:
+                pass
+            logger.info(f"Capturing SQL statements to {path} ({len(self._counts)} already captured)")
+
+    def record(self, sql: str, params=None) -> None:
+        if not self.enabled:
+            return
+        fp = fingerprint(sql)
+        with self._lock:
+            seen = fp in self._counts
+            self._counts[fp] = self._counts.get(fp, 0) + 1
+            if seen:
+                return
+            entry = {
+                "fp": fp,
+                "sql": sql.strip(),
+                "params": [_param(v) for v in params] if isinstance(params, (list, tuple)) else None,
+                "first_seen": time.strftime("%Y-%m-%d %H:%M:%S"),
+            }
+            try:
+                with open(self.path, "a+b") as f:
+                    if fcntl is not None:
+                        fcntl.flock(f, fcntl.LOCK_EX)   # released when the file closes
+                        f.seek(self._offset)
+                        if fp in self._merge(f.read()):  # another process captured it first
+                            return
+                    f.write((json.dumps(entry) + "\n").encode("utf-8"))
+                    self._offset = f.tell()
+            except OSError as e:
+                logger.error(f"Statement capture disabled, {self.path} not writable: {e}")
+                self.enabled = False
+
+    def _merge(self, data: bytes) -> Set[str]:
+        """Add the fingerprints in newly read file content (complete lines only); returns them."""
+        end = data.rfind(b"\n") + 1
+        fps = {entry.get("fp") or fingerprint(entry["sql"])
+               for entry in _entries(data[:end].decode("utf-8", "replace").splitlines())}
+        for fp in fps:
+            self._counts.setdefault(fp, 0)
+        self._offset += end
+        return fps
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"enabled": self.enabled, "path": self.path or None,
+                    "distinct": len(self._counts), "calls": sum(self._counts.values())}
+
+
+# Global instance
+statement_capture = StatementCapture()
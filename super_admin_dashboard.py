@@ -23,6 +23,7 @@ from PyQt5.QtCore import Qt, pyqtSignal, QTimer
 from PyQt5.QtGui import QFont
 
 from db_connect_pooled import db_manager
+from schema_catalog import schema_catalog
 from security import SessionManager
 from currency_manager import init_currencies_table, get_all_currencies_with_status, add_currency, remove_currency, restore_currency
 
@@ -188,18 +189,15 @@ def _ensure_db_columns(db_col: str, report_tables: list = None) -> tuple:
     if not db_manager.test_connection():
         return False, "Cannot connect to the database."
 
+    # Read the live schema once (other admins may have changed it since it was cached)
+    schema_catalog.invalidate()
+    altered = False
+
     for table in tables:
         # Check if the table exists first
-        try:
-            exists = db_manager.execute_query(
-                "SELECT COUNT(*) AS cnt FROM information_schema.tables "
-                "WHERE table_schema = DATABASE() AND table_name = %s",
-                [table]
-            )
-            if not exists or exists[0]['cnt'] == 0:
-                continue  # Table doesn't exist – skip without error
-        except Exception:
-            continue
+        if not schema_catalog.has_table(table, db=db_manager):
+            continue  # Table doesn't exist – skip without error
+        existing = schema_catalog.columns(table, db=db_manager)
 
         table_updated = False
         for col_name, col_type in [
@@ -208,12 +206,7 @@ def _ensure_db_columns(db_col: str, report_tables: list = None) -> tuple:
         ]:
             try:
                 # First check if column already exists
-                check_sql = (
-                    "SELECT COUNT(*) AS cnt FROM information_schema.columns "
-                    "WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s"
-                )
-                result = db_manager.execute_query(check_sql, [table, col_name])
-                if result and result[0]['cnt'] > 0:
+                if col_name in existing:
                     table_updated = True  # Column already exists
                     continue
                 
@@ -221,6 +214,7 @@ def _ensure_db_columns(db_col: str, report_tables: list = None) -> tuple:
                 sql = f"ALTER TABLE `{table}` ADD COLUMN `{col_name}` {col_type}"
                 db_manager.execute_query(sql)
                 table_updated = True
+                altered = True
             except Exception as exc:
                 msg = str(exc)
                 # Ignore 'Duplicate column name' (1060) – already exists
@@ -232,6 +226,9 @@ def _ensure_db_columns(db_col: str, report_tables: list = None) -> tuple:
         if table_updated and table not in updated_tables:
             updated_tables.append(table)
 
+    if altered:
+        schema_catalog.invalidate()
+
     if errors:
         return False, "\n".join(errors), updated_tables
     return True, f"Updated tables: {', '.join(updated_tables)}" if updated_tables else "No tables updated", updated_tables
@@ -262,28 +259,19 @@ def _remove_db_columns(db_col: str) -> tuple:
     if not db_manager.test_connection():
         return False, "Cannot connect to the database."
 
+    # Read the live schema once (other admins may have changed it since it was cached)
+    schema_catalog.invalidate()
+
     for table in tables:
         # Check if the table exists
-        try:
-            exists = db_manager.execute_query(
-                "SELECT COUNT(*) AS cnt FROM information_schema.tables "
-                "WHERE table_schema = DATABASE() AND table_name = %s",
-                [table]
-            )
-            if not exists or exists[0]['cnt'] == 0:
-                continue  # Table doesn't exist
-        except Exception:
-            continue
+        if not schema_catalog.has_table(table, db=db_manager):
+            continue  # Table doesn't exist
+        existing = schema_catalog.columns(table, db=db_manager)
 
         for col_name in [db_col, db_col + "_lotes"]:
             try:
                 # Check if column exists before trying to drop
-                col_exists = db_manager.execute_query(
-                    "SELECT COUNT(*) AS cnt FROM information_schema.columns "
-                    "WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s",
-                    [table, col_name]
-                )
-                if col_exists and col_exists[0]['cnt'] > 0:
+                if col_name in existing:
                     sql = f"ALTER TABLE `{table}` DROP COLUMN `{col_name}`"
                     db_manager.execute_query(sql)
                     if table not in removed_from:
@@ -291,6 +279,9 @@ def _remove_db_columns(db_col: str) -> tuple:
             except Exception as exc:
                 errors.append(f"{table}.{col_name}: {str(exc)}")
 
+    if removed_from:
+        schema_catalog.invalidate()
+
     if errors:
         return False, "\n".join(errors)
     
@@ -0,0 +1,91 @@
+"""
+In-process stand-in for the subset of redis.Redis the API server uses.
+"""
+
+import fnmatch
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def setex(self, key, ttl, data):
+        self.commands.append((key, ttl, data))
+        return self
+
+    def execute(self):
+        if self.redis.fail_pipeline:
+            raise ConnectionError("pipeline failed")
+        for key, ttl, data in self.commands:
+            self.redis.setex(key, ttl, data)
+        self.redis.pipeline_executes += 1
+        return [True] * len(self.commands)
+
+
+class FakeRedis:
+    """Strings, counters, key patterns and publish; TTLs are recorded, not enforced."""
+
+    def __init__(self):
+        self.store = {}
+        self.ttls = {}
+        self.subscribers = []        # callables receiving (channel, data)
+        self.fail_pipeline = False
+        self.fail_mget = False
+        self.mget_calls = 0
+        self.pipeline_executes = 0
+
+    @staticmethod
+    def _key(key):
+        return key.decode() if isinstance(key, bytes) else key
+
+    def set(self, key, value, nx=False, ex=None):
+        key = self._key(key)
+        if nx and key in self.store:
+            return None
+        self.store[key] = value if isinstance(value, bytes) else str(value).encode()
+        if ex is not None:
+            self.ttls[key] = ex
+        return True
+
+    def setex(self, key, ttl, data):
+        key = self._key(key)
+        self.store[key] = data
+        self.ttls[key] = ttl
+        return True
+
+    def get(self, key):
+        return self.store.get(self._key(key))
+
+    def mget(self, keys):
+        if self.fail_mget:
+            raise ConnectionError("mget failed")
+        self.mget_calls += 1
+        return [self.store.get(self._key(key)) for key in keys]
+
+    def incr(self, key):
+        key = self._key(key)
+        value = int(self.store.get(key, b"0")) + 1
+        self.store[key] = str(value).encode()
+        return value
+
+    def keys(self, pattern="*"):
+        return [key.encode() for key in self.store if fnmatch.fnmatchcase(key, self._key(pattern))]
+
+    def delete(self, *keys):
+        removed = 0
+        for key in keys:
+            key = self._key(key)
+            if key in self.store:
+                del self.store[key]
+                self.ttls.pop(key, None)
+                removed += 1
+        return removed
+
+    def publish(self, channel, data):
+        for subscriber in self.subscribers:
+            subscriber(channel, data)
+        return len(self.subscribers)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
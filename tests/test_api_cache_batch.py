@@ -0,0 +1,90 @@
+"""
+Batched cache helpers of the API server (_cache_get_many / _cache_set_many)
+against a small in-process Redis fake.
+
+api_server connects its DB pool at import time, so these tests only run
+where the server's dependencies are installed.
+"""
+
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("jwt")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import api_server  # noqa: E402
+from fake_redis import FakeRedis  # noqa: E402
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(api_server, "_redis", fake)
+    monkeypatch.setattr(api_server, "_redis_ok", True)
+    monkeypatch.setattr(api_server, "CACHE_TTL", 30)
+    with api_server._cache_lock:
+        api_server._cache.clear()
+    yield fake
+    with api_server._cache_lock:
+        api_server._cache.clear()
+
+
+def test_set_many_pipelines_one_round(redis):
+    api_server._cache_set_many([
+        ("ors:a", [{"id": 1}], None, 0, None),
+        ("ors:b", [{"id": 2}], 120, 0, None),
+    ])
+    assert redis.pipeline_executes == 1
+    assert redis.ttls == {"ors:a": 30, "ors:b": 120}
+
+
+def test_set_many_skips_disabled_and_oversized(redis):
+    api_server._cache_set_many([
+        ("ors:off", [1], 0, 0, None),
+        ("ors:big", ["x" * 100], None, 0, 10),
+    ])
+    assert redis.store == {}
+    assert redis.pipeline_executes == 0
+
+
+def test_get_many_all_hits(redis):
+    api_server._cache_set_many([("ors:a", [{"id": 1}], None, 0, None),
+                                ("ors:b", [{"id": 2}], None, 0, None)])
+    assert api_server._cache_get_many(["ors:a", "ors:b"]) == [(True, [{"id": 1}]), (True, [{"id": 2}])]
+    assert redis.mget_calls == 1
+
+
+def test_get_many_all_misses(redis):
+    assert api_server._cache_get_many(["ors:x", "ors:y"]) == [(False, None), (False, None)]
+    assert api_server._cache_get_many([]) == []
+
+
+def test_get_many_mixed_keeps_order(redis):
+    api_server._cache_set_many([("ors:b", {"v": "b"}, None, 0, None)])
+    hits_before, misses_before = api_server._cache_hits, api_server._cache_misses
+    found = api_server._cache_get_many(["ors:a", "ors:b", "ors:c"])
+    assert found == [(False, None), (True, {"v": "b"}), (False, None)]
+    assert api_server._cache_hits - hits_before == 1
+    assert api_server._cache_misses - misses_before == 2
+
+
+def test_swr_entry_extends_redis_ttl(redis):
+    api_server._cache_set_many([("ors:s", [1], 10, 5, None)])
+    assert redis.ttls["ors:s"] == 15
+    assert api_server._cache_get_many(["ors:s"]) == [(True, [1])]
+
+
+def test_pipeline_failure_falls_back_to_memory(redis):
+    redis.fail_pipeline = True
+    api_server._cache_set_many([("ors:a", [1], None, 0, None), ("ors:b", [2], None, 0, None)])
+    assert redis.store == {}
+    with api_server._cache_lock:
+        assert set(api_server._cache) == {"ors:a", "ors:b"}
+    # Reads fall back to the same in-memory store when Redis is down
+    redis.fail_mget = True
+    assert api_server._cache_get_many(["ors:a", "ors:b", "ors:c"]) == [(True, [1]), (True, [2]), (False, None)]
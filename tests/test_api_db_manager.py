@@ -0,0 +1,67 @@
+"""
+Paging in the desktop API managers: a rejected continuation page must raise,
+never pass for the last page of a result.
+"""
+
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("sqlalchemy")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import api_db_manager  # noqa: E402
+from db_connect_pooled import RemoteDatabaseManager  # noqa: E402
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self.payload = payload
+        self.text = str(payload)
+
+    def json(self):
+        return self.payload
+
+
+def _api_manager(pages):
+    db = api_db_manager.APIDbManager(base_url="https://server", api_key="key")
+    db._post_exec = lambda endpoint, sql, params, page_token=None, max_rows=None: pages.pop(0)
+    return db
+
+
+def test_rest_of_result_follows_tokens():
+    db = _api_manager([FakeResponse(200, {"result": [{"id": 2}], "next_token": "t2"}),
+                       FakeResponse(200, {"result": [{"id": 3}], "next_token": None})])
+    rows = db._rest_of_result("/api/exec", "SELECT id FROM t", None, {"result": [{"id": 1}], "next_token": "t1"})
+    assert rows == [{"id": 1}, {"id": 2}, {"id": 3}]
+
+
+@pytest.mark.parametrize("status", [400, 403, 429])
+def test_rest_of_result_raises_on_rejected_page(status):
+    db = _api_manager([FakeResponse(status, {"detail": "Too many requests"})])
+    with pytest.raises(RuntimeError):
+        db._rest_of_result("/api/exec", "SELECT id FROM t", None, {"result": [{"id": 1}], "next_token": "t1"})
+
+
+def test_iter_query_raises_on_rejected_page():
+    db = _api_manager([FakeResponse(200, {"result": [{"id": 1}], "next_token": "t1"}),
+                       FakeResponse(400, {"detail": "Invalid page token"})])
+    db._ensure_token = lambda: None
+    rows = db.iter_query("SELECT id FROM t", batch_size=1)
+    assert next(rows).id == 1
+    with pytest.raises(RuntimeError):
+        next(rows)
+
+
+def test_remote_rest_of_result_rejects_detail_page():
+    db = RemoteDatabaseManager.__new__(RemoteDatabaseManager)
+    db._page = lambda endpoint, query, params, token=None, max_rows=None: ({"detail": "Forbidden"}, None)
+    rows, err = db._rest_of_result("/api/exec", "SELECT id FROM t", None,
+                                   {"result": [{"id": 1}], "next_token": "t1"}, "error")
+    assert rows is None
+    assert "Forbidden" in str(err)
@@ -0,0 +1,69 @@
+"""
+Shared invalidation stream of the API server over a Redis fake: sequence
+numbers and the epoch must survive cache clears, which delete ``ors:*``.
+
+api_server connects its DB pool at import time, so these tests only run
+where the server's dependencies are installed.
+"""
+
+import collections
+import json
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("jwt")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import api_server  # noqa: E402
+from fake_redis import FakeRedis  # noqa: E402
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    fake = FakeRedis()
+    # Stands in for _inval_subscriber: deliver each publish to this worker's buffer
+    fake.subscribers.append(lambda channel, data: api_server._inval_append(json.loads(data)))
+    fake.set(api_server._INVAL_EPOCH_KEY, "epoch1")
+    monkeypatch.setattr(api_server, "_redis", fake)
+    monkeypatch.setattr(api_server, "_redis_ok", True)
+    monkeypatch.setattr(api_server, "_inval_shared", True)
+    monkeypatch.setattr(api_server, "_inval_epoch", "epoch1")
+    monkeypatch.setattr(api_server, "_inval_events", collections.deque(maxlen=100))
+    monkeypatch.setattr(api_server, "_inval_seq", 0)
+    monkeypatch.setattr(api_server, "_inval_floor", 0)
+    monkeypatch.setattr(api_server, "_WARMUP_REFILL_SECS", 0)
+    return fake
+
+
+def test_seq_survives_write_cache_clear(redis):
+    api_server._publish_invalidation("table", ["branches"])
+    events, reset = api_server._invalidations_since(0, "epoch1")
+    since = events[-1]["seq"]
+
+    redis.set("ors:somequery", b"[]")
+    api_server._cache_clear_all()
+    api_server._publish_invalidation("table", ["corporations"])
+
+    assert "ors:somequery" not in redis.store
+    events, reset = api_server._invalidations_since(since, "epoch1")
+    assert not reset
+    assert [e["tables"] for e in events] == [["corporations"]]
+    assert events[0]["seq"] == since + 1
+
+
+def test_seq_and_epoch_survive_cache_clear_endpoint(redis):
+    api_server._publish_invalidation("table", ["branches"])
+    since = api_server._inval_seq
+
+    api_server.cache_clear(None)   # publishes an "all" event itself
+
+    events, reset = api_server._invalidations_since(since, "epoch1")
+    assert not reset
+    assert [e["ns"] for e in events] == ["all"]
+    assert events[0]["seq"] == since + 1
+    assert redis.get(api_server._INVAL_EPOCH_KEY) == b"epoch1"
@@ -0,0 +1,65 @@
+"""
+Client-side invalidation listener: TTLs are only stretched while the
+server's stream carries every worker's writes.
+"""
+
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("requests")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cache_invalidation  # noqa: E402
+from cache_invalidation import InvalidationSubscriber, LIVE_CACHE_TTL, cache_ttl  # noqa: E402
+
+
+class FakeResponse:
+    def __init__(self, payload, status_code=200):
+        self.payload = payload
+        self.status_code = status_code
+
+    def json(self):
+        return self.payload
+
+
+class FakeSession:
+    def __init__(self, payload):
+        self.payload = payload
+        self.headers = {}
+
+    def get(self, url, params=None, timeout=None):
+        return FakeResponse(self.payload)
+
+
+def _subscriber(monkeypatch, payload) -> InvalidationSubscriber:
+    sub = InvalidationSubscriber("https://server", "key")
+    sub._token = "token"
+    sub._session = FakeSession(payload)
+    monkeypatch.setattr(cache_invalidation, "_subscriber", sub)
+    assert sub._poll_once()
+    sub._live = True   # what _run sets after a successful poll
+    return sub
+
+
+def test_shared_stream_stretches_ttl(monkeypatch):
+    sub = _subscriber(monkeypatch, {"epoch": "e", "seq": 3, "events": [], "reset": False, "shared": True})
+    assert sub.is_live
+    assert cache_ttl(300) == max(300, LIVE_CACHE_TTL)
+
+
+@pytest.mark.parametrize("payload", [
+    {"epoch": "e", "seq": 3, "events": [], "reset": False, "shared": False},
+    {"epoch": "e", "seq": 3, "events": [], "reset": False},   # older server
+])
+def test_per_worker_stream_keeps_short_ttl(monkeypatch, payload):
+    sub = _subscriber(monkeypatch, payload)
+    assert not sub.is_live
+    assert cache_ttl(300) == 300
+
+
+def test_no_listener_keeps_short_ttl(monkeypatch):
+    monkeypatch.setattr(cache_invalidation, "_subscriber", None)
+    assert cache_ttl(300) == 300
@@ -0,0 +1,48 @@
+"""
+ScriptTransaction (API-mode transactions): reads run at once, writes are
+queued for /api/transaction — using the server's idea of a SELECT.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_transaction import ScriptTransaction  # noqa: E402
+
+
+def _tx(reads):
+    def read(sql, params):
+        reads.append(sql)
+        return [{"n": 1}], None
+    return ScriptTransaction(read, send=lambda statements: None, fallback=lambda sql, params: 1)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT n FROM t",
+    "  select n FROM t",
+    "WITH x AS (SELECT n FROM t) SELECT * FROM x",
+    "(SELECT n FROM t) UNION (SELECT n FROM u)",
+    "/* report */ SELECT n FROM t",
+])
+def test_reads_run_immediately(sql):
+    reads = []
+    tx = _tx(reads)
+    assert tx.execute(sql) == [{"n": 1}]
+    assert reads == [sql]
+    assert tx.statements == []
+
+
+@pytest.mark.parametrize("sql", [
+    "UPDATE t SET n = 2",
+    "WITH x AS (SELECT n FROM s) DELETE FROM t WHERE n IN (SELECT n FROM x)",
+    "INSERT INTO t (n) SELECT n FROM s",
+])
+def test_writes_are_queued(sql):
+    reads = []
+    tx = _tx(reads)
+    assert tx.execute(sql, (1,)) is None
+    assert reads == []
+    assert tx.statements == [{"sql": sql, "params": [1]}]
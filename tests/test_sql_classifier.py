@@ -0,0 +1,173 @@
+"""
+sql_classifier: comments, CTEs, case, quoting, blocked statements and
+``split_values``.  The module's doctests run here too.
+"""
+
+import doctest
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sql_classifier  # noqa: E402
+from sql_classifier import classify, split_values  # noqa: E402
+
+
+def test_doctests():
+    failures, _ = doctest.testmod(sql_classifier)
+    assert failures == 0
+
+
+# ── Comments ──────────────────────────────────────────────────────────────────
+
+@pytest.mark.parametrize("sql", [
+    "SELECT 1 -- DROP TABLE users",
+    "SELECT 1 --\tDROP TABLE users",
+    "SELECT 1 --\nFROM t",
+    "SELECT 1 --",
+    "SELECT 1 # DROP TABLE users",
+    "SELECT 1 #DROP TABLE users",
+    "SELECT 1 /* DROP TABLE users */",
+    "SELECT 1 /* multi\nline DROP TABLE users */ FROM t",
+])
+def test_comments_are_not_sql(sql):
+    assert classify(sql).blocked is None
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT 1 --x; DROP TABLE users",
+    "SELECT 1 --1; DROP TABLE users",
+    "SELECT 1 ---; DROP TABLE users",
+])
+def test_double_dash_without_whitespace_is_not_a_comment(sql):
+    assert classify(sql).blocked == "DROP TABLE"
+
+
+def test_comment_hides_keyword_but_not_following_line():
+    info = classify("-- UPDATE t SET a = 1\nSELECT a FROM t")
+    assert info.statement == "SELECT"
+    assert info.tables == ("t",)
+
+
+@pytest.mark.parametrize("sql, blocked", [
+    ("SELECT 1 /*!50000 GRANT ALL ON *.* TO x */", "GRANT"),
+    ("SELECT 1 /*! DROP TABLE users */", "DROP TABLE"),
+    ("/*!40101 TRUNCATE TABLE t */", "TRUNCATE"),
+])
+def test_executable_comments_are_checked(sql, blocked):
+    assert classify(sql).blocked == blocked
+
+
+# ── CTEs ──────────────────────────────────────────────────────────────────────
+
+def test_cte_names_are_not_tables():
+    info = classify("WITH a AS (SELECT id FROM reports), b AS (SELECT id FROM a) "
+                    "SELECT * FROM b JOIN branches ON branches.id = b.id")
+    assert info.statement == "SELECT"
+    assert info.is_select
+    assert info.tables == ("reports", "branches")
+
+
+def test_recursive_cte():
+    info = classify("WITH RECURSIVE n (i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 5) SELECT * FROM n")
+    assert info.is_select
+    assert info.tables == ()
+
+
+def test_cte_before_write_is_a_write():
+    info = classify("WITH x AS (SELECT id FROM staging) UPDATE payables SET paid = 1 WHERE id IN (SELECT id FROM x)")
+    assert info.statement == "UPDATE"
+    assert not info.is_select
+    assert info.target == "payables"
+
+
+# ── Case and quoting ──────────────────────────────────────────────────────────
+
+@pytest.mark.parametrize("sql", [
+    "select * from branches",
+    "SeLeCt * FrOm branches",
+    "  \n\tSELECT * FROM branches",
+    "(SELECT * FROM branches)",
+])
+def test_mixed_case_and_layout(sql):
+    info = classify(sql)
+    assert info.is_select
+    assert info.tables == ("branches",)
+
+
+def test_quoted_identifiers():
+    info = classify("SELECT `drop table`.id FROM `ors`.`daily reports` AS `drop table`")
+    assert info.blocked is None
+    assert info.tables == ("ors.daily reports",)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT 'DROP TABLE users' FROM t",
+    "SELECT \"GRANT ALL\" FROM t",
+    "SELECT 'it''s; DROP TABLE users' FROM t",
+    "SELECT 'back\\'slash; DROP TABLE users' FROM t",
+])
+def test_literals_are_not_sql(sql):
+    assert classify(sql).blocked is None
+
+
+def test_write_target_with_schema_and_quotes():
+    assert classify("UPDATE `ors`.payables SET a = 1").target == "ors.payables"
+    assert classify("delete FROM `payables` WHERE id = 1").target == "payables"
+
+
+# ── Blocked statements ────────────────────────────────────────────────────────
+
+@pytest.mark.parametrize("sql, blocked", [
+    ("DROP TABLE users", "DROP TABLE"),
+    ("drop   table users", "DROP TABLE"),
+    ("SELECT 1; DROP TABLE users", "DROP TABLE"),
+    ("TRUNCATE TABLE payables", "TRUNCATE"),
+    ("GRANT ALL ON *.* TO x", "GRANT"),
+])
+def test_blocked_statements(sql, blocked):
+    assert classify(sql).blocked == blocked
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT TRUNCATE(amount, 2) FROM t",
+    "SELECT EXTRACT(YEAR FROM d) FROM t",
+    "SELECT dropped, granted FROM t",
+    "ALTER TABLE daily_reports ADD COLUMN x INT",
+])
+def test_allowed_statements(sql):
+    assert classify(sql).blocked is None
+
+
+# ── split_values ──────────────────────────────────────────────────────────────
+
+def test_split_values_basic():
+    split = split_values("INSERT INTO t (a, b) VALUES (%s, %s)")
+    assert split.head == "INSERT INTO t (a, b) VALUES "
+    assert split.row == "(%s, %s)"
+    assert split.tail == ""
+
+
+def test_split_values_nested_parens_and_literals():
+    split = split_values("REPLACE INTO t (a, b) VALUE (COALESCE(%s, 0), ')(,')")
+    assert split.row == "(COALESCE(%s, 0), ')(,')"
+
+
+def test_split_values_keeps_on_duplicate_tail():
+    split = split_values("insert into t (a) values (%s) on duplicate key update a = VALUES(a)")
+    assert split.tail == " on duplicate key update a = VALUES(a)"
+
+
+@pytest.mark.parametrize("sql", [
+    "INSERT INTO t (a) VALUES (%s), (%s)",                              # already several rows
+    "INSERT INTO t (a) VALUES (1)",                                     # no placeholder in the row
+    "INSERT INTO t (a) VALUES (%s) ON DUPLICATE KEY UPDATE a = %s",     # placeholder in the tail
+    "INSERT INTO t (a) SELECT a FROM s WHERE b = %s",                   # no VALUES
+    "UPDATE t SET a = %s",
+    "SELECT %s",
+    "",
+])
+def test_split_values_declines(sql):
+    assert split_values(sql) is None
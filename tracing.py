@@ -0,0 +1,380 @@
+"""
+Lightweight request tracing shared by the API server and the desktop apps.
+
+A trace is one request (server) or one user operation (desktop, e.g. posting
+a report).  Spans time its stages — auth, rate limiting, cache lookup, pool
+checkout, DB execution, serialization, response write — and are carried in
+context variables, so code deep in the DB layer can add spans or read the
+request ID without it being passed around.
+
+    from tracing import trace, span, sql_comment
+
+    with trace("client.post_report", branch="Main"):
+        with span("validate"):
+            ...
+
+Tagging:
+  * ``sql_comment()`` returns ``/* rid=... trace=... span=... */`` for the
+    current span; DatabaseManagerPooled prefixes it to every statement so it
+    shows in SHOW PROCESSLIST and the slow query log.
+  * ``outgoing_headers()`` gives the X-Request-ID and W3C ``traceparent``
+    headers the desktop managers send, so server spans join the client trace.
+
+Export: finished traces are written as OTLP/JSON (one
+ExportTraceServiceRequest per line) to ``ORS_TRACE_FILE`` when it is set.
+Traces slower than ``ORS_TRACE_SLOW_MS`` or ending in an error are always
+written; the rest are sampled at ``ORS_TRACE_SAMPLE``.
+
+Stdlib only — imported by the desktop apps as well as the server.
+"""
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TRACE_FILE    = os.environ.get("ORS_TRACE_FILE", "")
+TRACE_SAMPLE  = float(os.environ.get("ORS_TRACE_SAMPLE", "0.05"))
+TRACE_SLOW_MS = float(os.environ.get("ORS_TRACE_SLOW_MS", "1000"))
+SQL_COMMENTS  = os.environ.get("ORS_TRACE_SQL_COMMENTS", "true").lower() == "true"
+SERVICE_NAME  = os.environ.get("ORS_SERVICE_NAME", "ors")
+CLIENT_SLOW_MS = float(os.environ.get("ORS_CLIENT_SLOW_MS", "2000"))
+
+_SPAN_KINDS = {"internal": 1, "server": 2, "client": 3}
+_SAFE_ID = re.compile(r"[^A-Za-z0-9_.\-]")   # keeps IDs safe inside SQL comments and headers
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, parent_id: Optional[str], kind: str = "internal", attributes: dict = None):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes or {}
+        self.error = None
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+
+class Trace:
+    """One request or user operation: a root span plus its children."""
+
+    def __init__(self, name: str, request_id: str = None, trace_id: str = None,
+                 parent_id: str = None, kind: str = "server", attributes: dict = None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.request_id = _SAFE_ID.sub("", request_id or "")[:64] or self.trace_id[:16]
+        self.root = Span(name, parent_id, kind, attributes)
+        self.spans: List[Span] = [self.root]
+        self._seq = 0
+        self._tokens = None
+
+    def add(self, span: Span) -> None:
+        self.spans.append(span)   # list.append is atomic; spans may come from worker threads
+
+    def next_request_id(self) -> str:
+        """Request ID for the next outgoing call: ``<rid>.<n>``, greppable by prefix."""
+        self._seq += 1
+        return f"{self.request_id}.{self._seq}"
+
+    def breakdown(self) -> Dict[str, float]:
+        """Milliseconds per stage name (children of all depths, summed)."""
+        stages: Dict[str, float] = {}
+        for s in self.spans[1:]:
+            if s.end_ns is not None:
+                stages[s.name] = round(stages.get(s.name, 0.0) + s.duration_ms, 2)
+        return stages
+
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("ors_trace", default=None)
+_current_span: contextvars.ContextVar = contextvars.ContextVar("ors_span", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def current_request_id() -> Optional[str]:
+    t = _current_trace.get()
+    return t.request_id if t else None
+
+
+# ── Traces and spans ──────────────────────────────────────────────────────────
+
+def start_trace(name: str, request_id: str = None, traceparent: str = None,
+                kind: str = "server", **attributes) -> Trace:
+    """Begin a trace in the current context.  Pair with ``finish_trace``.
+
+    An incoming W3C ``traceparent`` makes this trace a child of the caller's span.
+    """
+    trace_id = parent_id = None
+    if traceparent:
+        m = _TRACEPARENT.match(traceparent.strip().lower())
+        if m:
+            trace_id, parent_id = m.groups()
+    t = Trace(name, request_id, trace_id, parent_id, kind, attributes)
+    t._tokens = (_current_trace.set(t), _current_span.set(t.root))
+    return t
+
+
+def finish_trace(t: Trace, status: int = None, error: str = None) -> None:
+    t.root.end_ns = time.time_ns()
+    if status is not None:
+        t.root.attributes["http.status_code"] = status
+    if error or (status is not None and status >= 500):
+        t.root.error = error or f"HTTP {status}"
+    tokens, t._tokens = t._tokens, None
+    if tokens:
+        try:
+            _current_trace.reset(tokens[0])
+            _current_span.reset(tokens[1])
+        except ValueError:
+            # Finished from a different context (e.g. a worker thread copy)
+            _current_trace.set(None)
+            _current_span.set(None)
+    _export(t)
+
+
+@contextmanager
+def trace(name: str, request_id: str = None, kind: str = "internal", **attributes):
+    """Run a block as its own trace (desktop operations, background jobs)."""
+    t = start_trace(name, request_id=request_id, kind=kind, **attributes)
+    error = None
+    try:
+        yield t
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        finish_trace(t, error=error)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time a stage of the current trace; a no-op when no trace is active."""
+    t = _current_trace.get()
+    if t is None:
+        yield None
+        return
+    parent = _current_span.get()
+    s = Span(name, parent.span_id if parent else t.root.span_id, "internal", attributes)
+    token = _current_span.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        s.end_ns = time.time_ns()
+        _current_span.reset(token)
+        t.add(s)
+
+
+def record_span(name: str, start_ns: int, end_ns: int = None, **attributes) -> None:
+    """Add an already-timed stage to the current trace."""
+    t = _current_trace.get()
+    if t is None:
+        return
+    parent = _current_span.get()
+    s = Span(name, parent.span_id if parent else t.root.span_id, "internal", attributes)
+    s.start_ns = start_ns
+    s.end_ns = end_ns if end_ns is not None else time.time_ns()
+    t.add(s)
+
+
+def traced(name: str):
+    """Decorator: run the function inside ``span(name)``."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current_trace.get() is None:
+                return fn(*args, **kwargs)
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ── Propagation ───────────────────────────────────────────────────────────────
+
+def sql_comment() -> str:
+    """``/* rid=... trace=... span=... */ `` for the current span, or ""."""
+    if not SQL_COMMENTS:
+        return ""
+    t = _current_trace.get()
+    if t is None:
+        return ""
+    s = _current_span.get() or t.root
+    # No ':' — SQLAlchemy text() would read ":name" as a bind parameter
+    return f"/* rid={t.request_id} trace={t.trace_id} span={s.span_id} */ "
+
+
+def outgoing_headers() -> Dict[str, str]:
+    """Headers for an HTTP call to the API server.
+
+    Inside a trace every call gets ``<rid>.<n>`` plus a ``traceparent`` for
+    the current span; outside one each call gets a fresh request ID.
+    """
+    t = _current_trace.get()
+    if t is None:
+        return {"X-Request-ID": uuid.uuid4().hex[:16]}
+    s = _current_span.get() or t.root
+    return {
+        "X-Request-ID": t.next_request_id(),
+        "traceparent":  f"00-{t.trace_id}-{s.span_id}-01",
+    }
+
+
+@contextmanager
+def client_call(endpoint: str):
+    """Span and headers for one HTTP call to the API server.
+
+    Yields the headers to send.  Slow calls are logged with their request
+    ID so a user's complaint can be matched to the server's access log.
+    """
+    with span(f"http {endpoint}") as s:
+        headers = outgoing_headers()
+        if s is not None:
+            s.kind = "client"
+            s.attributes["ors.request_id"] = headers["X-Request-ID"]
+        start = time.perf_counter()
+        try:
+            yield headers
+        finally:
+            ms = (time.perf_counter() - start) * 1000
+            if ms >= CLIENT_SLOW_MS:
+                logger.warning("Slow API call %s: %.0f ms (rid=%s)", endpoint, ms, headers["X-Request-ID"])
+
+
+# ── OTLP/JSON file export ─────────────────────────────────────────────────────
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_span(t: Trace, s: Span) -> dict:
+    attrs = dict(s.attributes)
+    if s is t.root:
+        attrs["ors.request_id"] = t.request_id
+    out = {
+        "traceId":           t.trace_id,
+        "spanId":            s.span_id,
+        "name":              s.name,
+        "kind":              _SPAN_KINDS.get(s.kind, 1),
+        "startTimeUnixNano": str(s.start_ns),
+        "endTimeUnixNano":   str(s.end_ns if s.end_ns is not None else t.root.end_ns),
+        "attributes":        [{"key": k, "value": _otlp_value(v)} for k, v in attrs.items()],
+        "status":            {"code": 2, "message": s.error} if s.error else {"code": 1},
+    }
+    if s.parent_id:
+        out["parentSpanId"] = s.parent_id
+    return out
+
+
+class OTLPFileExporter:
+    """Appends finished traces to a file from a background thread."""
+
+    def __init__(self, path: str, service_name: str = SERVICE_NAME, max_queue: int = 10000):
+        self.path = path
+        self.service_name = service_name
+        self._queue: "queue.Queue[Trace]" = queue.Queue(maxsize=max_queue)
+        self.exported = 0
+        self.dropped = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        threading.Thread(target=self._run, daemon=True, name="TraceExport").start()
+
+    def submit(self, t: Trace) -> None:
+        try:
+            self._queue.put_nowait(t)
+        except queue.Full:
+            self.dropped += 1
+
+    def _encode(self, t: Trace) -> str:
+        return json.dumps({
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    {"key": "service.name", "value": {"stringValue": self.service_name}},
+                    {"key": "process.pid", "value": {"intValue": str(os.getpid())}},
+                ]},
+                "scopeSpans": [{
+                    "scope": {"name": "ors.tracing"},
+                    "spans": [_otlp_span(t, s) for s in list(t.spans)],
+                }],
+            }],
+        }, separators=(",", ":"))
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < 500:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write("".join(self._encode(t) + "\n" for t in batch))
+                self.exported += len(batch)
+            except Exception as e:
+                self.dropped += len(batch)
+                logger.warning("Trace export to %s failed: %s", self.path, e)
+
+
+_exporter: Optional[OTLPFileExporter] = None
+_exporter_lock = threading.Lock()
+
+
+def configure_export(path: str = None, service_name: str = None) -> Optional[OTLPFileExporter]:
+    """Start exporting to ``path`` (default ORS_TRACE_FILE).  Idempotent."""
+    global _exporter
+    path = path or TRACE_FILE
+    if not path:
+        return None
+    with _exporter_lock:
+        if _exporter is None:
+            _exporter = OTLPFileExporter(path, service_name or SERVICE_NAME)
+    return _exporter
+
+
+def _export(t: Trace) -> None:
+    exporter = _exporter
+    if exporter is None:
+        return
+    if t.root.error or t.root.duration_ms >= TRACE_SLOW_MS or random.random() < TRACE_SAMPLE:
+        exporter.submit(t)
+
+
+def export_stats() -> dict:
+    exporter = _exporter
+    return {
+        "file":     exporter.path if exporter else None,
+        "exported": exporter.exported if exporter else 0,
+        "dropped":  exporter.dropped if exporter else 0,
+        "sample":   TRACE_SAMPLE,
+        "slow_ms":  TRACE_SLOW_MS,
+    }
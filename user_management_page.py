@@ -16,6 +16,7 @@ from admin_manage import (create_corporation, create_branch, create_client,
                          get_all_supervisors, create_supervisor, delete_supervisor,
                          update_supervisor)
 from security import hash_password
+from schema_catalog import schema_catalog
 
 
 class UserManagementPage(QWidget):
@@ -1487,15 +1488,12 @@ class UserManagementPage(QWidget):
 
         try:
             # Ensure os_group column exists (added in new schema version)
-            col_check = self.db.execute_query(
-                "SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS "
-                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'users' "
-                "AND COLUMN_NAME = 'os_group'"
-            )
-            if not col_check:
+            cols = schema_catalog.columns('users', db=self.db)
+            if cols and 'os_group' not in cols:
                 self.db.execute_query(
                     "ALTER TABLE users ADD COLUMN os_group VARCHAR(128) DEFAULT NULL"
                 )
+                schema_catalog.invalidate()
 
             # Check for duplicate username
             existing = self.db.execute_query(